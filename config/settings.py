@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -17,16 +18,21 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "rest_framework",
+    "drf_spectacular",
+    "conts",
     "tests1",
     "tests2",
 ]
 
 MIDDLEWARE = [
+    "conts.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "conts.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -58,6 +64,9 @@ DATABASES = {
         "HOST": os.getenv("POSTGRES_HOST"),
         "PORT": os.getenv("POSTGRES_PORT"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD"),
+        # Постоянные соединения: без них каждый запрос к API тратит время на подключение к базе
+        "CONN_MAX_AGE": int(os.getenv("CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -89,14 +98,29 @@ STATIC_ROOT = BASE_DIR / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "static", "media")
 
+# Закрытые файлы приложения (выгрузки CSV): вне STATIC_ROOT, nginx их не отдаёт, скачать можно только через админку
+PRIVATE_ROOT = Path(os.getenv("PRIVATE_ROOT", BASE_DIR / "private"))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Метрики Prometheus: эндпоинт /metrics/ доступен по токену (заголовок Authorization: Bearer <токен>)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# и без токена - напрямую с этих адресов, а через nginx - если и nginx, и клиент (X-Real-IP) из списка
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+# Каталог, через который процессы gunicorn обмениваются метриками
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "pusto_studio_metrics"))
+
+# Профилировать каждый запрос, без заголовка X-Profile. Профили сохраняются в PRIVATE_ROOT/profiles
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS") == "True"
+
+# Общий секрет игровых серверов для API логина игроков (заголовок Authorization: Bearer <токен>)
+GAME_SERVER_TOKEN = os.getenv("GAME_SERVER_TOKEN", "")
+
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.AllowAny",
     ],
-    "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
     "TIME_FORMAT": "%H:%M:%S",
     "TIME_INPUT_FORMATS": ["%H:%M:%S", "%H:%M"],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
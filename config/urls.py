@@ -1,9 +1,13 @@
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
 
 from config import settings
+from conts.views import metrics_view
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/tests1/", include("tests1.urls")),
+    path("api/tests2/", include("tests2.urls")),
+    path("metrics/", metrics_view, name="metrics"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,247 @@
+import json
+
+from django.apps import apps
+from django.contrib import messages
+from django.contrib.admin import ModelAdmin, helpers, register
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth import get_permission_codename
+from django.core.exceptions import FieldDoesNotExist, PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from conts.choices import BulkDeleteJobStatusChoices
+from conts.deletion import bulk_delete, count_cascade, queue_delete_job
+from conts.models import BulkDeleteJob
+
+# Ниже этого числа строк по оценке планировщика считается точный COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 10000
+# Удаление большего числа строк вместе со связанными выполняется в фоне командой run_delete_jobs, а не в запросе
+BULK_DELETE_REQUEST_LIMIT = 10000
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк планировщиком PostgreSQL, без чтения таблицы. На других базах - None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]["Plan Rows"]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который для больших выборок берёт количество строк из оценки планировщика вместо COUNT(*).
+    Оценка приблизительная: если она больше реального числа строк, последние страницы списка пусты,
+    если меньше - последние строки не попадают ни на одну страницу. Когда по оценке строк меньше
+    ESTIMATED_COUNT_THRESHOLD, считается точный COUNT(*): на маленьких выборках он дёшев, а ошибка оценки заметна.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class LargeTableChangeList(ChangeList):
+    def apply_select_related(self, qs):
+        return self.model_admin.get_list_queryset(qs)
+
+    def get_results(self, request):
+        super().get_results(request)
+        if self.model_admin.list_prefetch_related:
+            self.result_list = list(self.result_list)
+            prefetch_related_objects(self.result_list, *self.model_admin.list_prefetch_related)
+
+
+class LargeTableAdminMixin:
+    """
+    Список объектов больших таблиц за постоянное число запросов на страницу:
+    - количество строк оценивается планировщиком, общий COUNT(*) без фильтров не считается;
+    - внешние ключи из list_display загружаются через select_related, свои поля - только из list_display;
+    - list_prefetch_related предзагружается для строк страницы.
+    Поля, которые нужны методам list_display, но не выводятся колонками, указываются в list_only_extra.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_prefetch_related = ()
+    list_only_extra = ()
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_list_queryset(self, queryset):
+        fields = []
+        for name in self.list_display:
+            try:
+                fields.append(self.model._meta.get_field(name))
+            except FieldDoesNotExist:
+                continue
+        if isinstance(self.list_select_related, list | tuple):
+            select_related = self.list_select_related
+        else:
+            select_related = [field.name for field in fields if field.many_to_one or field.one_to_one]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        # __str__ может использовать любые поля модели
+        if "__str__" not in self.list_display:
+            only = {self.model._meta.pk.name, *self.list_only_extra, *self.list_editable}
+            only.update(field.name for field in fields if field.concrete)
+            only.update(path.split("__")[0] for path in select_related)
+            queryset = queryset.only(*only)
+        return queryset
+
+
+def format_deleted(deleted):
+    return ", ".join(
+        f"{apps.get_model(label)._meta.verbose_name_plural} - {count}" for label, count in deleted.items() if count
+    )
+
+
+def get_delete_perms_lacking(request, labels):
+    """
+    Модели из labels, на удаление которых у пользователя нет прав. Промежуточные таблицы ManyToMany не проверяются.
+    """
+    lacking = []
+    for label in labels:
+        opts = apps.get_model(label)._meta
+        if not opts.auto_created and not request.user.has_perm(
+            f"{opts.app_label}.{get_permission_codename('delete', opts)}"
+        ):
+            lacking.append(str(opts.verbose_name_plural))
+    return lacking
+
+
+def bulk_delete_selected(modeladmin, request, queryset):
+    """
+    Удаление выбранных записей со всеми связанными пачками по id, без загрузки объектов в память.
+    Сначала показывается страница подтверждения с количеством удаляемых строк по моделям.
+    Удаление запрещено, если у пользователя нет прав на удаление любой из затронутых моделей.
+    Больше BULK_DELETE_REQUEST_LIMIT строк удаляется в фоне командой run_delete_jobs.
+    """
+    # Модели без удаляемых строк не показываются и не проверяются на права
+    counts = +count_cascade(queryset)
+    rows_total = sum(counts.values())
+    perms_lacking = get_delete_perms_lacking(request, counts)
+    queued = rows_total > BULK_DELETE_REQUEST_LIMIT
+
+    if request.POST.get("post"):
+        if perms_lacking:
+            raise PermissionDenied
+        if queued:
+            job = queue_delete_job(queryset, rows_total=rows_total, user=request.user)
+            url = reverse("admin:conts_bulkdeletejob_change", args=(job.pk,))
+            modeladmin.message_user(
+                request,
+                format_html(
+                    'Строк к удалению: {}. Удаление поставлено в очередь: <a href="{}">{}</a>.', rows_total, url, job
+                ),
+                level=messages.INFO,
+            )
+            return None
+        summary = format_deleted(bulk_delete(queryset))
+        if summary:
+            modeladmin.message_user(request, f"Удалено: {summary}.", level=messages.SUCCESS)
+        else:
+            modeladmin.message_user(request, "Ничего не удалено.", level=messages.WARNING)
+        return None
+
+    opts = modeladmin.model._meta
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        "title": f"Нельзя удалить {opts.verbose_name_plural}" if perms_lacking else "Быстрое удаление",
+        "subtitle": None,
+        "opts": opts,
+        "model_count": [(apps.get_model(label)._meta.verbose_name_plural, count) for label, count in counts.items()],
+        "rows_total": rows_total,
+        "perms_lacking": perms_lacking,
+        "queued": queued,
+        "request_limit": BULK_DELETE_REQUEST_LIMIT,
+        "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+        "select_across": request.POST.get("select_across", "0"),
+        "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+        "media": modeladmin.media,
+    }
+    request.current_app = modeladmin.admin_site.name
+    return TemplateResponse(request, "admin/bulk_delete_selected_confirmation.html", context)
+
+
+bulk_delete_selected.short_description = "Быстро удалить выбранные записи со связанными"
+bulk_delete_selected.allowed_permissions = ("delete",)
+
+
+@register(BulkDeleteJob)
+class BulkDeleteJobAdmin(LargeTableAdminMixin, ModelAdmin):
+    list_display = (
+        "__str__",
+        "model",
+        "status",
+        "get_progress",
+        "user",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    readonly_fields = (
+        "model",
+        "status",
+        "get_progress",
+        "get_deleted",
+        "pk_ranges",
+        "user",
+        "error",
+        "created_at",
+        "updated_at",
+        "finished_at",
+    )
+    fields = readonly_fields
+    actions = ["restart"]
+
+    def restart(self, request, queryset):
+        """
+        Вернуть упавшие удаления в очередь, они продолжатся с оставшихся строк.
+        """
+        count = queryset.filter(status=BulkDeleteJobStatusChoices.FAILED).update(
+            status=BulkDeleteJobStatusChoices.PENDING, error="", finished_at=None
+        )
+        self.message_user(request, f"Возвращено в очередь удалений: {count}.", level=messages.SUCCESS)
+
+    restart.short_description = "Перезапустить упавшие удаления"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_progress(self, obj):
+        """
+        Удалено строк из общего количества.
+        """
+        deleted = sum(obj.deleted.values())
+        percent = deleted * 100 / obj.rows_total if obj.rows_total else 100
+        return f"{deleted} из {obj.rows_total} ({percent:.0f}%)"
+
+    get_progress.short_description = "Прогресс"
+
+    def get_deleted(self, obj):
+        """
+        Удалено строк по моделям.
+        """
+        return format_deleted(obj.deleted) or "-"
+
+    get_deleted.short_description = "Удалено"
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class ContsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "conts"
+    verbose_name = "Общее"
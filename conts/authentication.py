@@ -0,0 +1,57 @@
+import hmac
+
+from django.conf import settings
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class GameServer:
+    """
+    Пользователь запросов игрового сервера: аутентифицирован, но не сотрудник.
+    """
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+    is_staff = False
+    is_superuser = False
+    pk = None
+
+    def __str__(self):
+        return "game-server"
+
+
+class GameServerAuthentication(BaseAuthentication):
+    """
+    Аутентификация игровых серверов по общему секрету: заголовок "Authorization: Bearer <GAME_SERVER_TOKEN>".
+    Токен сравнивается с настройкой без запросов к базе. Без GAME_SERVER_TOKEN все запросы отклоняются.
+    """
+
+    keyword = b"bearer"
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword:
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed("Неверный заголовок Authorization: ожидается Bearer <токен>.")
+        token = settings.GAME_SERVER_TOKEN.encode()
+        if not token or not hmac.compare_digest(header[1], token):
+            raise AuthenticationFailed("Неверный токен игрового сервера.")
+        return GameServer(), None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
+
+
+class GameServerAuthenticationScheme(OpenApiAuthenticationExtension):
+    """
+    Описание аутентификации игровых серверов в схеме OpenAPI.
+    """
+
+    target_class = GameServerAuthentication
+    name = "gameServerToken"
+
+    def get_security_definition(self, auto_schema):
+        return {"type": "http", "scheme": "bearer", "description": "Токен игрового сервера GAME_SERVER_TOKEN"}
@@ -0,0 +1,98 @@
+import statistics
+import time
+import tracemalloc
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Допустимое ухудшение метрики относительно базового замера, доля
+BENCH_REGRESSION_THRESHOLD = 0.1
+
+# Метрики замера: True - чем больше, тем лучше
+BENCH_METRICS = {
+    "ops_per_second": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries_per_op": False,
+    "peak_memory_kb": False,
+}
+
+
+class QueryCounter:
+    """
+    Обёртка execute_wrapper, считающая запросы соединения.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def latency_percentiles(timings):
+    """
+    p50/p95/p99 времени операций (в секундах) в миллисекундах.
+    """
+    percentiles = statistics.quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+    return {f"p{percent}_ms": round(percentiles[percent - 1] * 1000, 3) for percent in (50, 95, 99)}
+
+
+def run_case(operations, warmup, repeats, using=DEFAULT_DB_ALIAS):
+    """
+    Замер операции: warmup прогонов без замера, repeats замеряемых прогонов и ещё один под tracemalloc
+    для пиковой памяти, чтобы трассировка не искажала время.
+    operations - итератор вызываемых без аргументов операций, нужно warmup + repeats + 1 штук.
+    Запросы считаются по соединению using; COPY через сырое соединение psycopg не учитывается.
+    """
+    operations = iter(operations)
+    for _ in range(warmup):
+        next(operations)()
+
+    counter = QueryCounter()
+    timings = []
+    with connections[using].execute_wrapper(counter):
+        for _ in range(repeats):
+            operation = next(operations)
+            started = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - started)
+
+    operation = next(operations)
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops": repeats,
+        "ops_per_second": round(repeats / sum(timings), 2),
+        **latency_percentiles(timings),
+        "queries_per_op": round(counter.count / repeats, 2),
+        "peak_memory_kb": round(peak / 1024),
+    }
+
+
+def compare_results(baseline, current, threshold=BENCH_REGRESSION_THRESHOLD):
+    """
+    Сравнение замеров вида {масштаб: {операция: метрики}} с базовыми.
+    Время, скорость и память сравниваются с допуском threshold, количество запросов - точно.
+    Возвращает строки (масштаб, операция, метрика, было, стало, изменение, регрессия)
+    по операциям, которые есть в обоих замерах.
+    """
+    rows = []
+    for scale, cases in current.items():
+        for name, metrics in cases.items():
+            base = baseline.get(scale, {}).get(name)
+            if base is None:
+                continue
+            for metric, higher_is_better in BENCH_METRICS.items():
+                before, after = base[metric], metrics[metric]
+                change = (after - before) / before if before else 0.0
+                worse = -change if higher_is_better else change
+                regression = after > before if metric == "queries_per_op" else worse > threshold
+                rows.append((scale, name, metric, before, after, change, regression))
+    return rows
@@ -5,3 +5,17 @@ class BoostTypeChoices(TextChoices):
     X2_GOLD = "x2_gold", "x2 золота"
     X2_EXP = "x2_exp", "x2 опыта"
     GOD_MODE = "god_mode", "Бессмертие"
+
+
+class ExportJobStatusChoices(TextChoices):
+    PENDING = "pending", "В очереди"
+    RUNNING = "running", "Выполняется"
+    DONE = "done", "Готово"
+    FAILED = "failed", "Ошибка"
+
+
+class BulkDeleteJobStatusChoices(TextChoices):
+    PENDING = "pending", "В очереди"
+    RUNNING = "running", "Выполняется"
+    DONE = "done", "Готово"
+    FAILED = "failed", "Ошибка"
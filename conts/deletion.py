@@ -0,0 +1,210 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.models import CASCADE, DO_NOTHING, SET_NULL, Q
+from django.utils import timezone
+
+from conts.choices import BulkDeleteJobStatusChoices
+from conts.models import BulkDeleteJob
+
+DELETE_BATCH_SIZE = 5000
+# Задача в статусе "Выполняется" без прогресса дольше этого времени считается брошенной упавшим обработчиком
+DELETE_JOB_STALE_AFTER = timedelta(minutes=5)
+
+
+def _cascade(model, where):
+    """
+    Строки, которые затронет удаление строк model, отобранных условием where: тройки (модель, условие, столбец),
+    столбец - для обнуления при on_delete=SET_NULL, None - строки удаляются.
+    Сначала самые глубокие зависимости, последней - сама модель.
+    """
+    table = model._meta.db_table
+    targets = []
+    for relation in model._meta.related_objects:
+        field = relation.field
+        if relation.many_to_many:
+            through = field.remote_field.through
+            targets.append(
+                (
+                    through,
+                    f"{field.m2m_reverse_name()} IN (SELECT {model._meta.pk.column} FROM {table} WHERE {where})",
+                    None,
+                )
+            )
+            continue
+        child = relation.related_model
+        condition = f"{field.column} IN (SELECT {field.target_field.column} FROM {table} WHERE {where})"
+        if relation.on_delete is CASCADE:
+            targets += _cascade(child, condition)
+        elif relation.on_delete is SET_NULL:
+            targets.append((child, condition, field.column))
+        elif relation.on_delete is not DO_NOTHING:
+            raise ValueError(
+                f"{child._meta.label}.{field.name}: on_delete={relation.on_delete.__name__} "
+                "не поддерживается массовым удалением."
+            )
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        targets.append(
+            (
+                through,
+                f"{field.m2m_column_name()} IN (SELECT {model._meta.pk.column} FROM {table} WHERE {where})",
+                None,
+            )
+        )
+    targets.append((model, where, None))
+    return targets
+
+
+def _cascade_statements(model, where):
+    """
+    SQL удаления строк model, отобранных условием where, вместе со всеми зависимыми строками.
+    Возвращает пары (модель, SQL); во всех запросах один параметр - список id.
+    """
+    statements = []
+    for target, condition, null_column in _cascade(model, where):
+        table = target._meta.db_table
+        if null_column is None:
+            statements.append((target, f"DELETE FROM {table} WHERE {condition}"))
+        else:
+            statements.append((target, f"UPDATE {table} SET {null_column} = NULL WHERE {condition}"))
+    return statements
+
+
+def count_cascade(queryset):
+    """
+    Сколько строк удалит bulk_delete выборки, по моделям, одним запросом. Сначала сама модель, затем зависимые.
+    Строка, до которой каскад доходит несколькими путями, считается один раз.
+    """
+    model = queryset.model
+    try:
+        subquery, params = queryset.order_by().values("pk").query.sql_with_params()
+    except EmptyResultSet:
+        return Counter()
+    conditions = {}
+    for target, condition, null_column in reversed(_cascade(model, f"{model._meta.pk.column} IN ({subquery})")):
+        if null_column is None:
+            conditions.setdefault(target, []).append(condition)
+    counts = [
+        f"(SELECT COUNT(*) FROM {target._meta.db_table} WHERE {' OR '.join(f'({c})' for c in target_conditions)})"
+        for target, target_conditions in conditions.items()
+    ]
+    # Каждое условие содержит подзапрос выборки ровно один раз
+    count_params = [param for target_conditions in conditions.values() for _ in target_conditions for param in params]
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(counts)}", count_params)
+        row = cursor.fetchone()
+    return Counter(dict(zip((target._meta.label for target in conditions), row, strict=True)))
+
+
+def pk_ranges(queryset):
+    """
+    Выборка в виде непрерывных диапазонов id [от, до] включительно: так выборка хранится в фоновом удалении.
+    """
+    try:
+        subquery, params = queryset.order_by().values("pk").query.sql_with_params()
+    except EmptyResultSet:
+        return []
+    sql = f"""
+        SELECT MIN(pk), MAX(pk)
+        FROM (SELECT pk, pk - ROW_NUMBER() OVER (ORDER BY pk) AS range_id FROM ({subquery}) AS selected (pk)) AS ranges
+        GROUP BY range_id
+        ORDER BY 1
+    """
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [list(row) for row in cursor.fetchall()]
+
+
+def iter_bulk_delete(queryset, batch_size=DELETE_BATCH_SIZE):
+    """
+    Удаление выборки пачками по batch_size id с каскадом на уровне SQL, без загрузки объектов в память.
+    Каждая пачка удаляется в своей транзакции. Сигналы pre_delete/post_delete не отправляются.
+    После каждой пачки отдаёт Counter удалённых строк по моделям.
+    """
+    model = queryset.model
+    statements = _cascade_statements(model, f"{model._meta.pk.column} = ANY(%s)")
+    connection = connections[queryset.db]
+    pks = queryset.order_by("pk").values_list("pk", flat=True)
+    last_pk = None
+    while True:
+        batch = pks if last_pk is None else pks.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+        deleted = Counter()
+        with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+            for statement_model, sql in statements:
+                cursor.execute(sql, [batch])
+                if sql.startswith("DELETE"):
+                    deleted[statement_model._meta.label] += cursor.rowcount
+        last_pk = batch[-1]
+        yield deleted
+
+
+def bulk_delete(queryset, batch_size=DELETE_BATCH_SIZE):
+    """
+    Удалить выборку со всеми зависимыми строками. Возвращает Counter удалённых строк по моделям.
+    """
+    deleted = Counter()
+    for batch in iter_bulk_delete(queryset, batch_size):
+        deleted.update(batch)
+    return deleted
+
+
+def queue_delete_job(queryset, rows_total=0, user=None):
+    """
+    Поставить удаление выборки в очередь команды run_delete_jobs.
+    Выборка сохраняется диапазонами id, rows_total - сколько строк удалится вместе со связанными.
+    """
+    return BulkDeleteJob.objects.create(
+        model=queryset.model._meta.label,
+        pk_ranges=pk_ranges(queryset),
+        rows_total=rows_total,
+        user=user,
+    )
+
+
+def claim_delete_job(pk=None):
+    """
+    Взять в работу первую задачу из очереди или задачу, брошенную упавшим обработчиком, с pk - только эту задачу.
+    """
+    stale = timezone.now() - DELETE_JOB_STALE_AFTER
+    jobs = BulkDeleteJob.objects.all() if pk is None else BulkDeleteJob.objects.filter(pk=pk)
+    with transaction.atomic():
+        job = (
+            jobs.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=BulkDeleteJobStatusChoices.PENDING)
+                | Q(status=BulkDeleteJobStatusChoices.RUNNING, updated_at__lt=stale)
+            )
+            .order_by("pk")
+            .first()
+        )
+        if job is not None:
+            job.status = BulkDeleteJobStatusChoices.RUNNING
+            job.save(update_fields=["status", "updated_at"])
+    return job
+
+
+def run_delete_job(job, batch_size=DELETE_BATCH_SIZE):
+    """
+    Удалить выборку задачи пачками по id. Каждая пачка удаляется в своей транзакции и сохраняется в прогрессе,
+    поэтому после падения удаление продолжается с оставшихся строк.
+    """
+    try:
+        model = apps.get_model(job.model)
+        for pk_from, pk_to in job.pk_ranges:
+            for deleted in iter_bulk_delete(model.objects.filter(pk__gte=pk_from, pk__lte=pk_to), batch_size):
+                job.deleted = dict(Counter(job.deleted) + deleted)
+                job.save(update_fields=["deleted", "updated_at"])
+        job.status = BulkDeleteJobStatusChoices.DONE
+    except Exception as error:  # noqa: BLE001 - ошибка сохраняется в задаче, обработчик продолжает работу
+        job.status = BulkDeleteJobStatusChoices.FAILED
+        job.error = str(error)
+    job.finished_at = timezone.now()
+    job.save()
+    return job
@@ -0,0 +1,153 @@
+import atexit
+import csv
+import io
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Загрузить строки в таблицу через COPY FROM STDIN. Пустая строка загружается как NULL.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH CSV", buffer)
+
+
+@contextmanager
+def deferred_constraints(models, using, unique=False):
+    """
+    Снять неуникальные индексы и внешние ключи таблиц на время загрузки и вернуть их после неё:
+    построение индекса и проверка ключа одним запросом по готовой таблице быстрее, чем на каждой строке.
+    Уникальные индексы остаются, на них опираются ON CONFLICT и проверка дублей.
+    С unique=True снимаются и уникальные ограничения, на которые не ссылаются внешние ключи, - для загрузки
+    строк, уже очищенных от дублей: дубли всё равно не пройдут при возвращении ограничения.
+    Первичный ключ остаётся всегда.
+    """
+    tables = [model._meta.db_table for model in models]
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index "
+            "WHERE indrelid = ANY(%s::regclass[]) AND NOT indisunique",
+            [tables],
+        )
+        indexes = cursor.fetchall()
+        # Уникальные ограничения снимаются раньше внешних ключей и возвращаются тоже раньше
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint AS constraint_
+            WHERE conrelid = ANY(%s::regclass[]) AND (
+                contype = 'f' OR %s AND contype = 'u' AND NOT EXISTS (
+                    SELECT 1 FROM pg_constraint AS referencing
+                    WHERE referencing.contype = 'f' AND referencing.conindid = constraint_.conindid
+                )
+            )
+            ORDER BY contype DESC
+            """,
+            [tables, unique],
+        )
+        constraints = cursor.fetchall()
+        for table, name, _ in constraints:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+    try:
+        yield
+    finally:
+        with connections[using].cursor() as cursor:
+            for _, definition in indexes:
+                cursor.execute(definition)
+            for table, name, definition in constraints:
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+
+
+class BatchWriter:
+    """
+    Буфер строк таблицы, записываемых пачками через COPY.
+    Строки попадают в буфер процесса после коммита транзакции, в которой добавлены, и записываются,
+    когда их набирается batch_size или с прошлой записи прошло interval секунд, а также при выходе из процесса.
+    Интервал проверяется при добавлении строк и фоновым потоком, поэтому буфер простаивающего процесса
+    тоже записывается не позже чем через interval секунд.
+    prepare(rows, using) вызывается перед записью пачки, например, чтобы создать партиции.
+    Ошибка записи не ломает вызывающий код: пачка теряется с записью в лог.
+    """
+
+    def __init__(self, table, columns, batch_size, interval, prepare=None):
+        self.table = table
+        self.columns = columns
+        self.batch_size = batch_size
+        self.interval = interval
+        self.prepare = prepare
+        self.lock = threading.Lock()
+        # База -> строки, ещё не записанные в неё
+        self.buffers = {}
+        self.written_at = time.monotonic()
+        self.flusher = None
+        atexit.register(self.flush)
+
+    def add(self, rows, using=DEFAULT_DB_ALIAS):
+        rows = list(rows)
+        if rows:
+            transaction.on_commit(partial(self.append, rows, using), using=using)
+
+    def append(self, rows, using):
+        with self.lock:
+            self.start_flusher()
+            buffer = self.buffers.setdefault(using, [])
+            buffer += rows
+            if len(buffer) < self.batch_size and time.monotonic() - self.written_at < self.interval:
+                return
+            self.buffers[using] = []
+            self.written_at = time.monotonic()
+        self.write(buffer, using)
+
+    def start_flusher(self):
+        """
+        Запустить фоновый поток записи. Потоки не переживают fork (gunicorn --preload),
+        поэтому поток запускается в каждом процессе при первом добавлении строк.
+        """
+        if self.flusher is None or not self.flusher.is_alive():
+            self.flusher = threading.Thread(target=self.flush_periodically, name=f"{self.table}-writer", daemon=True)
+            self.flusher.start()
+
+    def flush_periodically(self):
+        """
+        Раз в interval секунд записывать строки, если с прошлой записи прошло не меньше interval секунд.
+        """
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                due = any(self.buffers.values()) and time.monotonic() - self.written_at >= self.interval
+            if due:
+                self.flush()
+                # Подключения потока к базе между записями не держатся
+                connections.close_all()
+
+    def flush(self):
+        """
+        Записать все накопленные строки.
+        """
+        with self.lock:
+            buffers, self.buffers = self.buffers, {}
+            self.written_at = time.monotonic()
+        for using, rows in buffers.items():
+            self.write(rows, using)
+
+    def write(self, rows, using):
+        if not rows:
+            return
+        try:
+            if self.prepare is not None:
+                self.prepare(rows, using)
+            with connections[using].cursor() as cursor:
+                copy_rows(cursor, self.table, self.columns, rows)
+        except DatabaseError:
+            logger.exception("Не удалось записать %s строк в %s", len(rows), self.table)
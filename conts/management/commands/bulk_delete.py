@@ -0,0 +1,45 @@
+import time
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError
+
+from conts.admin import format_deleted
+from conts.deletion import DELETE_BATCH_SIZE, iter_bulk_delete
+
+
+class Command(BaseCommand):
+    help = (
+        "Массовое удаление записей со всеми связанными пачками по id, без загрузки объектов в память. "
+        "Пример: bulk_delete tests2.Player --pk-from 1000 --pk-to 2000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("model", help="Модель в виде app_label.Model")
+        parser.add_argument("--pk-from", type=int, help="Удалять записи с id от")
+        parser.add_argument("--pk-to", type=int, help="Удалять записи с id до, включительно")
+        parser.add_argument("--batch-size", type=int, default=DELETE_BATCH_SIZE, help="Записей в одной пачке")
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["model"])
+        except (LookupError, ValueError) as error:
+            raise CommandError(f"Модель {options['model']} не найдена.") from error
+        queryset = model.objects.all()
+        if options["pk_from"] is not None:
+            queryset = queryset.filter(pk__gte=options["pk_from"])
+        if options["pk_to"] is not None:
+            queryset = queryset.filter(pk__lte=options["pk_to"])
+
+        started = time.monotonic()
+        total = 0
+        try:
+            for deleted in iter_bulk_delete(queryset, options["batch_size"]):
+                total += deleted[model._meta.label]
+                self.stdout.write(f"Удалено {model._meta.verbose_name_plural}: {total}. {format_deleted(deleted)}")
+        except ValueError as error:
+            raise CommandError(str(error)) from error
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Удалено {model._meta.verbose_name_plural}: {total} за {time.monotonic() - started:.2f} с."
+            )
+        )
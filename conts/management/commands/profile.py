@@ -0,0 +1,28 @@
+import argparse
+
+from django.core.management import BaseCommand, call_command
+
+from conts.profiling import PROFILE_INTERVAL, Profiler
+
+
+class Command(BaseCommand):
+    help = (
+        "Запуск другой команды под сэмплирующим профайлером. Стеки в формате collapsed stacks "
+        "и SQL-запросы по убыванию времени сохраняются в PRIVATE_ROOT/profiles. "
+        "Профилируется только основной процесс команды. Пример: manage.py profile create_data_2 --rows 100000"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=PROFILE_INTERVAL, help="Интервал снимков стека, секунды")
+        parser.add_argument("command_name", help="Профилируемая команда")
+        parser.add_argument("command_args", nargs=argparse.REMAINDER, help="Аргументы профилируемой команды")
+
+    def handle(self, *args, **options):
+        label = " ".join([options["command_name"], *options["command_args"]])
+        with Profiler(label, interval=options["interval"]) as profiler:
+            call_command(options["command_name"], *options["command_args"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{label}: {profiler.elapsed:.1f} с. Стеки: {profiler.stacks_path}, SQL: {profiler.sql_path}"
+            )
+        )
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management import BaseCommand
+
+from conts.admin import format_deleted
+from conts.choices import BulkDeleteJobStatusChoices
+from conts.deletion import DELETE_BATCH_SIZE, claim_delete_job, run_delete_job
+
+
+class Command(BaseCommand):
+    help = "Выполнение фоновых массовых удалений из очереди. С --loop работает как постоянный обработчик."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DELETE_BATCH_SIZE, help="Записей в одной пачке")
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, ждать новые удаления")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза при пустой очереди в секундах")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_delete_job()
+            if job is not None:
+                self.run(job, options["batch_size"])
+            elif options["loop"]:
+                time.sleep(options["interval"])
+            else:
+                self.stdout.write("Очередь удалений пуста.")
+                break
+
+    def run(self, job, batch_size):
+        job = run_delete_job(job, batch_size=batch_size)
+        if job.status == BulkDeleteJobStatusChoices.DONE:
+            self.stdout.write(self.style.SUCCESS(f"{job}: удалено {format_deleted(job.deleted) or 'ничего'}."))
+        else:
+            self.stdout.write(self.style.ERROR(f"{job}: {job.error}"))
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ContextDecorator
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+METRICS_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+METRICS_ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+# Как часто процесс сохраняет свои метрики для эндпоинта в других процессах, секунды
+METRICS_FLUSH_INTERVAL = 1
+
+# Гистограммы: описание и границы корзин
+METRICS = {
+    "app_duration_seconds": ("Время выполнения", METRICS_DURATION_BUCKETS),
+    "app_db_duration_seconds": ("Время запросов к базе", METRICS_DURATION_BUCKETS),
+    "app_db_queries": ("Количество запросов к базе", METRICS_QUERY_BUCKETS),
+    "app_rows_streamed": ("Количество строк, отданных потоком", METRICS_ROW_BUCKETS),
+}
+
+_lock = threading.Lock()
+# (метрика, вид, имя) -> количества по корзинам (последняя - больше всех границ) и сумма значений
+_histograms = {}
+_flushed_at = 0.0
+_active = threading.local()
+
+
+def _active_measurements():
+    if not hasattr(_active, "measurements"):
+        _active.measurements = []
+    return _active.measurements
+
+
+def observe(metric, kind, name, value):
+    buckets = METRICS[metric][1]
+    with _lock:
+        series = _histograms.get((metric, kind, name))
+        if series is None:
+            series = _histograms[(metric, kind, name)] = [0] * (len(buckets) + 1) + [0]
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+
+class Measurement(ContextDecorator):
+    """
+    Замер запроса, экшена админки или вызова сервиса: время выполнения, количество и время запросов к базе,
+    строки, отданные потоком через count_rows. Вложенные замеры считают запросы независимо.
+    kind - вид замера (view, action, service), name - его имя в метриках.
+    Работает как контекстный менеджер и как декоратор, запросы считаются только в текущем потоке.
+    """
+
+    def __init__(self, kind, name, using=DEFAULT_DB_ALIAS):
+        self.kind = kind
+        self.name = name
+        self.using = using
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = None
+
+    def _recreate_cm(self):
+        # Декоратор создаёт новый замер на каждый вызов, иначе параллельные вызовы делили бы счётчики
+        return Measurement(self.kind, self.name, self.using)
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def start(self):
+        self.started = time.perf_counter()
+        connections[self.using].execute_wrappers.append(self.execute)
+        _active_measurements().append(self)
+
+    def stop(self):
+        connections[self.using].execute_wrappers.remove(self.execute)
+        _active_measurements().remove(self)
+        observe("app_duration_seconds", self.kind, self.name, time.perf_counter() - self.started)
+        observe("app_db_duration_seconds", self.kind, self.name, self.db_time)
+        observe("app_db_queries", self.kind, self.name, self.queries)
+        if self.rows is not None:
+            observe("app_rows_streamed", self.kind, self.name, self.rows)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def measure(kind, name, using=DEFAULT_DB_ALIAS):
+    return Measurement(kind, name, using)
+
+
+def count_rows(chunks):
+    """
+    Передать пачки строк или байт дальше, добавив количество строк в активные замеры.
+    Замеры берутся на момент начала чтения, для потокового ответа это замер запроса.
+    """
+    measurements = list(_active_measurements())
+    for measurement in measurements:
+        measurement.rows = measurement.rows or 0
+    for chunk in chunks:
+        rows = chunk.count(b"\n" if isinstance(chunk, bytes) else "\n")
+        for measurement in measurements:
+            measurement.rows += rows
+        yield chunk
+
+
+def _snapshot_path(pid):
+    return Path(settings.METRICS_DIR) / f"{pid}.json"
+
+
+def flush_metrics(force=False):
+    """
+    Сохранить метрики процесса в METRICS_DIR не чаще раза в METRICS_FLUSH_INTERVAL,
+    чтобы эндпоинт любого процесса gunicorn отдавал метрики всех процессов.
+    """
+    global _flushed_at
+    now = time.monotonic()
+    if not force and now - _flushed_at < METRICS_FLUSH_INTERVAL:
+        return
+    _flushed_at = now
+    with _lock:
+        snapshot = {"\t".join(key): list(series) for key, series in _histograms.items()}
+    path = _snapshot_path(os.getpid())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(json.dumps(snapshot))
+    temporary.replace(path)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect():
+    """
+    Метрики текущего процесса и сохранённые метрики других живых процессов.
+    Файлы завершившихся процессов удаляются, их счётчики сбрасываются.
+    """
+    with _lock:
+        merged = {key: list(series) for key, series in _histograms.items()}
+    directory = Path(settings.METRICS_DIR)
+    for path in directory.glob("*.json") if directory.is_dir() else ():
+        pid = int(path.stem)
+        if pid == os.getpid():
+            continue
+        if not _process_alive(pid):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for key, series in snapshot.items():
+            key = tuple(key.split("\t"))
+            if key not in merged:
+                merged[key] = series
+            else:
+                merged[key] = [total + value for total, value in zip(merged[key], series, strict=True)]
+    return merged
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_metrics():
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    histograms = _collect()
+    lines = []
+    for metric, (description, buckets) in METRICS.items():
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+        for (name, kind, label), series in sorted(histograms.items()):
+            if name != metric:
+                continue
+            labels = f'kind="{_label(kind)}",name="{_label(label)}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), series[:-1], strict=True):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{metric}_count{{{labels}}} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,101 @@
+import threading
+from functools import partial
+
+from django.conf import settings
+from django.core.signals import request_finished
+
+from conts.metrics import Measurement, flush_metrics
+from conts.profiling import PROFILE_HEADER, Profiler
+
+# Действия, которые выполняются при закрытии потокового ответа, по потокам
+_on_close = threading.local()
+
+
+def call_on_close(callback):
+    """
+    Вызвать callback, когда сервер закроет текущий ответ. Сервер закрывает ответ всегда, в том числе
+    при обрыве соединения клиентом и если поток не начинали читать, и делает это в потоке запроса.
+    """
+    if not hasattr(_on_close, "callbacks"):
+        _on_close.callbacks = []
+    _on_close.callbacks.append(callback)
+
+
+def run_on_close(**kwargs):
+    callbacks, _on_close.callbacks = getattr(_on_close, "callbacks", []), []
+    for callback in callbacks:
+        callback()
+
+
+request_finished.connect(run_on_close, dispatch_uid="conts.middleware.run_on_close")
+
+
+class MetricsMiddleware:
+    """
+    Замер каждого запроса: время, запросы к базе и, для потоковых ответов, отданные строки.
+    Запрос с экшеном админки помечается как action с именем модели и экшена, остальные - по имени view.
+    Потоковый ответ замеряется до его закрытия сервером, в том числе при обрыве соединения клиентом.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        measurement = Measurement("view", "unmatched")
+        measurement.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            measurement.stop()
+            raise
+        measurement.kind, measurement.name = self.labels(request)
+        if response.streaming:
+            # Генератор, который не начали читать, при закрытии не выполняет finally,
+            # поэтому замер завершается по сигналу закрытия ответа
+            call_on_close(partial(self.finish, measurement))
+        else:
+            self.finish(measurement)
+        return response
+
+    def labels(self, request):
+        match = request.resolver_match
+        if match is None:
+            return "view", "unmatched"
+        model_admin = getattr(match.func, "model_admin", None)
+        if model_admin and request.method == "POST" and match.url_name.endswith("_changelist"):
+            action = request.POST.get("action")
+            if action:
+                return "action", f"{model_admin.opts.label_lower}.{action}"
+        return "view", match.view_name
+
+    def finish(self, measurement):
+        measurement.stop()
+        flush_metrics()
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование запроса сэмплирующим профайлером: по заголовку X-Profile от сотрудника
+    или каждого запроса при PROFILE_REQUESTS. Имя профиля возвращается в заголовке ответа X-Profile,
+    потоковый ответ профилируется до его закрытия сервером, в том числе при обрыве соединения клиентом.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILE_REQUESTS and not (request.headers.get(PROFILE_HEADER) and request.user.is_staff):
+            return self.get_response(request)
+        profiler = Profiler(f"{request.method} {request.path}")
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            profiler.stop()
+            raise
+        response[PROFILE_HEADER] = profiler.name
+        if response.streaming:
+            call_on_close(profiler.stop)
+        else:
+            profiler.stop()
+        return response
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkDeleteJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Модель в виде app_label.Model', max_length=100, verbose_name='Модель')),
+                ('pk_ranges', models.JSONField(default=list, help_text='Выбранные записи: пары [id от, id до] включительно', verbose_name='Диапазоны id')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('rows_total', models.PositiveBigIntegerField(default=0, help_text='Строк к удалению вместе со связанными на момент постановки в очередь', verbose_name='Всего строк')),
+                ('deleted', models.JSONField(default=dict, help_text='Количество удалённых строк по моделям', verbose_name='Удалено строк')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Массовое удаление',
+                'verbose_name_plural': 'Массовые удаления',
+            },
+        ),
+    ]
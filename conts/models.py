@@ -1 +1,78 @@
+from django.conf import settings
+from django.db.models import (
+    SET_NULL,
+    CharField,
+    DateTimeField,
+    ForeignKey,
+    JSONField,
+    Model,
+    PositiveBigIntegerField,
+    TextField,
+)
+
+from conts.choices import BulkDeleteJobStatusChoices
+
 NULLABLE = {"blank": True, "null": True}
+
+
+class BulkDeleteJob(Model):
+    """
+    Фоновое массовое удаление из админки, выполняется командой run_delete_jobs.
+    Выборка хранится диапазонами id, поэтому после падения удаляются только оставшиеся строки.
+    """
+
+    model = CharField(
+        max_length=100,
+        verbose_name="Модель",
+        help_text="Модель в виде app_label.Model",
+    )
+    pk_ranges = JSONField(
+        verbose_name="Диапазоны id",
+        help_text="Выбранные записи: пары [id от, id до] включительно",
+        default=list,
+    )
+    status = CharField(
+        max_length=20,
+        verbose_name="Статус",
+        choices=BulkDeleteJobStatusChoices.choices,
+        default=BulkDeleteJobStatusChoices.PENDING,
+    )
+    rows_total = PositiveBigIntegerField(
+        verbose_name="Всего строк",
+        help_text="Строк к удалению вместе со связанными на момент постановки в очередь",
+        default=0,
+    )
+    deleted = JSONField(
+        verbose_name="Удалено строк",
+        help_text="Количество удалённых строк по моделям",
+        default=dict,
+    )
+    user = ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=SET_NULL,
+        verbose_name="Пользователь",
+        **NULLABLE,
+    )
+    error = TextField(
+        verbose_name="Ошибка",
+        blank=True,
+    )
+    created_at = DateTimeField(
+        verbose_name="Дата создания",
+        auto_now_add=True,
+    )
+    updated_at = DateTimeField(
+        verbose_name="Дата обновления",
+        auto_now=True,
+    )
+    finished_at = DateTimeField(
+        verbose_name="Дата завершения",
+        **NULLABLE,
+    )
+
+    class Meta:
+        verbose_name = "Массовое удаление"
+        verbose_name_plural = "Массовые удаления"
+
+    def __str__(self):
+        return f"Удаление №{self.pk} - {self.get_status_display()}"
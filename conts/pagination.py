@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Постраничный вывод по курсору: следующая страница выбирается условием id > последнего id,
+    поэтому скорость не зависит от глубины страницы. Один запрос на страницу, без COUNT.
+    """
+
+    ordering = "id"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 10000
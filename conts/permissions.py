@@ -0,0 +1,13 @@
+from rest_framework.permissions import BasePermission
+
+from conts.authentication import GameServer
+
+
+class IsGameServerOrAdminUser(BasePermission):
+    """
+    Доступ игровым серверам с токеном GAME_SERVER_TOKEN и сотрудникам (is_staff).
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        return isinstance(user, GameServer) or bool(user and user.is_staff)
@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+from django.utils.text import slugify
+
+# Интервал между снимками стека, секунды
+PROFILE_INTERVAL = 0.005
+# Каталог профилей внутри PRIVATE_ROOT: профили раскрывают код и SQL приложения и не должны раздаваться nginx
+PROFILE_DIR = "profiles"
+# Заголовок запроса, включающий профилирование, и заголовок ответа с именем профиля
+PROFILE_HEADER = "X-Profile"
+
+_frame_names = {}
+
+
+def _frame_name(code):
+    """
+    Имя кадра для collapsed stacks: функция и файл относительно проекта или site-packages.
+    """
+    name = _frame_names.get(code)
+    if name is None:
+        path = code.co_filename
+        if "site-packages" + os.sep in path:
+            path = path.rpartition("site-packages" + os.sep)[2]
+        elif path.startswith(str(settings.BASE_DIR)):
+            path = os.path.relpath(path, settings.BASE_DIR)
+        name = _frame_names[code] = f"{code.co_qualname} ({path}:{code.co_firstlineno})".replace(";", ":")
+    return name
+
+
+class Profiler:
+    """
+    Сэмплирующий профайлер одного потока: фоновый поток раз в interval снимает стек профилируемого потока,
+    а execute_wrapper собирает SQL-запросы соединения using с их временем.
+    После остановки сохраняет в PRIVATE_ROOT/profiles стеки в формате collapsed stacks
+    (для flamegraph.pl, speedscope) и SQL-запросы по убыванию суммарного времени.
+    """
+
+    def __init__(self, label, interval=PROFILE_INTERVAL, using=DEFAULT_DB_ALIAS):
+        self.name = f"{timezone.now():%Y%m%d-%H%M%S}-{slugify(label)[:50] or 'profile'}-{uuid.uuid4().hex}"
+        self.label = label
+        self.interval = interval
+        self.using = using
+        self.stacks = Counter()
+        # SQL -> [количество, суммарное время]
+        self.statements = {}
+        self.stopped = threading.Event()
+
+    @property
+    def stacks_path(self):
+        return Path(settings.PRIVATE_ROOT) / PROFILE_DIR / f"{self.name}.folded"
+
+    @property
+    def sql_path(self):
+        return Path(settings.PRIVATE_ROOT) / PROFILE_DIR / f"{self.name}.sql.txt"
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.sampler = threading.Thread(target=self.sample, name="profiler", daemon=True)
+        self.sampler.start()
+        connections[self.using].execute_wrappers.append(self.execute)
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+        connections[self.using].execute_wrappers.remove(self.execute)
+        self.stopped.set()
+        self.sampler.join()
+        self.save()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            statement = self.statements.setdefault(sql, [0, 0.0])
+            statement[0] += 1
+            statement[1] += time.perf_counter() - started
+
+    def save(self):
+        self.stacks_path.parent.mkdir(parents=True, exist_ok=True)
+        self.stacks_path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+        statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        total = sum(duration for _, duration in self.statements.values())
+        lines = [
+            f"{self.label}: {self.elapsed * 1000:.1f} мс, снимков стека {sum(self.stacks.values())}, "
+            f"SQL-запросов {sum(count for count, _ in self.statements.values())} за {total * 1000:.1f} мс",
+            "",
+        ]
+        for sql, (count, duration) in statements:
+            lines += [f"{duration * 1000:.1f} мс, {count} раз, в среднем {duration / count * 1000:.2f} мс", sql, ""]
+        self.sql_path.write_text("\n".join(lines))
@@ -0,0 +1,43 @@
+import logging
+import re
+
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+
+
+def trigram_index_name(model, field_name):
+    return f"{model._meta.db_table}_{field_name}_trgm"
+
+
+def create_trigram_indexes(fields, using):
+    """
+    GIN-индексы pg_trgm по UPPER(поле) под поиск админки: search_fields дают UPPER(поле::text) LIKE '%...%'.
+    fields - пары (модель, имя поля). Индексы строятся CONCURRENTLY, без блокировки записи в таблицу;
+    существующие пропускаются, недостроенные после прерванной сборки пересоздаются.
+    Если расширение pg_trgm недоступно, поиск работает без индекса.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError as error:
+            logger.warning("Расширение pg_trgm недоступно, индексы поиска не созданы: %s", error)
+            return
+        for model, field_name in fields:
+            name = trigram_index_name(model, field_name)
+            column = model._meta.get_field(field_name).column
+            cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [name])
+            row = cursor.fetchone()
+            if row and row[0]:
+                continue
+            if row:
+                cursor.execute(f"DROP INDEX CONCURRENTLY {name}")
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY {name} ON {model._meta.db_table} "
+                f"USING gin (UPPER({column}::text) gin_trgm_ops)"
+            )
@@ -0,0 +1,31 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from rest_framework.authentication import get_authorization_header
+
+from conts.metrics import render_metrics
+
+
+def has_metrics_access(request):
+    """
+    Токен METRICS_TOKEN в заголовке "Authorization: Bearer <токен>" или запрос, у которого все адреса -
+    REMOTE_ADDR и X-Real-IP, если запрос пришёл через nginx, - из METRICS_ALLOWED_IPS.
+    За nginx REMOTE_ADDR - всегда адрес nginx, поэтому снаружи метрики отдаются только по токену.
+    """
+    header = get_authorization_header(request).split()
+    token = settings.METRICS_TOKEN.encode()
+    if token and len(header) == 2 and header[0].lower() == b"bearer" and hmac.compare_digest(header[1], token):
+        return True
+    addresses = {request.META.get("REMOTE_ADDR"), request.META.get("HTTP_X_REAL_IP", request.META.get("REMOTE_ADDR"))}
+    return addresses <= set(settings.METRICS_ALLOWED_IPS)
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus. Без токена METRICS_TOKEN доступны только с адресов METRICS_ALLOWED_IPS.
+    """
+    if not has_metrics_access(request):
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,13 +1,15 @@
 from django.contrib import messages
 from django.contrib.admin import ModelAdmin, register
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.utils.html import format_html
 
+from conts.admin import LargeTableAdminMixin
 from tests1.models import Boost, Player
 
 
 @register(Player)
-class PlayerAdmin(ModelAdmin):
+class PlayerAdmin(LargeTableAdminMixin, ModelAdmin):
     """
     Админка для игроков.
     """
@@ -28,94 +30,69 @@ class PlayerAdmin(ModelAdmin):
         "first_login",
         "last_login",
     )
+    search_fields = ("username",)
+    list_only_extra = ("boost_mask",)
+    list_prefetch_related = (
+        Prefetch("boosts", queryset=Boost.objects.filter(is_active=True).order_by("pk"), to_attr="active_boosts"),
+    )
     actions = [
         "trigger_login",
         "trigger_level_up",
         "trigger_level_down",
     ]
 
+    def message_bulk_result(self, request, result, changed_message):
+        """
+        Сводка массового экшена: одно сообщение об изменениях и одно со счётчиками ошибок.
+        """
+        if result.changed_total:
+            self.message_user(request, changed_message, level=messages.SUCCESS)
+        if result.errors:
+            errors = "; ".join(f"{error} - игроков: {count}" for error, count in result.errors.items())
+            self.message_user(
+                request, f"Пропущено игроков: {sum(result.errors.values())}. {errors}", level=messages.ERROR
+            )
+        if not result.changed_total and not result.errors:
+            self.message_user(request, "Ничего не изменено.", level=messages.WARNING)
+
     def trigger_login(self, request, queryset):
         """
         Экшен для совершения логина.
         """
-        for player in queryset:
-            player.handle_login()
-        self.message_user(request, "Логин совершён.")
+        result = queryset.login()
+        self.message_bulk_result(
+            request,
+            result,
+            f"Логин совершён. Очки начислены игрокам: {result.changed['credited']}, "
+            f"уже заходили сегодня: {result.changed['repeated']}.",
+        )
 
     trigger_login.short_description = "Совершить логин"
 
     def trigger_level_up(self, request, queryset):
-        successes = []
-        errors = []
-        for player in queryset:
-            try:
-                player.complete_level()
-                if player.current_level == 3:
-                    successes.append(f"Игрок {player.username} повышен до максимального 3 уровня.")
-                else:
-                    successes.append(f"Уровень игрока {player.username} повышен до {player.current_level}.")
-            except ValueError as e:
-                errors.append(f"Ошибка для игрока {player.username}: {str(e)}.")
-        message = ""
-        if successes:
-            message += " ".join(successes)
-        if errors:
-            message += " " + " ".join(errors)
-        if message:
-            level = messages.ERROR if errors else messages.SUCCESS
-            self.message_user(request, message.strip(), level=level)
-        else:
-            self.message_user(request, "Ничего не изменено.", level=messages.WARNING)
+        result = queryset.level_up()
+        levels = ", ".join(f"до {level} - {count}" for level, count in sorted(result.changed.items()))
+        self.message_bulk_result(request, result, f"Уровень повышен у {result.changed_total} игроков ({levels}).")
 
     trigger_level_up.short_description = "Повысить уровень"
 
     def trigger_level_down(self, request, queryset):
-        successes = []
-        errors = []
-        boosts_map = {
-            1: "x2_gold",
-            2: "x2_exp",
-            3: "god_mode",
-        }
-        for player in queryset:
-            try:
-                if player.current_level == 0:
-                    raise ValueError("Игрок уже на минимальном уровне 0.")
-                # Если уровень был 3, убираем 100 очков
-                if player.current_level == 3:
-                    player.points = max(0, player.points - 100)
-                # Удаляем буст, связанный с текущим уровнем
-                current_boost = boosts_map.get(player.current_level)
-                if current_boost:
-                    player.boosts.filter(boost_type=current_boost).delete()
-                # Уменьшаем уровень
-                player.current_level -= 1
-                # Начисляем буст для нового уровня, если он не 0
-                new_boost = boosts_map.get(player.current_level)
-                if new_boost:
-                    player.award_boost(new_boost)
-                player.save()
-                successes.append(f"Уровень игрока {player.username} понижен до {player.current_level}.")
-            except ValueError as e:
-                errors.append(f"Ошибка для игрока {player.username}: {str(e)}.")
-        message = ""
-        if successes:
-            message += " ".join(successes)
-        if errors:
-            message += " " + " ".join(errors)
-        if message:
-            level = messages.ERROR if errors else messages.SUCCESS
-            self.message_user(request, message.strip(), level=level)
-        else:
-            self.message_user(request, "Ничего не изменено.", level=messages.WARNING)
+        result = queryset.level_down()
+        levels = ", ".join(f"до {level} - {count}" for level, count in sorted(result.changed.items()))
+        self.message_bulk_result(request, result, f"Уровень понижен у {result.changed_total} игроков ({levels}).")
 
     trigger_level_down.short_description = "Понизить уровень"
 
     def get_boosts(self, obj):
         """
-        Метод отображения нескольких бустов.
+        Метод отображения нескольких активных бустов.
         """
-        boosts = obj.boosts.all().prefetch_related("player")
+        if not obj.boost_mask:
+            return "Бустов нет"
+        # В списке игроков активные бусты предзагружены для всей страницы
+        boosts = getattr(obj, "active_boosts", None)
+        if boosts is None:
+            boosts = obj.boosts.filter(is_active=True)
         if not boosts:
             return "Бустов нет"
         return format_html(
@@ -132,7 +109,7 @@ class PlayerAdmin(ModelAdmin):
 
 
 @register(Boost)
-class BoostAdmin(ModelAdmin):
+class BoostAdmin(LargeTableAdminMixin, ModelAdmin):
     """
     Админка для бустов.
     """
@@ -142,5 +119,6 @@ class BoostAdmin(ModelAdmin):
         "player",
         "boost_type",
         "awarded_at",
+        "expires_at",
         "is_active",
     )
@@ -1,7 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class Tests1Config(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tests1"
     verbose_name = "1 Тестовое задание"
+
+    def ready(self):
+        from tests1 import signals
+
+        # Индексы, которые нельзя описать в модели, создаются после migrate
+        post_migrate.connect(signals.create_search_indexes, sender=self)
+        # Триггеры таблицы лидеров нельзя описать в модели, они тоже создаются после migrate
+        post_migrate.connect(signals.create_leaderboard_triggers, sender=self)
+        # Секционированный журнал входов Django не создаёт
+        post_migrate.connect(signals.create_login_event_table, sender=self)
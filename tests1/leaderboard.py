@@ -0,0 +1,208 @@
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from conts.metrics import measure
+from tests1.models import LeaderboardBucket, Player
+
+# Размер страницы таблицы лидеров по умолчанию и максимальный
+LEADERBOARD_PAGE_SIZE = 100
+LEADERBOARD_MAX_PAGE_SIZE = 1000
+# Максимальное количество соседей игрока с каждой стороны
+LEADERBOARD_MAX_NEIGHBOURS = 50
+# Количество строк корзин, после которого чтение ранга само сворачивает изменения
+LEADERBOARD_COMPACT_THRESHOLD = 10000
+# Не чаще какого интервала в секундах каждый процесс проверяет количество строк корзин
+LEADERBOARD_COMPACT_CHECK_INTERVAL = 60
+
+LEADERBOARD_FUNCTION = "tests1_player_leaderboard"
+LEADERBOARD_FIELDS = ("id", "username", "points", "current_level")
+
+_PLAYER_TABLE = Player._meta.db_table
+_BUCKET_TABLE = LeaderboardBucket._meta.db_table
+_COLUMNS = ", ".join(LEADERBOARD_FIELDS)
+
+# Функции и триггеры, добавляющие изменения корзин после изменений таблицы игроков.
+# Вставка, удаление и очистка обрабатываются один раз на запрос по таблицам переходов.
+# Обновление - построчно и только при изменении очков: столбцы и WHEN нельзя сочетать с таблицами переходов,
+# а логин и изменение бустов не должны платить за триггер.
+_TRIGGER_SQL = f"""
+    CREATE OR REPLACE FUNCTION {LEADERBOARD_FUNCTION}() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO {_BUCKET_TABLE} (points, players)
+            SELECT points, COUNT(*) FROM new_rows GROUP BY points;
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO {_BUCKET_TABLE} (points, players)
+            SELECT points, -COUNT(*) FROM old_rows GROUP BY points;
+        ELSE
+            DELETE FROM {_BUCKET_TABLE};
+        END IF;
+        RETURN NULL;
+    END
+    $$;
+    CREATE OR REPLACE FUNCTION {LEADERBOARD_FUNCTION}_points() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO {_BUCKET_TABLE} (points, players) VALUES (OLD.points, -1), (NEW.points, 1);
+        RETURN NULL;
+    END
+    $$;
+    CREATE OR REPLACE TRIGGER {LEADERBOARD_FUNCTION}_insert AFTER INSERT ON {_PLAYER_TABLE}
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {LEADERBOARD_FUNCTION}();
+    DROP TRIGGER IF EXISTS {LEADERBOARD_FUNCTION}_update ON {_PLAYER_TABLE};
+    CREATE OR REPLACE TRIGGER {LEADERBOARD_FUNCTION}_points AFTER UPDATE OF points ON {_PLAYER_TABLE}
+        FOR EACH ROW WHEN (OLD.points IS DISTINCT FROM NEW.points) EXECUTE FUNCTION {LEADERBOARD_FUNCTION}_points();
+    CREATE OR REPLACE TRIGGER {LEADERBOARD_FUNCTION}_delete AFTER DELETE ON {_PLAYER_TABLE}
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {LEADERBOARD_FUNCTION}();
+    CREATE OR REPLACE TRIGGER {LEADERBOARD_FUNCTION}_truncate AFTER TRUNCATE ON {_PLAYER_TABLE}
+        FOR EACH STATEMENT EXECUTE FUNCTION {LEADERBOARD_FUNCTION}();
+"""
+
+# Время последней проверки количества строк корзин в этом процессе
+_compact_checked_at = None
+
+
+def _rebuild(cursor):
+    cursor.execute(f"DELETE FROM {_BUCKET_TABLE}")
+    cursor.execute(
+        f"INSERT INTO {_BUCKET_TABLE} (points, players) SELECT points, COUNT(*) FROM {_PLAYER_TABLE} GROUP BY points"
+    )
+
+
+def install(using=DEFAULT_DB_ALIAS):
+    """
+    Создать или обновить триггеры, поддерживающие корзины таблицы лидеров.
+    При первой установке корзины заполняются по текущим игрокам. Запись в таблицу игроков
+    на это время блокируется, чтобы не потерять изменения между подсчётом и появлением триггеров.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_PLAYER_TABLE} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM pg_proc WHERE proname = %s)", [LEADERBOARD_FUNCTION])
+        installed = cursor.fetchone()[0]
+        cursor.execute(_TRIGGER_SQL)
+        if not installed:
+            _rebuild(cursor)
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """
+    Пересчитать корзины по таблице игроков. Запись в таблицу игроков на время пересчёта блокируется.
+    """
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_PLAYER_TABLE} IN SHARE ROW EXCLUSIVE MODE")
+        _rebuild(cursor)
+
+
+@measure("service", "tests1.leaderboard.compact")
+def compact(using=DEFAULT_DB_ALIAS):
+    """
+    Свернуть накопленные изменения корзин в одну строку на значение очков одним запросом.
+    Изменения, добавленные параллельными транзакциями после начала запроса, остаются до следующего сворачивания.
+    Возвращает количество строк до и после сворачивания.
+    """
+    sql = f"""
+        WITH removed AS (
+            DELETE FROM {_BUCKET_TABLE} RETURNING points, players
+        ), merged AS (
+            INSERT INTO {_BUCKET_TABLE} (points, players)
+            SELECT points, SUM(players) FROM removed GROUP BY points HAVING SUM(players) <> 0
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM removed), (SELECT COUNT(*) FROM merged)
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchone()
+
+
+def _compact_if_needed(cursor, using):
+    """
+    Свернуть корзины, если строк изменений больше LEADERBOARD_COMPACT_THRESHOLD.
+    Количество строк берётся из статистики таблицы и проверяется не чаще LEADERBOARD_COMPACT_CHECK_INTERVAL,
+    сворачивает только один процесс: остальные в это время пропускают сворачивание.
+    """
+    global _compact_checked_at
+    now = time.monotonic()
+    if _compact_checked_at is not None and now - _compact_checked_at < LEADERBOARD_COMPACT_CHECK_INTERVAL:
+        return
+    _compact_checked_at = now
+    cursor.execute("SELECT n_live_tup FROM pg_stat_user_tables WHERE relid = %s::regclass", [_BUCKET_TABLE])
+    row = cursor.fetchone()
+    if not row or row[0] <= LEADERBOARD_COMPACT_THRESHOLD:
+        return
+    with transaction.atomic(using=using):
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", [_BUCKET_TABLE])
+        if cursor.fetchone()[0]:
+            compact(using)
+
+
+def _fetch_entries(cursor, sql, params):
+    cursor.execute(sql, params)
+    return [dict(zip(LEADERBOARD_FIELDS, row, strict=True)) for row in cursor.fetchall()]
+
+
+def _add_ranks(cursor, entries, using):
+    """
+    Ранг игроков: 1 + количество игроков с большим количеством очков, игроки с равными очками делят ранг.
+    Ранги всех игроков считаются одним запросом по корзинам, по строке на значение очков выше.
+    """
+    if not entries:
+        return
+    _compact_if_needed(cursor, using)
+    cursor.execute(
+        f"""
+        SELECT value, (SELECT COALESCE(SUM(players), 0) FROM {_BUCKET_TABLE} WHERE points > value)
+        FROM UNNEST(%s::integer[]) AS value
+        """,
+        [sorted({entry["points"] for entry in entries})],
+    )
+    above = dict(cursor.fetchall())
+    for entry in entries:
+        entry["rank"] = above[entry["points"]] + 1
+
+
+@measure("service", "tests1.leaderboard.top")
+def top(limit=LEADERBOARD_PAGE_SIZE, after=None, using=DEFAULT_DB_ALIAS):
+    """
+    Страница таблицы лидеров по убыванию очков, при равенстве очков - по убыванию id.
+    after - позиция (очки, id) последнего игрока предыдущей страницы.
+    Страница читается обратным проходом по индексу (points, id), независимо от глубины.
+    """
+    condition, params = ("WHERE (points, id) < (%s, %s)", list(after)) if after else ("", [])
+    sql = f"SELECT {_COLUMNS} FROM {_PLAYER_TABLE} {condition} ORDER BY points DESC, id DESC LIMIT %s"
+    with connections[using].cursor() as cursor:
+        entries = _fetch_entries(cursor, sql, [*params, limit])
+        _add_ranks(cursor, entries, using)
+    return entries
+
+
+@measure("service", "tests1.leaderboard.player_rank")
+def player_rank(player_id, neighbours=0, using=DEFAULT_DB_ALIAS):
+    """
+    Ранг игрока и neighbours игроков выше и ниже него в таблице лидеров.
+    Возвращает словарь player, above, below или None, если игрока нет.
+    """
+    with connections[using].cursor() as cursor:
+        entries = _fetch_entries(cursor, f"SELECT {_COLUMNS} FROM {_PLAYER_TABLE} WHERE id = %s", [player_id])
+        if not entries:
+            return None
+        player = entries[0]
+        above = below = []
+        if neighbours:
+            position = [player["points"], player["id"]]
+            above = _fetch_entries(
+                cursor,
+                f"SELECT {_COLUMNS} FROM {_PLAYER_TABLE} WHERE (points, id) > (%s, %s) ORDER BY points, id LIMIT %s",
+                [*position, neighbours],
+            )[::-1]
+            below = _fetch_entries(
+                cursor,
+                f"SELECT {_COLUMNS} FROM {_PLAYER_TABLE} WHERE (points, id) < (%s, %s) "
+                f"ORDER BY points DESC, id DESC LIMIT %s",
+                [*position, neighbours],
+            )
+        _add_ranks(cursor, [*above, player, *below], using)
+    return {"player": player, "above": above, "below": below}
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management import BaseCommand
+
+from tests1 import leaderboard
+
+
+class Command(BaseCommand):
+    help = (
+        "Сворачивание изменений корзин таблицы лидеров в одну строку на значение очков. "
+        "С --loop работает как планировщик, с --rebuild корзины пересчитываются по таблице игроков."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Пересчитать корзины по таблице игроков")
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, сворачивать корзины постоянно")
+        parser.add_argument("--interval", type=float, default=60, help="Пауза между сворачиваниями в секундах")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            started = time.monotonic()
+            leaderboard.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Корзины пересчитаны за {time.monotonic() - started:.2f} с."))
+        while True:
+            started = time.monotonic()
+            before, after = leaderboard.compact()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Корзины свёрнуты: {before} строк -> {after} за {time.monotonic() - started:.2f} с."
+                )
+            )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
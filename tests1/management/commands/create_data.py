@@ -1,26 +1,85 @@
 import os
 import random
+import time
+from contextlib import nullcontext
 from datetime import timedelta
 
 from django.contrib.auth.models import User
 from django.core.management import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Max
 from django.utils import timezone
 from faker import Faker
 
 from conts.choices import BoostTypeChoices
-from tests1.models import Player
+from conts.loading import copy_rows, deferred_constraints
+from tests1.models import BOOST_BITS, BOOSTS_BY_LEVEL, LOGIN_POINTS, MAX_LEVEL, MAX_LEVEL_POINTS, Boost, Player
+
+# Игроков в одной пачке: состояние пачки считается в памяти и загружается двумя COPY
+SEED_CHUNK_ROWS = 100000
+# Размер пула имён, из которого берутся username
+SEED_POOL_SIZE = 10000
+# Максимум случайных входов игрока после первого
+SEED_MAX_LOGINS = 20
+
+PLAYER_COLUMNS = (
+    "id",
+    "username",
+    "created_at",
+    "updated_at",
+    "first_login",
+    "last_login",
+    "points",
+    "login_days_count",
+    "current_level",
+    "boost_mask",
+)
+BOOST_COLUMNS = ("player_id", "boost_type", "awarded_at", "is_active")
+
+
+def _player_state(rng, now, year_start):
+    """
+    Итоговое состояние игрока, к которому приводят первый вход, случайные входы раз в день,
+    прохождение уровней и выдача бустов через handle_login, complete_level и award_boost.
+    Возвращает значения полей игрока (без id, username и updated_at) и типы выданных бустов.
+    """
+    # Первый вход через 1-3 дня после создания, последний - не раньше чем через день после первого.
+    # В первые дни года на это не хватает времени, тогда входы ограничиваются текущим моментом
+    created_at = year_start + max(now - year_start - timedelta(days=4), timedelta()) * rng.random()
+    first_login = min(created_at + timedelta(days=rng.randint(1, 3)), now)
+    last_login = min(
+        first_login + timedelta(days=1) + max(now - first_login - timedelta(days=1), timedelta()) * rng.random(),
+        now,
+    )
+    # Каждый вход приходится на новый день, поэтому за каждый начисляются очки
+    login_days_count = 1 + min(rng.randint(0, SEED_MAX_LOGINS), (last_login - first_login).days)
+    points = LOGIN_POINTS * login_days_count
+
+    current_level = rng.randint(0, MAX_LEVEL)
+    if current_level == 1 and rng.random() < 0.5:
+        current_level = 2
+    boosts = [BOOSTS_BY_LEVEL[level] for level in range(1, current_level + 1) if level in BOOSTS_BY_LEVEL]
+    if current_level == MAX_LEVEL:
+        points += MAX_LEVEL_POINTS
+    if current_level == 0:
+        boosts = [rng.choice(BoostTypeChoices.values)]
+    boost_mask = sum(BOOST_BITS[boost_type] for boost_type in boosts)
+    return (created_at, first_login, last_login, points, login_days_count, current_level, boost_mask), boosts
 
 
 class Command(BaseCommand):
     help = "Команда для создания тестовых данных для первой части задания. А так же создание админа."
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=10, help="Количество игроков")
+        parser.add_argument("--seed", type=int, help="Seed генератора, по умолчанию случайный")
+
+    def handle(self, *args, **options):
         with transaction.atomic():
             # Создание админа
             self.create_admin()
             # # Создание игроков с бустами
-            self.create_players_with_boosts()
+            self.create_players_with_boosts(options["count"], options["seed"])
 
     def create_admin(self):
         username = os.getenv("ADMIN_USERNAME")
@@ -37,101 +96,83 @@ class Command(BaseCommand):
         else:
             self.stdout.write(self.style.WARNING(f"Админ {username} уже существует."))
 
-    def create_players_with_boosts(self):
+    def create_players_with_boosts(self, count, seed):
+        """
+        Состояние игроков считается в памяти, игроки и бусты загружаются через COPY пачками по SEED_CHUNK_ROWS.
+        """
+        if connection.vendor != "postgresql":
+            self.stderr.write(self.style.ERROR("Игроки загружаются через COPY, это работает только с PostgreSQL."))
+            return
+        started = time.monotonic()
+        seed = seed if seed is not None else random.randrange(2**32)
+        rng = random.Random(seed)
         fake = Faker()
-        players_to_create = 10
-        created_count = 0
-        attempts = 0
-        max_attempts = 50
-
-        while created_count < players_to_create and attempts < max_attempts:
-            username = fake.user_name()
-
-            if Player.objects.filter(username=username).exists():
-                attempts += 1
-                continue
-
-            # Генерируем наивную дату для created_at и преобразуем в осведомлённую
-            naive_datetime = fake.date_time_this_year()
-            aware_datetime = timezone.make_aware(naive_datetime)
-
-            # Генерируем дату для first_login: created_at + 1, 2 или 3 дня
-            days_to_add = random.randint(1, 3)
-            first_login = aware_datetime + timedelta(days=days_to_add)
-
-            # Генерируем last_login: случайная дата между first_login и текущей датой
-            last_login = timezone.make_aware(
-                fake.date_time_between(start_date=first_login + timedelta(days=1), end_date="now")
-            )
-
-            # Создаём игрока без указания created_at, first_login и last_login
-            player = Player.objects.create(
-                username=username,
-            )
-            # Устанавливаем created_at, first_login и начисляем очки за первый вход
-            player.created_at = aware_datetime
-            player.first_login = first_login
-            player.last_login = first_login
-            player.points += 10  # Начисляем 10 очков за первый вход
-            player.login_days_count += 1  # Увеличиваем счётчик дней логина
-            player.save()
-
-            # Имитация случайных входов для начисления очков
-            login_count = random.randint(0, 20)
-            current_date = first_login + timedelta(days=1)
-            for _ in range(login_count):
-                # Генерируем случайную дату входа между current_date и last_login
-                login_date = timezone.make_aware(fake.date_time_between(start_date=current_date, end_date=last_login))
-                # Устанавливаем временную дату для last_login и вызываем handle_login
-                player.last_login = login_date
-                player.handle_login()
-                current_date = login_date + timedelta(days=1)  # Переходим к следующему дню
-
-            # Начисление случайного количества уровней
-            level_count = random.randint(0, 3)  # Случайное количество уровней (0–3)
-            for _ in range(level_count):
-                try:
-                    player.complete_level()
-                except ValueError as e:
-                    self.stdout.write(self.style.WARNING(f"Ошибка для {username}: {str(e)}"))
-                    break
-
-            # Случайный вызов complete_level для игроков с уровнем 1
-            if player.current_level == 1 and random.choice([True, False]):
-                try:
-                    player.complete_level()
-                    self.stdout.write(
-                        self.style.SUCCESS(f"Уровень для {username} повышен до 2 (случайное повышение).")
-                    )
-                except ValueError as e:
-                    self.stdout.write(
-                        self.style.WARNING(f"Ошибка при случайном повышении уровня для {username}: {str(e)}")
-                    )
-
-            # Начисление случайного буста для игроков с уровнем 0
-            if player.current_level == 0:
-                random_boost_type = random.choice([choice[0] for choice in BoostTypeChoices.choices])
-                player.award_boost(random_boost_type)
-
-            # Восстанавливаем last_login
-            player.last_login = last_login
-            player.save()
-
-            created_count += 1
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"Игрок {username} создан успешно с датой создания "
-                    f"{player.created_at.strftime('%Y-%m-%d %H:%M:%S')}, "
-                    f"первым входом {player.first_login.strftime('%Y-%m-%d %H:%M:%S')}, "
-                    f"последним входом {player.last_login.strftime('%Y-%m-%d %H:%M:%S')}, "
-                    f"очками {player.points}, уровнем {player.current_level}, "
-                    f"бустами {player.boosts.count()}, днями логина {player.login_days_count} "
-                    f"(входы: {login_count + 1})."
-                )
+        fake.seed_instance(seed)
+        names = list(dict.fromkeys(fake.user_name() for _ in range(min(count, SEED_POOL_SIZE))))
+        rng.shuffle(names)
+        now = timezone.now()
+        year_start = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+        # Дата обновления и выдачи бустов одна на всех, строка для COPY форматируется один раз
+        now_text = now.isoformat()
+        # id новых игроков идут после существующих
+        player_base = Player.objects.aggregate(value=Max("pk"))["value"] or 0
+        used = set()
+        boosts_count = 0
+
+        # Индексы и внешние ключи снимаются, только если таблицы пустые: иначе они нужны работающему приложению
+        models = (Player, Boost)
+        empty = not any(model.objects.exists() for model in models)
+        with deferred_constraints(models, connection.alias) if empty else nullcontext():
+            for start in range(0, count, SEED_CHUNK_ROWS):
+                ids = range(player_base + start + 1, player_base + min(start + SEED_CHUNK_ROWS, count) + 1)
+                usernames = self.unique_usernames(names, ids, used)
+                players = []
+                boosts = []
+                for player_id, username in zip(ids, usernames, strict=True):
+                    state, player_boosts = _player_state(rng, now, year_start)
+                    players.append((player_id, username, state[0], now_text, *state[1:]))
+                    boosts += [(player_id, boost_type, now_text, "t") for boost_type in player_boosts]
+                with connection.cursor() as cursor:
+                    copy_rows(cursor, Player._meta.db_table, PLAYER_COLUMNS, players)
+                    copy_rows(cursor, Boost._meta.db_table, BOOST_COLUMNS, boosts)
+                boosts_count += len(boosts)
+
+        with connection.cursor() as cursor:
+            # id игроков заданы явно, последовательность сдвигается за них
+            table = Player._meta.db_table
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), MAX(id)) FROM {table} HAVING MAX(id) > 0"
             )
-            attempts = 0
+            for model in (Player, Boost):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
 
-        if created_count < players_to_create:
-            self.stdout.write(
-                self.style.WARNING(f"Создано только {created_count} игроков из-за проблем с уникальностью имён.")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано {count} игроков и {boosts_count} бустов за {time.monotonic() - started:.1f} с, seed {seed}."
             )
+        )
+
+    def unique_usernames(self, names, ids, used):
+        """
+        Имена для пачки игроков: сначала по очереди из пула, занятые дополняются id игрока.
+        Имя с id может совпасть с именем из пула или базы, тогда к нему добавляется счётчик.
+        Существующие в базе имена и имена с id проверяются одним запросом на пачку.
+        """
+        candidates = [names[(player_id - 1) % len(names)] for player_id in ids]
+        suffixed = [f"{candidate}_{player_id}" for player_id, candidate in zip(ids, candidates, strict=True)]
+        used.update(Player.objects.filter(username__in={*candidates, *suffixed}).values_list("username", flat=True))
+        usernames = []
+        for candidate, candidate_suffixed in zip(candidates, suffixed, strict=True):
+            username = candidate
+            if username in used:
+                username = candidate_suffixed
+                attempt = 0
+                # Имя с id уже проверено по базе, имена со счётчиком редки и проверяются по одному
+                while username in used:
+                    attempt += 1
+                    username = f"{candidate_suffixed}_{attempt}"
+                    if Player.objects.filter(username=username).exists():
+                        used.add(username)
+            used.add(username)
+            usernames.append(username)
+        return usernames
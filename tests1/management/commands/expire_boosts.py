@@ -0,0 +1,39 @@
+import time
+
+from django.core.management import BaseCommand
+
+from tests1.models import BOOST_BATCH_SIZE, Boost
+
+
+class Command(BaseCommand):
+    help = "Деактивация истёкших бустов пачками. С --loop работает как планировщик."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BOOST_BATCH_SIZE, help="Бустов в одной пачке")
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, проверять истёкшие бусты постоянно")
+        parser.add_argument("--interval", type=float, default=60, help="Пауза между проверками в секундах")
+
+    def handle(self, *args, **options):
+        while True:
+            self.sweep(options["batch_size"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def sweep(self, batch_size):
+        """
+        Деактивирует все истёкшие на момент запуска бусты, по пачке за транзакцию.
+        """
+        started = time.monotonic()
+        total = 0
+        while True:
+            expired = Boost.objects.expire_due(batch_size=batch_size)
+            total += expired
+            if expired < batch_size:
+                break
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Деактивировано {total} истёкших бустов за {elapsed:.2f} с ({total / elapsed:.0f} строк/с)."
+            )
+        )
@@ -0,0 +1,264 @@
+import multiprocessing
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import DatabaseError, connection, connections
+from django.db.models import Max
+from django.utils import timezone
+
+from conts.bench import latency_percentiles
+from conts.choices import BoostTypeChoices
+from tests1.models import BOOST_BITS, LOGIN_POINTS, MAX_LEVEL, MAX_LEVEL_POINTS, Boost, LoginEvent, Player
+
+# Доля операций по умолчанию
+LOAD_MIX = {"login": 50, "level_up": 20, "level_down": 10, "grant": 20}
+# Интервал опроса блокировок, секунды
+LOAD_LOCK_SAMPLE_INTERVAL = 0.05
+
+
+def _login(player_id, rng, params):
+    Player(pk=player_id).handle_login(now=params["login_at"])
+    return 0
+
+
+def _level_up(player_id, rng, params):
+    Player.objects.get(pk=player_id).complete_level()
+    return 1
+
+
+def _level_down(player_id, rng, params):
+    return -Player.objects.filter(pk=player_id).level_down().changed_total
+
+
+def _grant(player_id, rng, params):
+    Player(pk=player_id).award_boost(rng.choice(BoostTypeChoices.values))
+    return 0
+
+
+# Операции нагрузки, каждая возвращает изменение уровня игрока
+LOAD_OPERATIONS = {
+    "login": _login,
+    "level_up": _level_up,
+    "level_down": _level_down,
+    "grant": _grant,
+}
+
+
+def _run_worker(task):
+    """
+    Выполнить ops случайных операций над игроками. Выполняется в отдельном процессе или потоке.
+    Возвращает время операций, ошибки, вошедших игроков и изменения уровней по игрокам.
+    """
+    worker, ops, params = task
+    rng = random.Random(f"{params['seed']}:{worker}")
+    names = list(params["mix"])
+    weights = list(params["mix"].values())
+    timings = defaultdict(list)
+    errors = Counter()
+    logged_in = set()
+    level_changes = Counter()
+    try:
+        for _ in range(ops):
+            name = rng.choices(names, weights)[0]
+            hot = rng.random() < params["hot_share"]
+            player_id = rng.choice(params["hot_ids"] if hot else params["player_ids"])
+            started = time.perf_counter()
+            try:
+                level_changes[player_id] += LOAD_OPERATIONS[name](player_id, rng, params)
+            except ValueError as error:
+                # Отказ по правилам игры (максимальный уровень и т.п.), состояние не меняется
+                errors[f"{name}: {error}"] += 1
+            except DatabaseError as error:
+                errors[f"{name}: {type(error).__name__}: {str(error).splitlines()[0]}"] += 1
+            else:
+                if name == "login":
+                    logged_in.add(player_id)
+            timings[name].append(time.perf_counter() - started)
+    finally:
+        # Процессы пула завершаются без atexit, события входа записываются явно
+        LoginEvent.objects.flush()
+        connections.close_all()
+    return dict(timings), errors, logged_in, level_changes
+
+
+class LockSampler(threading.Thread):
+    """
+    Фоновый опрос pg_stat_activity: сколько соединений базы ждут блокировку.
+    """
+
+    def __init__(self):
+        super().__init__(name="lock-sampler", daemon=True)
+        self.stopped = threading.Event()
+        self.samples = []
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while not self.stopped.wait(LOAD_LOCK_SAMPLE_INTERVAL):
+                    cursor.execute(
+                        "SELECT COUNT(*) FILTER (WHERE wait_event_type = 'Lock') FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _deadlocks():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузка на игроков tests1 из нескольких процессов или потоков: вход, повышение и понижение уровня, "
+        "выдача бустов с перекосом в сторону горячих игроков. Выводит пропускную способность, задержки, "
+        "ожидания блокировок и потерянные обновления по итоговым points, login_days_count, уровню и маске бустов. "
+        "Меняет данные базы: входы выполняются на день позже последнего входа игроков."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Количество процессов или потоков")
+        parser.add_argument("--threads", action="store_true", help="Потоки вместо процессов")
+        parser.add_argument("--ops", type=int, default=1000, help="Операций на процесс или поток")
+        parser.add_argument("--players", type=int, default=1000, help="Количество игроков под нагрузкой")
+        parser.add_argument("--hot-players", type=int, default=10, help="Количество горячих игроков")
+        parser.add_argument("--hot-share", type=float, default=0.8, help="Доля операций над горячими игроками")
+        parser.add_argument(
+            "--mix",
+            nargs="+",
+            default=[f"{name}={weight}" for name, weight in LOAD_MIX.items()],
+            help=f"Доли операций вида операция=вес, операции: {', '.join(LOAD_OPERATIONS)}",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Seed выбора операций и игроков")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Нагрузочный тест опрашивает блокировки PostgreSQL и работает только с ним.")
+        mix = self.parse_mix(options["mix"])
+        players = list(
+            Player.objects.order_by("pk").values("pk", "points", "login_days_count", "current_level")[
+                : options["players"]
+            ]
+        )
+        if not players:
+            raise CommandError("Нет игроков, создайте их командой create_data.")
+        initial = {player["pk"]: player for player in players}
+        player_ids = list(initial)
+        # Все входы приходятся на один день после последнего входа: очки за вход начисляются ровно один раз
+        last_login = Player.objects.filter(pk__in=player_ids).aggregate(value=Max("last_login"))["value"]
+        login_at = max(last_login or timezone.now(), timezone.now()) + timedelta(days=1)
+        params = {
+            "seed": options["seed"],
+            "mix": mix,
+            "player_ids": player_ids,
+            "hot_ids": player_ids[: max(options["hot_players"], 1)],
+            "hot_share": options["hot_share"],
+            "login_at": login_at,
+        }
+        tasks = [(worker, options["ops"], params) for worker in range(options["workers"])]
+
+        deadlocks = _deadlocks()
+        sampler = LockSampler()
+        if options["threads"]:
+            pool = ThreadPool(options["workers"])
+        else:
+            # Процессы не должны наследовать открытое подключение родителя
+            connections.close_all()
+            pool = multiprocessing.Pool(options["workers"], initializer=django.setup)
+        sampler.start()
+        started = time.monotonic()
+        with pool:
+            results = pool.map(_run_worker, tasks)
+        elapsed = time.monotonic() - started
+        sampler.stop()
+        deadlocks = _deadlocks() - deadlocks
+
+        timings = defaultdict(list)
+        errors = Counter()
+        logged_in = set()
+        level_changes = Counter()
+        for worker_timings, worker_errors, worker_logged_in, worker_level_changes in results:
+            for name, values in worker_timings.items():
+                timings[name] += values
+            errors.update(worker_errors)
+            logged_in |= worker_logged_in
+            level_changes.update(worker_level_changes)
+
+        total = sum(len(values) for values in timings.values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{total} операций за {elapsed:.1f} с, {total / elapsed:.0f} оп/с, "
+                f"{options['workers']} {'потоков' if options['threads'] else 'процессов'}"
+            )
+        )
+        for name in mix:
+            if timings[name]:
+                latency = ", ".join(f"{key} {value}" for key, value in latency_percentiles(timings[name]).items())
+                self.stdout.write(f"{name}: {len(timings[name])} операций, {latency}")
+        for message, count in errors.most_common():
+            self.stdout.write(self.style.WARNING(f"{count} x {message}"))
+        samples = sampler.samples or [0]
+        self.stdout.write(
+            f"Ожидания блокировок: в среднем {sum(samples) / len(samples):.2f}, максимум {max(samples)} соединений, "
+            f"есть ожидающие в {sum(1 for sample in samples if sample) / len(samples):.0%} замеров; "
+            f"взаимоблокировок {deadlocks}"
+        )
+        self.check_invariants(initial, logged_in, level_changes)
+
+    def parse_mix(self, items):
+        mix = {}
+        for item in items:
+            name, _, weight = item.partition("=")
+            if name not in LOAD_OPERATIONS or not weight.isdigit():
+                raise CommandError(f"Неверная доля операции {item!r}, ожидается операция=вес.")
+            mix[name] = int(weight)
+        if not any(mix.values()):
+            raise CommandError("Хотя бы одна операция должна иметь ненулевой вес.")
+        return mix
+
+    def check_invariants(self, initial, logged_in, level_changes):
+        """
+        Сравнить итоговое состояние игроков с ожидаемым по успешным операциям.
+        Каждый вошедший игрок получает ровно один день входа и LOGIN_POINTS очков,
+        уровень меняется на сумму успешных повышений и понижений, бонус за максимальный уровень
+        начисляется при входе на него и снимается при выходе, маска бустов совпадает с активными бустами.
+        """
+        final = Player.objects.in_bulk(list(initial))
+        masks = Counter()
+        for player_id, boost_type in Boost.objects.filter(player_id__in=list(initial), is_active=True).values_list(
+            "player_id", "boost_type"
+        ):
+            masks[player_id] |= BOOST_BITS[boost_type]
+
+        lost = Counter()
+        for player_id, before in initial.items():
+            player = final[player_id]
+            logged = player_id in logged_in
+            level = before["current_level"] + level_changes[player_id]
+            bonus = MAX_LEVEL_POINTS * ((level == MAX_LEVEL) - (before["current_level"] == MAX_LEVEL))
+            if player.login_days_count != before["login_days_count"] + logged:
+                lost["login_days_count"] += 1
+            if player.points != before["points"] + LOGIN_POINTS * logged + bonus:
+                lost["points"] += 1
+            if player.current_level != level:
+                lost["current_level"] += 1
+            if player.boost_mask != masks[player_id]:
+                lost["boost_mask"] += 1
+
+        if not lost:
+            self.stdout.write(self.style.SUCCESS("Потерянных обновлений нет."))
+            return
+        for field, count in lost.items():
+            self.stdout.write(self.style.ERROR(f"Потерянные обновления {field}: {count} игроков из {len(initial)}"))
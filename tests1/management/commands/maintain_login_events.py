@@ -0,0 +1,67 @@
+import time
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from tests1.models import (
+    LOGIN_EVENT_PARTITIONS_AHEAD,
+    LOGIN_EVENT_RETENTION_DAYS,
+    LOGIN_ROLLUP_WINDOW_DAYS,
+    LoginEvent,
+    LoginRollup,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Обслуживание журнала входов: партиции на LOGIN_EVENT_PARTITIONS_AHEAD суток вперёд, "
+        "сводки DAU и когорт с последних сведённых суток, но не меньше чем за LOGIN_ROLLUP_WINDOW_DAYS суток, "
+        "по сегодня, удаление партиций старше срока хранения. "
+        "С --loop работает как планировщик."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=LOGIN_EVENT_RETENTION_DAYS,
+            help="Сколько суток хранить журнал, сводки хранятся бессрочно",
+        )
+        parser.add_argument(
+            "--window-days",
+            type=int,
+            default=LOGIN_ROLLUP_WINDOW_DAYS,
+            help="За сколько последних суток сводки пересчитываются заново",
+        )
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, обслуживать журнал постоянно")
+        parser.add_argument("--interval", type=float, default=300, help="Пауза между запусками в секундах")
+
+    def handle(self, *args, **options):
+        while True:
+            self.maintain(options["retention_days"], options["window_days"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def maintain(self, retention_days, window_days):
+        """
+        Последние сведённые сутки и все сутки окна window_days пересчитываются заново: в них могли попасть события,
+        записанные из буферов процессов и долгих транзакций после прошлой сводки.
+        """
+        started = time.monotonic()
+        today = timezone.now().date()
+        LoginEvent.objects.ensure_partitions(
+            today + timedelta(days) for days in range(LOGIN_EVENT_PARTITIONS_AHEAD + 1)
+        )
+        start = LoginRollup.objects.aggregate(day=Max("day"))["day"] or min(LoginEvent.objects.partition_days())
+        start = min(start, today - timedelta(window_days))
+        rows = LoginRollup.objects.rollup(start, today)
+        dropped = LoginEvent.objects.drop_partitions(min(start, today - timedelta(retention_days)))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Сводки за {start} - {today}: {rows} строк, удалено партиций {len(dropped)}, "
+                f"за {time.monotonic() - started:.2f} с."
+            )
+        )
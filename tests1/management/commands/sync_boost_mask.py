@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from tests1.models import Player
+
+
+class Command(BaseCommand):
+    help = "Пересчёт битовой маски активных бустов игроков по таблице бустов."
+
+    def handle(self, *args, **kwargs):
+        updated = Player.objects.all().sync_boost_mask()
+        self.stdout.write(self.style.SUCCESS(f"Маска бустов пересчитана у {updated} игроков."))
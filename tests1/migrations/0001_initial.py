@@ -0,0 +1,95 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:03
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('logged_at', models.DateTimeField(verbose_name='Дата входа')),
+                ('cohort', models.DateField(verbose_name='День первого входа')),
+            ],
+            options={
+                'verbose_name': 'Вход игрока',
+                'verbose_name_plural': 'Входы игроков',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaderboardBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.PositiveIntegerField(verbose_name='Количество очков')),
+                ('players', models.IntegerField(verbose_name='Изменение количества игроков')),
+            ],
+            options={
+                'verbose_name': 'Корзина таблицы лидеров',
+                'verbose_name_plural': 'Корзины таблицы лидеров',
+                'indexes': [models.Index(fields=['points'], include=('players',), name='leaderboard_bucket_points_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LoginRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Сутки')),
+                ('cohort', models.DateField(verbose_name='День первого входа')),
+                ('players', models.PositiveIntegerField(verbose_name='Активные игроки')),
+                ('logins', models.PositiveIntegerField(verbose_name='Входы')),
+            ],
+            options={
+                'verbose_name': 'Сводка входов',
+                'verbose_name_plural': 'Сводки входов',
+                'indexes': [models.Index(fields=['cohort', 'day'], name='login_rollup_cohort_idx')],
+                'unique_together': {('day', 'cohort')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Player',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(help_text='Введите username пользователя', max_length=100, unique=True, verbose_name='Username пользователя')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('first_login', models.DateTimeField(blank=True, null=True, verbose_name='Дата первого входа')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего входа')),
+                ('points', models.PositiveIntegerField(default=0, verbose_name='Количество очков')),
+                ('login_days_count', models.PositiveIntegerField(default=0, help_text='Количество уникальных дней, когда игрок логинился', verbose_name='Количество дней входа')),
+                ('current_level', models.PositiveIntegerField(default=0, help_text='Текущий уровень', validators=[django.core.validators.MaxValueValidator(3)], verbose_name='Текущий уровень')),
+                ('boost_mask', models.PositiveSmallIntegerField(db_index=True, default=0, help_text='Битовая маска активных бустов, поддерживается при выдаче и снятии бустов', verbose_name='Активные бусты')),
+            ],
+            options={
+                'verbose_name': 'Игрок',
+                'verbose_name_plural': 'Игроки',
+                'indexes': [models.Index(fields=['points', 'id'], include=('username', 'current_level'), name='player_leaderboard_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Boost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('boost_type', models.CharField(choices=[('x2_gold', 'x2 золота'), ('x2_exp', 'x2 опыта'), ('god_mode', 'Бессмертие')], help_text='Выберите тип буста', max_length=100, verbose_name='Тип буста')),
+                ('awarded_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата выдачи')),
+                ('is_active', models.BooleanField(default=True, help_text='Выберите статус буста', verbose_name='Статус буста')),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Оставьте пустым для бессрочного буста', null=True, verbose_name='Дата окончания')),
+                ('player', models.ForeignKey(help_text='Выберите игрока', on_delete=django.db.models.deletion.CASCADE, related_name='boosts', to='tests1.player', verbose_name='Игрок')),
+            ],
+            options={
+                'verbose_name': 'Буст',
+                'verbose_name_plural': 'Бусты',
+                'indexes': [models.Index(condition=models.Q(('expires_at__isnull', False), ('is_active', True)), fields=['expires_at'], name='boost_active_expiry_idx')],
+                'unique_together': {('player', 'boost_type')},
+            },
+        ),
+    ]
@@ -1,18 +1,405 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from datetime import time as day_time
+from functools import partial
+
+from django.core.exceptions import EmptyResultSet
 from django.core.validators import MaxValueValidator
+from django.db import DatabaseError, connections, transaction
 from django.db.models import (
     CASCADE,
+    DO_NOTHING,
     BooleanField,
+    Case,
     CharField,
+    Count,
+    DateField,
     DateTimeField,
+    F,
     ForeignKey,
+    Index,
+    IntegerField,
+    Max,
     Model,
     PositiveIntegerField,
+    PositiveSmallIntegerField,
+    Q,
+    QuerySet,
+    Sum,
+    Value,
+    When,
 )
+from django.db.models.functions import Coalesce
+from django.db.models.sql import UpdateQuery
 from django.utils import timezone
 
 from conts.choices import BoostTypeChoices
+from conts.loading import BatchWriter
+from conts.metrics import measure
 from conts.models import NULLABLE
 
+MAX_LEVEL = 3
+LOGIN_POINTS = 10
+MAX_LEVEL_POINTS = 100
+BOOST_BATCH_SIZE = 5000
+BOOSTS_BY_LEVEL = {
+    1: BoostTypeChoices.X2_GOLD,
+    2: BoostTypeChoices.X2_EXP,
+    3: BoostTypeChoices.GOD_MODE,
+}
+
+# Биты активных бустов в Player.boost_mask
+BOOST_BITS = {boost_type: 1 << index for index, boost_type in enumerate(BoostTypeChoices.values)}
+ALL_BOOSTS_MASK = sum(BOOST_BITS.values())
+
+NOT_LOGGED_IN_ERROR = "Игроку нельзя повысить уровень, так как он не заходил в игру."
+MAX_LEVEL_ERROR = "Игрок достиг максимального уровня."
+MIN_LEVEL_ERROR = "Игрок уже на минимальном уровне 0."
+
+# Журнал входов: партиции по суткам UTC, как и начисление очков за вход
+LOGIN_EVENT_RETENTION_DAYS = 90
+LOGIN_EVENT_PARTITIONS_AHEAD = 7
+# Сводки за столько последних суток пересчитываются при каждом обслуживании журнала: в них могут попасть события,
+# записанные из буферов процессов и долгих транзакций уже после прошлой сводки
+LOGIN_ROLLUP_WINDOW_DAYS = 3
+# События входа записываются пачкой при накоплении или не реже раза в интервал, секунды
+LOGIN_EVENT_BATCH_SIZE = 1000
+LOGIN_EVENT_FLUSH_INTERVAL = 5
+
+LOGIN_STATE_FIELDS = ("id", "username", "points", "login_days_count", "first_login", "last_login", "current_level")
+LEVEL_STATE_FIELDS = ("id", "current_level", "points", "boost_mask")
+
+
+@dataclass
+class BulkResult:
+    """
+    Итог массовой операции над игроками.
+    changed - количество изменённых игроков по исходу (например, по новому уровню),
+    errors - количество пропущенных игроков по тексту ошибки.
+    """
+
+    changed: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def changed_total(self):
+        return sum(self.changed.values())
+
+    def add_errors(self, errors):
+        self.errors.update({message: count for message, count in errors.items() if count})
+
+
+def _case_sql(value_sql, mapping, default="NULL"):
+    """
+    SQL-выражение CASE по словарю {значение: результат}.
+    """
+    whens = " ".join("WHEN %s THEN %s" for _ in mapping)
+    params = [value for item in mapping.items() for value in item]
+    return f"CASE {value_sql} {whens} ELSE {default} END", params
+
+
+def _boost_case_sql(level_sql):
+    """
+    SQL-выражение CASE, возвращающее тип буста за уровень.
+    """
+    return _case_sql(level_sql, BOOSTS_BY_LEVEL)
+
+
+def _boost_bit_case_sql(level_sql):
+    """
+    SQL-выражение CASE, возвращающее бит буста за уровень (0 для уровня без буста).
+    """
+    return _case_sql(level_sql, {level: BOOST_BITS[boost_type] for level, boost_type in BOOSTS_BY_LEVEL.items()}, 0)
+
+
+def masks_with_boost(boost_type):
+    """
+    Все значения маски, в которых установлен бит буста.
+    Фильтр boost_mask IN (...) обслуживается обычным B-tree индексом, в отличие от boost_mask & bit.
+    """
+    bit = BOOST_BITS[boost_type]
+    return [mask for mask in range(ALL_BOOSTS_MASK + 1) if mask & bit]
+
+
+def _boost_update_fields(is_active):
+    """
+    Поля буста, обновляемые при конфликте: выдача обновляет даты, деактивация - только статус.
+    """
+    return ["awarded_at", "expires_at", "is_active"] if is_active else ["is_active"]
+
+
+def _upsert_boosts_sql(source_sql, level_sql, now, is_active, expires_at=None):
+    """
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE бустов за уровень для игроков из source_sql.
+    SQL-аналог BoostQuerySet.award для массовых операций внутри одного запроса.
+    """
+    boost_case, params = _boost_case_sql(level_sql)
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in _boost_update_fields(is_active))
+    sql = f"""
+        INSERT INTO {Boost._meta.db_table} (player_id, boost_type, awarded_at, expires_at, is_active)
+        SELECT id, {boost_case}, %s, %s::timestamptz, %s FROM {source_sql}
+        ON CONFLICT (player_id, boost_type) DO UPDATE SET {updates}
+    """
+    return sql, [*params, now, expires_at, is_active]
+
+
+def _utc_date(value):
+    return value.astimezone(UTC).date()
+
+
+def _login_credit_q(now):
+    """
+    Условие начисления очков за логин: игрок ещё не заходил в текущий день.
+    """
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return Q(last_login__isnull=True) | Q(last_login__lt=day_start)
+
+
+class PlayerQuerySet(QuerySet):
+    """
+    Массовые операции над игроками.
+    Каждая операция выполняется фиксированным числом запросов, независимо от количества выбранных игроков.
+    """
+
+    def _pk_subquery_sql(self):
+        return self.order_by().values("pk").query.sql_with_params()
+
+    def _fetch(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _update_sql(self, values):
+        query = self.query.chain(UpdateQuery)
+        query.add_update_values(values)
+        return query.get_compiler(self.db).as_sql()
+
+    def _update_with_login_events(self, now, **values):
+        """
+        UPDATE выборки с записью события входа по каждому обновлённому игроку в том же запросе.
+        Возвращает количество обновлённых игроков.
+        """
+        try:
+            sql, params = self._update_sql(values)
+        except EmptyResultSet:
+            return 0
+        events_sql, events_params = LoginEvent.objects.using(self.db)._insert_sql("updated", now)
+        sql = f"""
+            WITH updated AS (
+                {sql} RETURNING id, first_login
+            ), events AS (
+                {events_sql}
+            )
+            SELECT COUNT(*) FROM updated
+        """
+        return self._fetch(sql, [*params, *events_params])[0][0]
+
+    def update_returning(self, fields, **values):
+        """
+        UPDATE выборки с возвратом новых значений полей через RETURNING.
+        Возвращает список словарей {поле: значение} по обновлённым строкам.
+        """
+        sql, params = self._update_sql(values)
+        connection = connections[self.db]
+        columns = ", ".join(connection.ops.quote_name(self.model._meta.get_field(name).column) for name in fields)
+        return [dict(zip(fields, row, strict=True)) for row in self._fetch(f"{sql} RETURNING {columns}", params)]
+
+    def with_boost(self, boost_type):
+        """
+        Игроки с активным бустом, без JOIN к таблице бустов.
+        """
+        return self.filter(boost_mask__in=masks_with_boost(boost_type))
+
+    def sync_boost_mask(self):
+        """
+        Пересчёт маски бустов по активным бустам одним UPDATE.
+        Нужен для игроков, созданных до появления маски.
+        """
+        bit_sql, bit_params = _case_sql("boost_type", BOOST_BITS, 0)
+        subquery, subquery_params = self._pk_subquery_sql()
+        player_table = Player._meta.db_table
+        sql = f"""
+            UPDATE {player_table}
+            SET boost_mask = COALESCE(
+                (
+                    SELECT BIT_OR({bit_sql}) FROM {Boost._meta.db_table}
+                    WHERE player_id = {player_table}.id AND is_active
+                ),
+                0
+            )
+            WHERE id IN ({subquery})
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [*bit_params, *subquery_params])
+            return cursor.rowcount
+
+    def login_returning(self, now=None):
+        """
+        Логин игроков выборки одним условным UPDATE.
+        Проверка "не чаще раза в сутки" и начисление очков выполняются в базе через F(),
+        поэтому конкурентные логины одного игрока не теряют обновления.
+        Возвращает новое состояние игроков (LOGIN_STATE_FIELDS).
+        События входа записываются в журнал пачками после коммита.
+        """
+        now = now or timezone.now()
+        credit = _login_credit_q(now)
+        states = self.update_returning(
+            LOGIN_STATE_FIELDS,
+            points=Case(
+                When(credit, then=F("points") + LOGIN_POINTS),
+                default=F("points"),
+                output_field=PositiveIntegerField(),
+            ),
+            login_days_count=Case(
+                When(credit, then=F("login_days_count") + 1),
+                default=F("login_days_count"),
+                output_field=PositiveIntegerField(),
+            ),
+            first_login=Coalesce("first_login", Value(now)),
+            last_login=now,
+            updated_at=now,
+        )
+        LoginEvent.objects.using(self.db).record(states, now)
+        return states
+
+    @measure("service", "tests1.PlayerQuerySet.login")
+    def login(self, now=None):
+        """
+        Логин всех игроков выборки.
+        Очки и день входа начисляются только тем, кто ещё не заходил в текущий день.
+        События входа записываются в журнал теми же запросами, без буфера.
+        """
+        now = now or timezone.now()
+        credit = _login_credit_q(now)
+        result = BulkResult()
+        LoginEvent.objects.using(self.db).ensure_partitions([_utc_date(now)])
+        with transaction.atomic(using=self.db):
+            result.changed["repeated"] = self.exclude(credit)._update_with_login_events(
+                now,
+                last_login=now,
+                updated_at=now,
+            )
+            result.changed["credited"] = self.filter(credit)._update_with_login_events(
+                now,
+                points=F("points") + LOGIN_POINTS,
+                login_days_count=F("login_days_count") + 1,
+                first_login=Coalesce("first_login", Value(now)),
+                last_login=now,
+                updated_at=now,
+            )
+        return result
+
+    def _level_up_sql(self, expires_at):
+        """
+        CTE updated: повышение уровня игроков выборки одним условным UPDATE, очки и маска бустов
+        считаются в базе от текущих значений. CTE awarded выдаёт буст за новый уровень.
+        """
+        now = timezone.now()
+        subquery, subquery_params = self._pk_subquery_sql()
+        awarded_sql, awarded_params = _upsert_boosts_sql(
+            "updated", "current_level", now, is_active=True, expires_at=expires_at
+        )
+        bit_sql, bit_params = _boost_bit_case_sql("current_level + 1")
+        sql = f"""
+            WITH updated AS (
+                UPDATE {Player._meta.db_table}
+                SET current_level = current_level + 1,
+                    points = points + CASE WHEN current_level + 1 = %s THEN %s ELSE 0 END,
+                    boost_mask = boost_mask | {bit_sql},
+                    updated_at = %s
+                WHERE id IN ({subquery}) AND last_login IS NOT NULL AND current_level < %s
+                RETURNING id, current_level, points, boost_mask
+            ), awarded AS (
+                {awarded_sql}
+            )
+        """
+        params = [MAX_LEVEL, MAX_LEVEL_POINTS, *bit_params, now, *subquery_params, MAX_LEVEL, *awarded_params]
+        return sql, params
+
+    def level_up_returning(self, expires_at=None):
+        """
+        Повышение уровня игроков выборки одним запросом с выдачей буста за новый уровень.
+        Возвращает новое состояние повышенных игроков (LEVEL_STATE_FIELDS), игроки без входа
+        и на максимальном уровне пропускаются.
+        """
+        try:
+            sql, params = self._level_up_sql(expires_at)
+        except EmptyResultSet:
+            return []
+        columns = ", ".join(LEVEL_STATE_FIELDS)
+        return [
+            dict(zip(LEVEL_STATE_FIELDS, row, strict=True))
+            for row in self._fetch(f"{sql} SELECT {columns} FROM updated", params)
+        ]
+
+    @measure("service", "tests1.PlayerQuerySet.level_up")
+    def level_up(self, expires_at=None):
+        """
+        Повышение уровня всех игроков выборки с выдачей буста за новый уровень.
+        expires_at - дата окончания выданных бустов, по умолчанию бессрочные.
+        """
+        sql, params = self._level_up_sql(expires_at)
+        result = BulkResult()
+        with transaction.atomic(using=self.db):
+            errors = self.aggregate(
+                not_logged_in=Count("pk", filter=Q(last_login__isnull=True)),
+                max_level=Count("pk", filter=Q(last_login__isnull=False, current_level__gte=MAX_LEVEL)),
+            )
+            result.add_errors({NOT_LOGGED_IN_ERROR: errors["not_logged_in"], MAX_LEVEL_ERROR: errors["max_level"]})
+            result.changed.update(
+                dict(self._fetch(f"{sql} SELECT current_level, COUNT(*) FROM updated GROUP BY current_level", params))
+            )
+        return result
+
+    @measure("service", "tests1.PlayerQuerySet.level_down")
+    def level_down(self, expires_at=None):
+        """
+        Понижение уровня всех игроков выборки.
+        Буст за прежний уровень деактивируется, буст за новый уровень выдаётся заново,
+        при понижении с максимального уровня снимаются бонусные очки.
+        expires_at - дата окончания заново выданных бустов, по умолчанию бессрочные.
+        """
+        now = timezone.now()
+        subquery, subquery_params = self._pk_subquery_sql()
+        deactivated_sql, deactivated_params = _upsert_boosts_sql("updated", "current_level + 1", now, is_active=False)
+        awarded_sql, awarded_params = _upsert_boosts_sql(
+            "updated WHERE current_level > 0", "current_level", now, is_active=True, expires_at=expires_at
+        )
+        removed_bit_sql, removed_bit_params = _boost_bit_case_sql("current_level")
+        awarded_bit_sql, awarded_bit_params = _boost_bit_case_sql("current_level - 1")
+        sql = f"""
+            WITH updated AS (
+                UPDATE {Player._meta.db_table}
+                SET current_level = current_level - 1,
+                    points = CASE WHEN current_level = %s THEN GREATEST(points - %s, 0) ELSE points END,
+                    boost_mask = (boost_mask & ~{removed_bit_sql}) | {awarded_bit_sql},
+                    updated_at = %s
+                WHERE id IN ({subquery}) AND current_level > 0
+                RETURNING id, current_level
+            ), deactivated AS (
+                {deactivated_sql}
+            ), awarded AS (
+                {awarded_sql}
+            )
+            SELECT current_level, COUNT(*) FROM updated GROUP BY current_level
+        """
+        params = [
+            MAX_LEVEL,
+            MAX_LEVEL_POINTS,
+            *removed_bit_params,
+            *awarded_bit_params,
+            now,
+            *subquery_params,
+            *deactivated_params,
+            *awarded_params,
+        ]
+        result = BulkResult()
+        with transaction.atomic(using=self.db):
+            result.add_errors({MIN_LEVEL_ERROR: self.filter(current_level=0).count()})
+            result.changed.update(dict(self._fetch(sql, params)))
+        return result
+
 
 class Player(Model):
     """
@@ -55,57 +442,139 @@ class Player(Model):
         verbose_name="Текущий уровень",
         help_text="Текущий уровень",
         validators=[
-            MaxValueValidator(3),
+            MaxValueValidator(MAX_LEVEL),
         ],
     )
+    boost_mask = PositiveSmallIntegerField(
+        default=0,
+        db_index=True,
+        verbose_name="Активные бусты",
+        help_text="Битовая маска активных бустов, поддерживается при выдаче и снятии бустов",
+    )
+
+    objects = PlayerQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Игрок"
         verbose_name_plural = "Игроки"
+        indexes = [
+            # Таблица лидеров: порядок по очкам и обход соседей без чтения таблицы игроков
+            Index(fields=["points", "id"], name="player_leaderboard_idx", include=["username", "current_level"]),
+        ]
 
     def __str__(self):
         return self.username
 
-    def handle_login(self):
-        now = timezone.now()
-        if self.first_login is None:
-            self.first_login = now
-        if not self.last_login or (now.date() > self.last_login.date()):
-            self.points += 10
-            self.login_days_count += 1
-        self.last_login = now
-        self.save()
-
-    def award_boost(self, boost_type):
-        # Удаляем существующий буст с тем же boost_type
-        self.boosts.filter(boost_type=boost_type).delete()
-        # Создаём новый буст
-        Boost.objects.create(
-            player=self,
-            boost_type=boost_type,
-            is_active=True,
-        )
+    @measure("service", "tests1.Player.handle_login")
+    def handle_login(self, now=None):
+        """
+        Логин игрока. Обновляются только изменившиеся поля, новое состояние берётся из базы.
+        """
+        for state in Player.objects.filter(pk=self.pk).login_returning(now):
+            for name, value in state.items():
+                setattr(self, name, value)
+
+    def has_boost(self, boost_type):
+        return bool(self.boost_mask & BOOST_BITS[boost_type])
 
-    def complete_level(self):
-        if self.last_login is None:
-            raise ValueError("Игроку нельзя повысить уровень, так как он не заходил в игру.")
-        if self.current_level >= 3:
-            raise ValueError("Игрок достиг максимального уровня.")
-        self.current_level += 1
-        boosts_map = {
-            1: BoostTypeChoices.X2_GOLD,
-            2: BoostTypeChoices.X2_EXP,
-            3: BoostTypeChoices.GOD_MODE,
-        }
-        boost_type = boosts_map.get(self.current_level)
-        if boost_type:
-            self.award_boost(boost_type)
-        if self.current_level == 3:
-            self.points += 100
-        self.save()
+    @measure("service", "tests1.Player.award_boost")
+    def award_boost(self, boost_type, expires_at=None):
+        Boost.objects.award([(self.pk, boost_type)], expires_at=expires_at)
+        self.boost_mask |= BOOST_BITS[boost_type]
+
+    @measure("service", "tests1.Player.complete_level")
+    def complete_level(self, expires_at=None):
+        """
+        Повышение уровня игрока одним условным UPDATE: проверки, бонус за максимальный уровень и маска бустов
+        считаются в базе, поэтому параллельные изменения игрока не перезаписываются значениями из памяти.
+        """
+        states = Player.objects.filter(pk=self.pk).level_up_returning(expires_at)
+        if not states:
+            # Уровень не повышен: причина определяется по текущему состоянию игрока в базе
+            self.refresh_from_db(fields=["last_login", "current_level"])
+            raise ValueError(NOT_LOGGED_IN_ERROR if self.last_login is None else MAX_LEVEL_ERROR)
+        for name, value in states[0].items():
+            setattr(self, name, value)
         return True
 
 
+def _update_boost_masks(pairs, is_active, batch_size, using):
+    """
+    Установка или сброс битов маски бустов: один UPDATE на тип буста и пачку игроков.
+    """
+    players_by_type = {}
+    for player_id, boost_type in pairs:
+        players_by_type.setdefault(boost_type, []).append(player_id)
+    for boost_type, player_ids in players_by_type.items():
+        bit = BOOST_BITS[boost_type]
+        mask = F("boost_mask").bitor(bit) if is_active else F("boost_mask").bitand(ALL_BOOSTS_MASK ^ bit)
+        for start in range(0, len(player_ids), batch_size):
+            Player.objects.using(using).filter(pk__in=player_ids[start : start + batch_size]).update(boost_mask=mask)
+
+
+class BoostQuerySet(QuerySet):
+    @measure("service", "tests1.BoostQuerySet.award")
+    def award(self, pairs, is_active=True, expires_at=None, batch_size=BOOST_BATCH_SIZE):
+        """
+        Выдача бустов по парам (player_id, boost_type) одним INSERT ... ON CONFLICT DO UPDATE на пачку.
+        Существующий буст не пересоздаётся: обновляются даты выдачи и окончания и статус.
+        С is_active=False бусты деактивируются, даты сохраняются.
+        """
+        pairs = list(dict.fromkeys(pairs))
+        boosts = [
+            Boost(player_id=player_id, boost_type=boost_type, expires_at=expires_at, is_active=is_active)
+            for player_id, boost_type in pairs
+        ]
+        with transaction.atomic(using=self.db):
+            boosts = self.bulk_create(
+                boosts,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["player", "boost_type"],
+                update_fields=_boost_update_fields(is_active),
+            )
+            _update_boost_masks(pairs, is_active, batch_size, using=self.db)
+        return boosts
+
+    def deactivate(self, pairs, batch_size=BOOST_BATCH_SIZE):
+        return self.award(pairs, is_active=False, batch_size=batch_size)
+
+    @measure("service", "tests1.BoostQuerySet.expire_due")
+    def expire_due(self, now=None, batch_size=BOOST_BATCH_SIZE):
+        """
+        Деактивация одной пачки истёкших бустов со сбросом их битов в масках игроков.
+        Выборка идёт по частичному индексу активных бустов со сроком, поэтому стоимость
+        зависит только от числа истёкших бустов. Заблокированные строки пропускаются,
+        что позволяет запускать несколько обработчиков параллельно.
+        Возвращает количество деактивированных бустов.
+        """
+        now = now or timezone.now()
+        bit_sql, bit_params = _case_sql("boost_type", BOOST_BITS, 0)
+        boost_table = Boost._meta.db_table
+        player_table = Player._meta.db_table
+        sql = f"""
+            WITH due AS (
+                SELECT id FROM {boost_table}
+                WHERE is_active AND expires_at IS NOT NULL AND expires_at <= %s
+                ORDER BY expires_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ), expired AS (
+                UPDATE {boost_table} SET is_active = FALSE
+                FROM due WHERE {boost_table}.id = due.id
+                RETURNING {boost_table}.player_id, {boost_table}.boost_type
+            ), masks AS (
+                UPDATE {player_table} SET boost_mask = {player_table}.boost_mask & ~bits.mask
+                FROM (SELECT player_id, BIT_OR({bit_sql}) AS mask FROM expired GROUP BY player_id) AS bits
+                WHERE {player_table}.id = bits.player_id
+            )
+            SELECT COUNT(*) FROM expired
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [now, batch_size, *bit_params])
+            return cursor.fetchone()[0]
+
+
 class Boost(Model):
     """
     Модель буста.
@@ -133,11 +602,295 @@ class Boost(Model):
         verbose_name="Статус буста",
         help_text="Выберите статус буста",
     )
+    expires_at = DateTimeField(
+        verbose_name="Дата окончания",
+        help_text="Оставьте пустым для бессрочного буста",
+        **NULLABLE,
+    )
+
+    objects = BoostQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Буст"
         verbose_name_plural = "Бусты"
         unique_together = ["player", "boost_type"]
+        indexes = [
+            # Только активные бусты со сроком: по нему работает expire_due
+            Index(
+                fields=["expires_at"],
+                name="boost_active_expiry_idx",
+                condition=Q(is_active=True, expires_at__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"У {self.player.username} - {self.get_boost_type_display()}"
+
+
+class LeaderboardBucket(Model):
+    """
+    Количество игроков с данным количеством очков для рангов таблицы лидеров.
+    Строки только добавляются триггером на таблицу игроков (+N и -N при изменении очков),
+    без блокировок общей строки, и периодически сворачиваются в одну строку на значение очков.
+    """
+
+    points = PositiveIntegerField(
+        verbose_name="Количество очков",
+    )
+    players = IntegerField(
+        verbose_name="Изменение количества игроков",
+    )
+
+    class Meta:
+        verbose_name = "Корзина таблицы лидеров"
+        verbose_name_plural = "Корзины таблицы лидеров"
+        indexes = [
+            # Сумма игроков выше заданных очков читается только из индекса
+            Index(fields=["points"], name="leaderboard_bucket_points_idx", include=["players"]),
+        ]
+
+    def __str__(self):
+        return f"{self.points}: {self.players:+}"
+
+
+class LoginEventQuerySet(QuerySet):
+    """
+    Журнал входов: таблица, секционированная по суткам UTC, с хранением LOGIN_EVENT_RETENTION_DAYS суток.
+    Таблица и партиции создаются SQL-запросами, Django их не описывает.
+    """
+
+    def _partition(self, day):
+        return f"{self.model._meta.db_table}_{day:%Y%m%d}"
+
+    def create_table(self):
+        """
+        Создать секционированную таблицу и партиции на сегодня и LOGIN_EVENT_PARTITIONS_AHEAD суток вперёд.
+        Без первичного ключа и индексов: журнал только пополняется и читается целыми сутками при сводке.
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.model._meta.db_table} (
+                    id bigint GENERATED BY DEFAULT AS IDENTITY,
+                    player_id bigint NOT NULL,
+                    logged_at timestamp with time zone NOT NULL,
+                    cohort date NOT NULL
+                ) PARTITION BY RANGE (logged_at)
+                """
+            )
+        today = _utc_date(timezone.now())
+        self.ensure_partitions(today + timedelta(days) for days in range(LOGIN_EVENT_PARTITIONS_AHEAD + 1))
+
+    def partition_days(self):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass",
+                [self.model._meta.db_table],
+            )
+            return sorted(datetime.strptime(name[-8:], "%Y%m%d").date() for (name,) in cursor.fetchall())
+
+    def ensure_partitions(self, days):
+        """
+        Создать недостающие партиции суток. Созданные партиции запоминаются в процессе после коммита:
+        партиция, созданная во внешней транзакции, пропадает при её откате.
+        """
+        for day in sorted(set(days) - _login_event_partitions.get(self.db, set())):
+            start = datetime.combine(day, day_time.min, tzinfo=UTC)
+            sql = (
+                f"CREATE TABLE IF NOT EXISTS {self._partition(day)} PARTITION OF {self.model._meta.db_table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{(start + timedelta(days=1)).isoformat()}')"
+            )
+            try:
+                with transaction.atomic(using=self.db), connections[self.db].cursor() as cursor:
+                    cursor.execute(sql)
+            except DatabaseError:
+                # Ту же партицию одновременно мог создать другой процесс
+                if day not in self.partition_days():
+                    raise
+            transaction.on_commit(partial(_login_event_partitions.setdefault(self.db, set()).add, day), using=self.db)
+
+    def drop_partitions(self, before):
+        """
+        Удалить партиции суток раньше before. Возвращает удалённые сутки.
+        Непустая партиция удаляется, только если сутки есть в LoginRollup и сведены не последними:
+        последние сведённые сутки могли сводиться до их окончания, и события после сводки ещё не учтены.
+        """
+        days = [day for day in self.partition_days() if day < before]
+        rollups = LoginRollup.objects.using(self.db)
+        last = rollups.aggregate(day=Max("day"))["day"]
+        rolled = set(rollups.filter(day__in=days).values_list("day", flat=True).distinct()) if last else set()
+        dropped = []
+        with connections[self.db].cursor() as cursor:
+            for day in days:
+                if day not in rolled or day >= last:
+                    cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {self._partition(day)})")
+                    if cursor.fetchone()[0]:
+                        continue
+                cursor.execute(f"DROP TABLE {self._partition(day)}")
+                dropped.append(day)
+        _login_event_partitions.pop(self.db, None)
+        return dropped
+
+    def record(self, states, now):
+        """
+        Записать входы игроков (состояния после логина) пачкой после коммита текущей транзакции.
+        """
+        _login_event_writer.add(
+            [(state["id"], now, _utc_date(state["first_login"])) for state in states], using=self.db
+        )
+
+    def flush(self):
+        """
+        Записать накопленные в процессе события входа, не дожидаясь пачки.
+        """
+        _login_event_writer.flush()
+
+    def _insert_sql(self, source_sql, now):
+        """
+        INSERT ... SELECT событий входа игроков из source_sql со столбцами id и first_login.
+        """
+        sql = f"""
+            INSERT INTO {self.model._meta.db_table} (player_id, logged_at, cohort)
+            SELECT id, %s, (first_login AT TIME ZONE 'UTC')::date FROM {source_sql}
+        """
+        return sql, [now]
+
+
+class LoginEvent(Model):
+    """
+    Событие входа игрока. cohort - сутки первого входа игрока (UTC) для когорт и удержания.
+    """
+
+    player = ForeignKey(
+        Player,
+        on_delete=DO_NOTHING,
+        db_constraint=False,
+        verbose_name="Игрок",
+        related_name="login_events",
+    )
+    logged_at = DateTimeField(
+        verbose_name="Дата входа",
+    )
+    cohort = DateField(
+        verbose_name="День первого входа",
+    )
+
+    objects = LoginEventQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Вход игрока"
+        verbose_name_plural = "Входы игроков"
+        # Секционированная таблица создаётся LoginEventQuerySet.create_table после migrate
+        managed = False
+
+    def __str__(self):
+        return f"{self.player_id}: {self.logged_at}"
+
+
+# База -> сутки, партиции которых уже созданы
+_login_event_partitions = {}
+_login_event_writer = BatchWriter(
+    LoginEvent._meta.db_table,
+    ("player_id", "logged_at", "cohort"),
+    LOGIN_EVENT_BATCH_SIZE,
+    LOGIN_EVENT_FLUSH_INTERVAL,
+    prepare=lambda rows, using: LoginEvent.objects.using(using).ensure_partitions(
+        {_utc_date(logged_at) for _, logged_at, _ in rows}
+    ),
+)
+
+
+class LoginRollupQuerySet(QuerySet):
+    def rollup(self, start, end):
+        """
+        Пересчитать сводки за сутки с start по end включительно по журналу входов.
+        Читаются только партиции этих суток. Возвращает количество строк сводки.
+        """
+        since = datetime.combine(start, day_time.min, tzinfo=UTC)
+        until = datetime.combine(end + timedelta(days=1), day_time.min, tzinfo=UTC)
+        sql = f"""
+            INSERT INTO {self.model._meta.db_table} (day, cohort, players, logins)
+            SELECT (logged_at AT TIME ZONE 'UTC')::date, cohort, COUNT(DISTINCT player_id), COUNT(*)
+            FROM {LoginEvent._meta.db_table}
+            WHERE logged_at >= %s AND logged_at < %s
+            GROUP BY 1, 2
+        """
+        with transaction.atomic(using=self.db):
+            self.filter(day__range=(start, end)).delete()
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, [since, until])
+                return cursor.rowcount
+
+    def daily_active(self, start, end):
+        """
+        По суткам: активные игроки (DAU), новые игроки (первый вход в эти сутки) и входы.
+        """
+        return list(
+            self.filter(day__range=(start, end))
+            .values("day")
+            .annotate(
+                active_players=Sum("players"),
+                new_players=Coalesce(Sum("players", filter=Q(cohort=F("day"))), 0),
+                total_logins=Sum("logins"),
+            )
+            .order_by("day")
+        )
+
+    def cohorts(self, start, end, days):
+        """
+        Когорты по суткам первого входа с start по end: размер когорты, активные игроки когорты
+        через 0..days суток после первого входа (но не позже сегодня) и их доля от размера когорты (удержание).
+        Когорты, первый вход которых не попал в журнал, пропускаются.
+        """
+        rows = self.filter(
+            cohort__range=(start, end), day__gte=F("cohort"), day__lte=F("cohort") + timedelta(days)
+        ).values_list("cohort", "day", "players")
+        retained = {}
+        for cohort, day, players in rows:
+            retained.setdefault(cohort, [0] * (days + 1))[(day - cohort).days] = players
+        # Сутки, которые для когорты ещё не наступили, не показываются
+        today = _utc_date(timezone.now())
+        retained = {cohort: counts[: (today - cohort).days + 1] for cohort, counts in retained.items()}
+        return [
+            {
+                "cohort": cohort,
+                "players": counts[0],
+                "retained": counts,
+                "retention": [round(count / counts[0], 4) for count in counts],
+            }
+            for cohort, counts in sorted(retained.items())
+            if counts[0]
+        ]
+
+
+class LoginRollup(Model):
+    """
+    Сводка журнала входов за сутки по когорте: сколько игроков когорты заходили и сколько было входов.
+    Строится командой maintain_login_events и хранится дольше самого журнала.
+    """
+
+    day = DateField(
+        verbose_name="Сутки",
+    )
+    cohort = DateField(
+        verbose_name="День первого входа",
+    )
+    players = PositiveIntegerField(
+        verbose_name="Активные игроки",
+    )
+    logins = PositiveIntegerField(
+        verbose_name="Входы",
+    )
+
+    objects = LoginRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Сводка входов"
+        verbose_name_plural = "Сводки входов"
+        unique_together = ["day", "cohort"]
+        indexes = [
+            Index(fields=["cohort", "day"], name="login_rollup_cohort_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} ({self.cohort}): {self.players}"
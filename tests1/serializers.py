@@ -0,0 +1,87 @@
+from rest_framework.serializers import (
+    DateField,
+    FloatField,
+    IntegerField,
+    ListField,
+    ModelSerializer,
+    Serializer,
+    URLField,
+)
+
+from tests1.leaderboard import LEADERBOARD_FIELDS
+from tests1.models import LOGIN_STATE_FIELDS, Player
+
+
+class PlayerLoginSerializer(ModelSerializer):
+    """
+    Состояние игрока после логина.
+    """
+
+    class Meta:
+        model = Player
+        fields = LOGIN_STATE_FIELDS
+        read_only_fields = LOGIN_STATE_FIELDS
+
+
+class LeaderboardEntrySerializer(ModelSerializer):
+    """
+    Игрок в таблице лидеров. Игроки с равными очками делят ранг.
+    """
+
+    rank = IntegerField(read_only=True)
+
+    class Meta:
+        model = Player
+        fields = (*LEADERBOARD_FIELDS, "rank")
+        read_only_fields = LEADERBOARD_FIELDS
+
+
+class LeaderboardPageSerializer(Serializer):
+    """
+    Страница таблицы лидеров со ссылкой на следующую.
+    """
+
+    next = URLField(allow_null=True)
+    results = LeaderboardEntrySerializer(many=True)
+
+
+class PlayerRankSerializer(Serializer):
+    """
+    Ранг игрока и его соседи выше и ниже в таблице лидеров.
+    """
+
+    player = LeaderboardEntrySerializer()
+    above = LeaderboardEntrySerializer(many=True)
+    below = LeaderboardEntrySerializer(many=True)
+
+
+class LoginAnalyticsQuerySerializer(Serializer):
+    """
+    Параметры запроса аналитики входов: сутки UTC с start по end включительно.
+    """
+
+    start = DateField(required=False)
+    end = DateField(required=False)
+    days = IntegerField(required=False, min_value=0, max_value=365, default=30)
+
+
+class DailyActiveSerializer(Serializer):
+    """
+    Активные игроки (DAU), новые игроки и входы за сутки.
+    """
+
+    day = DateField()
+    active_players = IntegerField()
+    new_players = IntegerField()
+    total_logins = IntegerField()
+
+
+class CohortSerializer(Serializer):
+    """
+    Когорта первого входа: размер, активные игроки и удержание через 0..days суток.
+    """
+
+    cohort = DateField()
+    players = IntegerField()
+    retained = ListField(child=IntegerField())
+    retention = ListField(child=FloatField())
@@ -0,0 +1,18 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from conts.search import create_trigram_indexes
+from tests1 import leaderboard
+from tests1.models import LoginEvent, Player
+
+
+def create_search_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    create_trigram_indexes([(Player, "username")], using)
+
+
+def create_leaderboard_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    leaderboard.install(using)
+
+
+def create_login_event_table(using=DEFAULT_DB_ALIAS, **kwargs):
+    if connections[using].vendor == "postgresql":
+        LoginEvent.objects.using(using).create_table()
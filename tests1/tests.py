@@ -1 +1,428 @@
-from django.test import TestCase
+import threading
+from datetime import UTC, date, datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from conts.choices import BoostTypeChoices
+from conts.loading import BatchWriter
+from tests1 import leaderboard
+from tests1.models import (
+    BOOST_BITS,
+    LOGIN_POINTS,
+    MAX_LEVEL,
+    MAX_LEVEL_ERROR,
+    MAX_LEVEL_POINTS,
+    MIN_LEVEL_ERROR,
+    NOT_LOGGED_IN_ERROR,
+    Boost,
+    LeaderboardBucket,
+    LoginEvent,
+    LoginRollup,
+    Player,
+)
+
+
+class PlayerLoginTests(TestCase):
+    """
+    Логин начисляет очки и день входа не чаще раза в сутки.
+    """
+
+    def setUp(self):
+        self.player = Player.objects.create(username="player")
+        self.now = datetime(2026, 5, 1, 10, tzinfo=UTC)
+
+    def test_login_returning_credits_once_per_day(self):
+        players = Player.objects.filter(pk=self.player.pk)
+        players.login_returning(self.now)
+        [state] = players.login_returning(self.now + timedelta(hours=5))
+        self.assertEqual(state["points"], LOGIN_POINTS)
+        self.assertEqual(state["login_days_count"], 1)
+        self.assertEqual(state["first_login"], self.now)
+        self.assertEqual(state["last_login"], self.now + timedelta(hours=5))
+
+        [state] = players.login_returning(self.now + timedelta(days=1))
+        self.assertEqual(state["points"], 2 * LOGIN_POINTS)
+        self.assertEqual(state["login_days_count"], 2)
+        self.assertEqual(state["first_login"], self.now)
+
+    def test_bulk_login_credits_only_players_without_login_today(self):
+        other = Player.objects.create(username="other")
+        Player.objects.filter(pk=self.player.pk).login(self.now)
+        result = Player.objects.filter(pk__in=[self.player.pk, other.pk]).login(self.now + timedelta(hours=1))
+        self.assertEqual(result.changed, {"credited": 1, "repeated": 1})
+        self.player.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.player.points, self.player.login_days_count), (LOGIN_POINTS, 1))
+        self.assertEqual((other.points, other.login_days_count), (LOGIN_POINTS, 1))
+
+
+@override_settings(GAME_SERVER_TOKEN="secret")
+class PlayerLoginAPITests(TestCase):
+    """
+    Логин через API доступен только игровым серверам с токеном и начисляет очки раз в сутки UTC.
+    """
+
+    def setUp(self):
+        self.player = Player.objects.create(username="player")
+        self.url = reverse("tests1:player-login", args=(self.player.pk,))
+        self.now = datetime(2026, 5, 1, 10, tzinfo=UTC)
+
+    def login(self, url=None, token="secret", at=None):
+        headers = {"authorization": f"Bearer {token}"} if token else {}
+        with mock.patch("django.utils.timezone.now", return_value=at or self.now):
+            return self.client.post(url or self.url, headers=headers)
+
+    def test_requires_valid_token(self):
+        for token in (None, "wrong", "secret extra"):
+            with self.subTest(token=token):
+                self.assertEqual(self.login(token=token).status_code, 401)
+        with override_settings(GAME_SERVER_TOKEN=""):
+            self.assertEqual(self.login(token="secret").status_code, 401)
+        self.assertEqual(self.client.post(self.url, headers={"authorization": "Token secret"}).status_code, 401)
+        self.player.refresh_from_db()
+        self.assertEqual((self.player.points, self.player.login_days_count), (0, 0))
+
+    def test_valid_token_returns_updated_state(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        state = response.json()
+        self.assertEqual(
+            {name: datetime.fromisoformat(state.pop(name)) for name in ("first_login", "last_login")},
+            {"first_login": self.now, "last_login": self.now},
+        )
+        self.assertEqual(
+            state,
+            {
+                "id": self.player.pk,
+                "username": "player",
+                "points": LOGIN_POINTS,
+                "login_days_count": 1,
+                "current_level": 0,
+            },
+        )
+
+    def test_unknown_player(self):
+        response = self.login(reverse("tests1:player-login", args=(self.player.pk + 1,)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_second_login_same_day_is_not_credited(self):
+        self.login()
+        response = self.login(at=self.now + timedelta(hours=13, minutes=59))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["points"], response.json()["login_days_count"]), (LOGIN_POINTS, 1))
+        self.assertEqual(
+            datetime.fromisoformat(response.json()["last_login"]), self.now + timedelta(hours=13, minutes=59)
+        )
+
+        response = self.login(at=self.now + timedelta(hours=14))
+        self.assertEqual((response.json()["points"], response.json()["login_days_count"]), (2 * LOGIN_POINTS, 2))
+
+
+class PlayerLevelTests(TestCase):
+    """
+    Повышение и понижение уровня: проверки, бонус за максимальный уровень, бусты и их маска.
+    """
+
+    def setUp(self):
+        self.player = Player.objects.create(username="player")
+        self.players = Player.objects.filter(pk=self.player.pk)
+
+    def active_boosts(self):
+        return set(Boost.objects.filter(player=self.player, is_active=True).values_list("boost_type", flat=True))
+
+    def test_level_up_requires_login(self):
+        result = self.players.level_up()
+        self.assertEqual(result.errors, {NOT_LOGGED_IN_ERROR: 1})
+        self.assertEqual(result.changed_total, 0)
+        with self.assertRaisesMessage(ValueError, NOT_LOGGED_IN_ERROR):
+            self.player.complete_level()
+
+    def test_level_up_to_max_level_adds_bonus_once(self):
+        self.player.handle_login()
+        for _ in range(MAX_LEVEL):
+            self.player.complete_level()
+        self.assertEqual(self.player.current_level, MAX_LEVEL)
+        self.assertEqual(self.player.points, LOGIN_POINTS + MAX_LEVEL_POINTS)
+        self.assertEqual(self.active_boosts(), set(BoostTypeChoices.values))
+        self.assertEqual(self.player.boost_mask, sum(BOOST_BITS.values()))
+
+        result = self.players.level_up()
+        self.assertEqual(result.errors, {MAX_LEVEL_ERROR: 1})
+        with self.assertRaisesMessage(ValueError, MAX_LEVEL_ERROR):
+            self.player.complete_level()
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.points, LOGIN_POINTS + MAX_LEVEL_POINTS)
+
+    def test_level_down_from_max_level_removes_bonus_and_boost(self):
+        self.player.handle_login()
+        self.players.level_up()
+        self.players.level_up()
+        self.assertEqual(self.players.level_up().changed, {MAX_LEVEL: 1})
+
+        self.assertEqual(self.players.level_down().changed, {MAX_LEVEL - 1: 1})
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.points, LOGIN_POINTS)
+        self.assertEqual(self.active_boosts(), {BoostTypeChoices.X2_GOLD, BoostTypeChoices.X2_EXP})
+        self.assertFalse(self.player.has_boost(BoostTypeChoices.GOD_MODE))
+        self.assertTrue(self.player.has_boost(BoostTypeChoices.X2_EXP))
+
+    def test_level_down_stops_at_level_zero(self):
+        self.player.handle_login()
+        self.players.level_up()
+        self.players.level_down()
+        result = self.players.level_down()
+        self.assertEqual(result.errors, {MIN_LEVEL_ERROR: 1})
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.current_level, 0)
+        self.assertEqual(self.player.boost_mask, 0)
+        self.assertEqual(self.active_boosts(), set())
+
+
+class BoostMaskTests(TestCase):
+    """
+    Маска бустов игрока совпадает с активными бустами после выдачи, деактивации и истечения.
+    """
+
+    def setUp(self):
+        self.player = Player.objects.create(username="player")
+        self.now = datetime(2026, 5, 1, 10, tzinfo=UTC)
+
+    def assertMaskInSync(self):
+        self.player.refresh_from_db()
+        mask = self.player.boost_mask
+        Player.objects.filter(pk=self.player.pk).sync_boost_mask()
+        self.player.refresh_from_db()
+        self.assertEqual(mask, self.player.boost_mask)
+        active = set(Boost.objects.filter(player=self.player, is_active=True).values_list("boost_type", flat=True))
+        self.assertEqual(mask, sum(BOOST_BITS[boost_type] for boost_type in active))
+
+    def test_award_sets_bits(self):
+        self.player.award_boost(BoostTypeChoices.X2_GOLD)
+        Boost.objects.award([(self.player.pk, BoostTypeChoices.GOD_MODE)])
+        self.assertMaskInSync()
+        self.assertTrue(self.player.has_boost(BoostTypeChoices.GOD_MODE))
+        self.assertFalse(self.player.has_boost(BoostTypeChoices.X2_EXP))
+        self.assertQuerySetEqual(Player.objects.with_boost(BoostTypeChoices.X2_GOLD), [self.player])
+
+    def test_deactivate_clears_bit(self):
+        Boost.objects.award([(self.player.pk, BoostTypeChoices.X2_GOLD), (self.player.pk, BoostTypeChoices.X2_EXP)])
+        Boost.objects.deactivate([(self.player.pk, BoostTypeChoices.X2_GOLD)])
+        self.assertMaskInSync()
+        self.assertEqual(self.player.boost_mask, BOOST_BITS[BoostTypeChoices.X2_EXP])
+        self.assertQuerySetEqual(Player.objects.with_boost(BoostTypeChoices.X2_GOLD), [])
+
+    def test_expire_due_clears_only_expired_bits(self):
+        Boost.objects.award([(self.player.pk, BoostTypeChoices.X2_GOLD)], expires_at=self.now)
+        Boost.objects.award([(self.player.pk, BoostTypeChoices.X2_EXP)], expires_at=self.now + timedelta(days=1))
+        Boost.objects.award([(self.player.pk, BoostTypeChoices.GOD_MODE)])
+        self.assertEqual(Boost.objects.expire_due(self.now), 1)
+        self.assertEqual(Boost.objects.expire_due(self.now), 0)
+        self.assertMaskInSync()
+        self.assertEqual(
+            self.player.boost_mask, BOOST_BITS[BoostTypeChoices.X2_EXP] | BOOST_BITS[BoostTypeChoices.GOD_MODE]
+        )
+
+    def test_sync_boost_mask_repairs_stale_mask(self):
+        Boost.objects.award([(self.player.pk, BoostTypeChoices.X2_EXP)])
+        Player.objects.filter(pk=self.player.pk).update(boost_mask=BOOST_BITS[BoostTypeChoices.X2_GOLD])
+        self.assertEqual(Player.objects.filter(pk=self.player.pk).sync_boost_mask(), 1)
+        self.player.refresh_from_db()
+        self.assertEqual(self.player.boost_mask, BOOST_BITS[BoostTypeChoices.X2_EXP])
+
+
+class LeaderboardTests(TestCase):
+    """
+    Ранг по корзинам совпадает с рангом по ORDER BY points DESC после входов, изменений уровня и удалений.
+    """
+
+    def setUp(self):
+        self.players = [Player.objects.create(username=f"player{number}") for number in range(6)]
+
+    def assertRanksMatch(self):
+        ranks = {}
+        for rank, points in enumerate(Player.objects.order_by("-points").values_list("points", flat=True), 1):
+            ranks.setdefault(points, rank)
+        entries = leaderboard.top(limit=len(self.players))
+        self.assertEqual([entry["rank"] for entry in entries], [ranks[entry["points"]] for entry in entries])
+        for player in Player.objects.all():
+            self.assertEqual(leaderboard.player_rank(player.pk)["player"]["rank"], ranks[player.points])
+
+    def test_ranks_follow_points_changes(self):
+        now = datetime(2026, 5, 1, 10, tzinfo=UTC)
+        Player.objects.filter(pk__in=[player.pk for player in self.players[:4]]).login(now)
+        Player.objects.filter(pk__in=[player.pk for player in self.players[:2]]).login(now + timedelta(days=1))
+        self.assertRanksMatch()
+
+        players = Player.objects.filter(pk__in=[player.pk for player in self.players[2:4]])
+        for _ in range(MAX_LEVEL):
+            players.level_up()
+        self.assertRanksMatch()
+
+        players.level_down()
+        self.players[0].delete()
+        self.players.pop(0)
+        self.assertRanksMatch()
+
+    def test_updates_without_points_change_add_no_bucket_rows(self):
+        leaderboard.compact()
+        buckets = LeaderboardBucket.objects.count()
+        Player.objects.update(boost_mask=BOOST_BITS[BoostTypeChoices.X2_GOLD])
+        Player.objects.update(points=F("points"))
+        self.assertEqual(LeaderboardBucket.objects.count(), buckets)
+
+    def test_compact_keeps_ranks(self):
+        Player.objects.filter(pk=self.players[0].pk).update(points=F("points") + 5)
+        Player.objects.filter(pk=self.players[0].pk).update(points=F("points") + 5)
+        before, after = leaderboard.compact()
+        self.assertLess(after, before)
+        self.assertEqual(LeaderboardBucket.objects.count(), after)
+        self.assertRanksMatch()
+
+
+class LoginEventTests(TestCase):
+    """
+    Журнал входов: партиции, запись событий, суточные сводки и аналитика по ним.
+    """
+
+    def setUp(self):
+        self.players = [Player.objects.create(username=f"player{number}") for number in range(3)]
+        self.day = date(2026, 5, 1)
+
+    def at(self, days, hour=10):
+        return datetime.combine(self.day + timedelta(days), datetime.min.time(), tzinfo=UTC) + timedelta(hours=hour)
+
+    def login(self, players, now):
+        Player.objects.filter(pk__in=[player.pk for player in players]).login(now)
+
+    def login_days(self):
+        """
+        Сутки 0: входят игроки 0 и 1, игрок 0 дважды. Сутки 1: входят все трое, игрок 2 впервые.
+        """
+        self.login(self.players[:2], self.at(0))
+        self.login(self.players[:1], self.at(0, hour=20))
+        self.login(self.players, self.at(1))
+
+    def test_login_creates_partition_and_writes_one_event(self):
+        now = datetime(2030, 1, 15, 10, tzinfo=UTC)
+        self.assertNotIn(now.date(), LoginEvent.objects.partition_days())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.players[0].handle_login(now)
+        LoginEvent.objects.flush()
+        self.assertIn(now.date(), LoginEvent.objects.partition_days())
+        self.assertEqual(
+            list(LoginEvent.objects.values_list("player_id", "logged_at", "cohort")),
+            [(self.players[0].pk, now, now.date())],
+        )
+
+    def test_rollup_counts_distinct_players_per_day_and_cohort(self):
+        self.login_days()
+        self.assertEqual(LoginRollup.objects.rollup(self.day, self.day + timedelta(1)), 3)
+        self.assertEqual(
+            set(LoginRollup.objects.values_list("day", "cohort", "players", "logins")),
+            {
+                (self.day, self.day, 2, 3),
+                (self.day + timedelta(1), self.day, 2, 2),
+                (self.day + timedelta(1), self.day + timedelta(1), 1, 1),
+            },
+        )
+        # Повторная сводка заменяет строки, а не добавляет
+        LoginRollup.objects.rollup(self.day, self.day + timedelta(1))
+        self.assertEqual(LoginRollup.objects.count(), 3)
+
+    def test_drop_partitions_keeps_days_not_rolled_up(self):
+        LoginEvent.objects.ensure_partitions([self.day - timedelta(1)])
+        self.login_days()
+        self.login(self.players[:1], self.at(2))
+
+        self.assertEqual(LoginEvent.objects.drop_partitions(self.day + timedelta(3)), [self.day - timedelta(1)])
+        LoginRollup.objects.rollup(self.day, self.day + timedelta(1))
+        # Последние сведённые сутки могли быть сведены не полностью, сутки 2 не сведены совсем
+        self.assertEqual(LoginEvent.objects.drop_partitions(self.day + timedelta(3)), [self.day])
+        self.assertEqual(
+            set(LoginEvent.objects.dates("logged_at", "day")), {self.day + timedelta(1), self.day + timedelta(2)}
+        )
+
+    def test_analytics_returns_rolled_up_numbers(self):
+        self.login_days()
+        LoginRollup.objects.rollup(self.day, self.day + timedelta(1))
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        period = {"start": self.day, "end": self.day + timedelta(1), "days": 1}
+
+        response = self.client.get(reverse("tests1:analytics-dau"), period)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {"day": "2026-05-01", "active_players": 2, "new_players": 2, "total_logins": 3},
+                {"day": "2026-05-02", "active_players": 3, "new_players": 1, "total_logins": 3},
+            ],
+        )
+
+        response = self.client.get(reverse("tests1:analytics-cohorts"), period)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            [
+                {"cohort": "2026-05-01", "players": 2, "retained": [2, 2], "retention": [1.0, 1.0]},
+                {"cohort": "2026-05-02", "players": 1, "retained": [1, 0], "retention": [1.0, 0.0]},
+            ],
+        )
+
+    def test_analytics_is_staff_only(self):
+        self.client.force_login(User.objects.create_user("player"))
+        for name in ("tests1:analytics-dau", "tests1:analytics-cohorts"):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 403)
+
+
+class BatchWriterTests(TestCase):
+    """
+    Буфер пишет пачку при наборе batch_size, по истечении интервала и при выходе из процесса.
+    """
+
+    def writer(self, interval=60):
+        with mock.patch("conts.loading.atexit.register") as register:
+            writer = BatchWriter("table", ("value",), batch_size=3, interval=interval)
+        register.assert_called_once_with(writer.flush)
+        return writer
+
+    def test_flushes_on_batch_size(self):
+        writer = self.writer()
+        with mock.patch.object(writer, "write") as write, mock.patch.object(writer, "start_flusher"):
+            writer.append([(1,), (2,)], "default")
+            write.assert_not_called()
+            writer.append([(3,)], "default")
+            write.assert_called_once_with([(1,), (2,), (3,)], "default")
+        self.assertEqual(writer.buffers, {"default": []})
+
+    def test_flushes_on_interval(self):
+        writer = self.writer()
+        with mock.patch.object(writer, "write") as write, mock.patch.object(writer, "start_flusher"):
+            writer.append([(1,)], "default")
+            write.assert_not_called()
+            with mock.patch("conts.loading.time.monotonic", return_value=writer.written_at + writer.interval):
+                writer.append([(2,)], "default")
+            write.assert_called_once_with([(1,), (2,)], "default")
+
+    def test_background_thread_flushes_idle_buffer(self):
+        writer = self.writer(interval=0.05)
+        written = threading.Event()
+        with (
+            mock.patch.object(writer, "write", side_effect=lambda rows, using: written.set()) as write,
+            mock.patch("conts.loading.connections.close_all"),
+        ):
+            writer.append([(1,)], "default")
+            self.assertTrue(written.wait(5))
+        write.assert_called_once_with([(1,)], "default")
+
+    def test_flush_at_exit_writes_every_database(self):
+        writer = self.writer()
+        with mock.patch.object(writer, "write") as write, mock.patch.object(writer, "start_flusher"):
+            writer.append([(1,)], "default")
+            writer.append([(2,)], "other")
+            writer.flush()
+        write.assert_has_calls([mock.call([(1,)], "default"), mock.call([(2,)], "other")])
+        self.assertEqual(writer.buffers, {})
@@ -0,0 +1,20 @@
+from django.urls import path
+
+from tests1.apps import Tests1Config
+from tests1.views import (
+    CohortsAPIView,
+    DailyActiveAPIView,
+    LeaderboardAPIView,
+    PlayerLoginAPIView,
+    PlayerRankAPIView,
+)
+
+app_name = Tests1Config.name
+
+urlpatterns = [
+    path("players/<int:pk>/login/", PlayerLoginAPIView.as_view(), name="player-login"),
+    path("players/<int:pk>/rank/", PlayerRankAPIView.as_view(), name="player-rank"),
+    path("leaderboard/", LeaderboardAPIView.as_view(), name="leaderboard"),
+    path("analytics/dau/", DailyActiveAPIView.as_view(), name="analytics-dau"),
+    path("analytics/cohorts/", CohortsAPIView.as_view(), name="analytics-cohorts"),
+]
@@ -0,0 +1,150 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from conts.authentication import GameServerAuthentication
+from tests1 import leaderboard
+from tests1.models import LoginRollup, Player
+from tests1.serializers import (
+    CohortSerializer,
+    DailyActiveSerializer,
+    LeaderboardPageSerializer,
+    LoginAnalyticsQuerySerializer,
+    PlayerLoginSerializer,
+    PlayerRankSerializer,
+)
+
+
+def _int_param(request, name, default, minimum, maximum):
+    """
+    Целочисленный параметр запроса, ограниченный диапазоном [minimum, maximum].
+    """
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        raise ValidationError({name: "Ожидается целое число."}) from None
+    return max(minimum, min(value, maximum))
+
+
+class PlayerLoginAPIView(APIView):
+    """
+    Логин игрока.
+    Вызывается игровыми серверами на каждый вход, поэтому выполняется одним условным UPDATE
+    без предварительного чтения игрока. Доступен только игровым серверам с токеном GAME_SERVER_TOKEN:
+    токен проверяется без запросов к базе, сессия и CSRF не используются.
+    """
+
+    authentication_classes = (GameServerAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    @extend_schema(request=None, responses=PlayerLoginSerializer)
+    def post(self, request, pk):
+        states = Player.objects.filter(pk=pk).login_returning()
+        if not states:
+            raise NotFound("Игрок не найден.")
+        return Response(PlayerLoginSerializer(Player(**states[0])).data)
+
+
+class LeaderboardAPIView(APIView):
+    """
+    Таблица лидеров по убыванию очков. Первая страница - топ-N игроков (?page_size=),
+    следующие страницы выбираются по курсору из ссылки next, поэтому скорость не зависит от глубины страницы.
+    """
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "page_size", int, description=f"Игроков на странице, до {leaderboard.LEADERBOARD_MAX_PAGE_SIZE}"
+            ),
+            OpenApiParameter("cursor", str, description="Курсор из ссылки next"),
+        ],
+        responses=LeaderboardPageSerializer,
+    )
+    def get(self, request):
+        page_size = _int_param(
+            request, "page_size", leaderboard.LEADERBOARD_PAGE_SIZE, 1, leaderboard.LEADERBOARD_MAX_PAGE_SIZE
+        )
+        after = self.decode_cursor(request.query_params.get("cursor"))
+        entries = leaderboard.top(page_size, after=after)
+        next_url = None
+        if len(entries) == page_size:
+            cursor = f"{entries[-1]['points']}.{entries[-1]['id']}"
+            next_url = replace_query_param(request.build_absolute_uri(), "cursor", cursor)
+        return Response(LeaderboardPageSerializer({"next": next_url, "results": entries}).data)
+
+    def decode_cursor(self, cursor):
+        """
+        Курсор "очки.id" последнего игрока предыдущей страницы.
+        """
+        if cursor is None:
+            return None
+        points, _, player_id = cursor.partition(".")
+        if not points.isdigit() or not player_id.isdigit():
+            raise NotFound("Неверный курсор.")
+        return int(points), int(player_id)
+
+
+class PlayerRankAPIView(APIView):
+    """
+    Ранг игрока в таблице лидеров и ?neighbours= игроков выше и ниже него.
+    Ранг считается по корзинам очков, без сортировки всех игроков.
+    """
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "neighbours", int, description=f"Соседей с каждой стороны, до {leaderboard.LEADERBOARD_MAX_NEIGHBOURS}"
+            )
+        ],
+        responses=PlayerRankSerializer,
+    )
+    def get(self, request, pk):
+        neighbours = _int_param(request, "neighbours", 0, 0, leaderboard.LEADERBOARD_MAX_NEIGHBOURS)
+        rank = leaderboard.player_rank(pk, neighbours=neighbours)
+        if rank is None:
+            raise NotFound("Игрок не найден.")
+        return Response(PlayerRankSerializer(rank).data)
+
+
+class LoginAnalyticsAPIView(APIView):
+    """
+    Аналитика входов по сводкам журнала, без чтения самих событий.
+    Период ?start=&end= (сутки UTC), по умолчанию последние ?days= суток.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get_period(self, request):
+        query = LoginAnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        end = query.validated_data.get("end") or timezone.now().date()
+        start = query.validated_data.get("start") or end - timedelta(query.validated_data["days"])
+        return start, end, query.validated_data["days"]
+
+
+class DailyActiveAPIView(LoginAnalyticsAPIView):
+    """
+    Активные игроки (DAU), новые игроки и входы по суткам.
+    """
+
+    @extend_schema(parameters=[LoginAnalyticsQuerySerializer], responses=DailyActiveSerializer(many=True))
+    def get(self, request):
+        start, end, _ = self.get_period(request)
+        return Response(DailyActiveSerializer(LoginRollup.objects.daily_active(start, end), many=True).data)
+
+
+class CohortsAPIView(LoginAnalyticsAPIView):
+    """
+    Когорты по суткам первого входа за период и их удержание через 0..?days= суток.
+    """
+
+    @extend_schema(parameters=[LoginAnalyticsQuerySerializer], responses=CohortSerializer(many=True))
+    def get(self, request):
+        start, end, days = self.get_period(request)
+        return Response(CohortSerializer(LoginRollup.objects.cohorts(start, end, days), many=True).data)
@@ -1,42 +1,79 @@
-import csv
-
+from django.contrib import messages
 from django.contrib.admin import ModelAdmin, register
-from django.db.models import Prefetch
-from django.http import StreamingHttpResponse
+from django.contrib.admin.views.main import (
+    ALL_VAR,
+    ERROR_FLAG,
+    IS_FACETS_VAR,
+    IS_POPUP_VAR,
+    ORDER_VAR,
+    PAGE_VAR,
+    SEARCH_VAR,
+    TO_FIELD_VAR,
+)
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.html import format_html
 
-from tests2.models import Level, LevelPrize, Player, PlayerLevel, PlayerPrize, Prize
+from conts.admin import LargeTableAdminMixin, bulk_delete_selected
+from conts.choices import ExportJobStatusChoices
+from conts.metrics import count_rows
+from conts.search import UUID_RE
+from tests2.exports import (
+    EXPORT_COMPRESSORS,
+    EXPORT_JOB_THRESHOLD,
+    EXPORT_SELECTION_FILTERS,
+    EXPORT_SHARDS,
+    choose_encoding,
+    compress_gzip,
+    queue_export_job,
+    stream_csv,
+)
+from tests2.models import ExportJob, Level, LevelPrize, PendingPrizeAward, Player, PlayerLevel, PlayerPrize, Prize
 
 
 @register(Player)
-class PlayerAdmin(ModelAdmin):
+class PlayerAdmin(LargeTableAdminMixin, ModelAdmin):
     list_display = ("player_id",)
     search_fields = ("player_id",)
+    actions = [bulk_delete_selected]
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        player_id имеет вид "username uuid". Поиск, как и стандартный поиск админки, не учитывает регистр:
+        полный player_id ищется совпадением по индексу UPPER(player_id), UUID - по окончанию,
+        остальное - подстрокой (индекс pg_trgm). UUID есть только у одного игрока, поэтому найденный целиком
+        player_id - это всё, что нашёл бы и стандартный поиск по словам. Если совпадения нет
+        (например, "alice <uuid>" у игрока "alice_2 <uuid>"), ищется стандартным поиском.
+        """
+        term = search_term.strip()
+        if UUID_RE.fullmatch(term):
+            return queryset.filter(player_id__iendswith=f" {term}"), False
+        if " " in term and UUID_RE.fullmatch(term.rpartition(" ")[2]):
+            exact = queryset.filter(player_id__iexact=term)
+            if exact.exists():
+                return exact, False
+        return super().get_search_results(request, queryset, search_term)
 
 
 @register(Level)
-class LevelAdmin(ModelAdmin):
+class LevelAdmin(LargeTableAdminMixin, ModelAdmin):
     list_display = (
         "title",
         "order",
     )
+    actions = [bulk_delete_selected]
 
 
 @register(Prize)
-class PrizeAdmin(ModelAdmin):
+class PrizeAdmin(LargeTableAdminMixin, ModelAdmin):
     list_display = ("title",)
-
-
-class Echo:
-    """
-    Фейковые файлы объекта для csv.writter
-    """
-
-    def write(self, value):
-        return value
+    actions = [bulk_delete_selected]
 
 
 @register(PlayerLevel)
-class PlayerLevelAdmin(ModelAdmin):
+class PlayerLevelAdmin(LargeTableAdminMixin, ModelAdmin):
     list_display = (
         "player",
         "level",
@@ -46,50 +83,102 @@ class PlayerLevelAdmin(ModelAdmin):
     )
     list_filter = ("is_completed",)
 
-    actions = ["export_as_csv"]
+    actions = [
+        "export_as_csv",
+        "export_as_csv_gz",
+        "export_as_csv_parallel",
+    ]
 
-    def export_as_csv(self, request, queryset):
+    def message_export_job(self, request, job):
+        url = reverse("admin:tests2_exportjob_change", args=(job.pk,))
+        self.message_user(
+            request,
+            format_html(
+                'Выбрано записей: {}. Выгрузка поставлена в очередь: <a href="{}">{}</a>.', job.rows_total, url, job
+            ),
+            level=messages.INFO,
+        )
+
+    def get_export_selection(self, request, queryset):
         """
-        Экспорт выбранные записи в CSV файл.
+        Выборка для фоновой выгрузки обычными данными: id отмеченных записей или, если выбраны все записи,
+        фильтры списка из строки запроса. None - в списке есть фильтры, которые фоновая выгрузка не поддерживает.
         """
-        qs = (
-            queryset.select_related("player", "level")
-            .prefetch_related(
-                Prefetch(
-                    "player__playerprize_set",
-                    queryset=PlayerPrize.objects.select_related("prize", "level"),
-                    to_attr="all_prizes",
-                )
+        if request.POST.get("select_across") != "1":
+            return {"pks": list(queryset.values_list("pk", flat=True))}
+        ignored = {ALL_VAR, ERROR_FLAG, IS_FACETS_VAR, IS_POPUP_VAR, ORDER_VAR, PAGE_VAR, SEARCH_VAR, TO_FIELD_VAR}
+        filters = {key: value for key, value in request.GET.items() if key not in ignored}
+        if set(filters) - set(EXPORT_SELECTION_FILTERS):
+            self.message_user(
+                request, "Фоновая выгрузка не поддерживает выбранные фильтры списка.", level=messages.ERROR
             )
-            .iterator(chunk_size=5000)
-        )
+            return None
+        return {"filters": filters} if filters else {}
+
+    def queue_export(self, request, queryset, **fields):
+        """
+        Поставить выборку в фоновую выгрузку и показать ссылку на задачу.
+        """
+        selection = self.get_export_selection(request, queryset)
+        if selection is not None:
+            self.message_export_job(request, queue_export_job(selection, **fields))
+
+    def queue_large_export(self, request, queryset):
+        """
+        Поставить выборку больше EXPORT_JOB_THRESHOLD в фоновую выгрузку. Возвращает True, если поставлена.
+        """
+        rows_total = queryset.count()
+        if rows_total <= EXPORT_JOB_THRESHOLD:
+            return False
+        self.queue_export(request, queryset, rows_total=rows_total)
+        return True
 
-        pseudo_buffer = Echo()
-        writer = csv.writer(pseudo_buffer)
-
-        def row_generator():
-            # Заголовок
-            yield writer.writerow(["player_id", "level_title", "is_completed", "prizes"])
-            for pl in qs:
-                prizes = [pp.prize.title for pp in getattr(pl.player, "all_prizes", []) if pp.level_id == pl.level_id]
-                yield writer.writerow(
-                    [
-                        pl.player.player_id,
-                        pl.level.title,
-                        "Да" if pl.is_completed else "Нет",
-                        ", ".join(prizes) if prizes else "",
-                    ]
-                )
-
-        response = StreamingHttpResponse(row_generator(), content_type="text/csv; charset=utf-8-sig")
+    def export_as_csv(self, request, queryset):
+        """
+        Экспорт выбранные записи в CSV файл.
+        Если браузер принимает сжатие, CSV сжимается на лету (Content-Encoding).
+        Большие выборки выгружаются фоновой задачей, ссылка на файл появится в "Выгрузки CSV".
+        """
+        if self.queue_large_export(request, queryset):
+            return None
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        chunks = count_rows(stream_csv(queryset))
+        if encoding:
+            chunks = EXPORT_COMPRESSORS[encoding](chunks)
+        response = StreamingHttpResponse(chunks, content_type="text/csv; charset=utf-8-sig")
+        if encoding:
+            response["Content-Encoding"] = encoding
+        patch_vary_headers(response, ("Accept-Encoding",))
         response["Content-Disposition"] = 'attachment; filename="player_levels.csv"'
         return response
 
     export_as_csv.short_description = "Выгрузить выбранные записи в CSV"
 
+    def export_as_csv_gz(self, request, queryset):
+        """
+        Экспорт выбранных записей в сжатый файл player_levels.csv.gz.
+        """
+        if self.queue_large_export(request, queryset):
+            return None
+        response = StreamingHttpResponse(
+            compress_gzip(count_rows(stream_csv(queryset))), content_type="application/gzip"
+        )
+        response["Content-Disposition"] = 'attachment; filename="player_levels.csv.gz"'
+        return response
+
+    export_as_csv_gz.short_description = "Выгрузить выбранные записи в CSV.gz"
+
+    def export_as_csv_parallel(self, request, queryset):
+        """
+        Фоновая выгрузка выбранных записей в CSV в несколько процессов по диапазонам id.
+        """
+        self.queue_export(request, queryset, shards=EXPORT_SHARDS)
+
+    export_as_csv_parallel.short_description = "Выгрузить выбранные записи в CSV параллельно (в фоне)"
+
 
 @register(LevelPrize)
-class LevelPrizeAdmin(ModelAdmin):
+class LevelPrizeAdmin(LargeTableAdminMixin, ModelAdmin):
     list_display = (
         "level",
         "prize",
@@ -97,10 +186,115 @@ class LevelPrizeAdmin(ModelAdmin):
 
 
 @register(PlayerPrize)
-class PlayerPrizeAdmin(ModelAdmin):
+class PlayerPrizeAdmin(LargeTableAdminMixin, ModelAdmin):
     list_display = (
         "player",
         "prize",
         "level",
         "received",
     )
+
+
+@register(PendingPrizeAward)
+class PendingPrizeAwardAdmin(LargeTableAdminMixin, ModelAdmin):
+    list_display = (
+        "player_level",
+        "created_at",
+    )
+    list_select_related = ("player_level__player", "player_level__level")
+
+
+@register(ExportJob)
+class ExportJobAdmin(LargeTableAdminMixin, ModelAdmin):
+    list_display = (
+        "__str__",
+        "status",
+        "get_progress",
+        "get_rows_per_second",
+        "created_at",
+        "finished_at",
+        "get_download",
+    )
+    list_filter = ("status",)
+    readonly_fields = (
+        "status",
+        "get_progress",
+        "get_rows_per_second",
+        "bytes_written",
+        "last_pk",
+        "shards",
+        "changed_since",
+        "watermark",
+        "error",
+        "created_at",
+        "updated_at",
+        "finished_at",
+        "get_download",
+    )
+    fields = readonly_fields
+    actions = ["restart"]
+
+    def restart(self, request, queryset):
+        """
+        Вернуть упавшие выгрузки в очередь, они продолжатся с последней сохранённой пачки.
+        """
+        count = queryset.filter(status=ExportJobStatusChoices.FAILED).update(
+            status=ExportJobStatusChoices.PENDING, error="", finished_at=None
+        )
+        self.message_user(request, f"Возвращено в очередь выгрузок: {count}.", level=messages.SUCCESS)
+
+    restart.short_description = "Перезапустить упавшие выгрузки"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<path:object_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="tests2_exportjob_download",
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, object_id):
+        """
+        Отдать готовый файл выгрузки.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        job = self.get_object(request, object_id)
+        if job is None or job.status != ExportJobStatusChoices.DONE:
+            raise Http404("Выгрузка не найдена или ещё не готова.")
+        return FileResponse(job.file.open("rb"), as_attachment=True, filename="player_levels.csv")
+
+    def get_progress(self, obj):
+        """
+        Выгружено строк из общего количества.
+        """
+        percent = obj.rows_exported * 100 / obj.rows_total if obj.rows_total else 100
+        return f"{obj.rows_exported} из {obj.rows_total} ({percent:.0f}%)"
+
+    get_progress.short_description = "Прогресс"
+
+    def get_rows_per_second(self, obj):
+        """
+        Скорость выгрузки в строках в секунду.
+        """
+        return f"{obj.rows_per_second:.0f}"
+
+    get_rows_per_second.short_description = "Строк/с"
+
+    def get_download(self, obj):
+        """
+        Ссылка на скачивание готового файла.
+        """
+        if obj.status != ExportJobStatusChoices.DONE:
+            return "-"
+        url = reverse("admin:tests2_exportjob_download", args=(obj.pk,))
+        return format_html('<a href="{}">Скачать</a>', url)
+
+    get_download.short_description = "Файл"
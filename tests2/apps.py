@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class Tests2Config(AppConfig):
@@ -7,4 +8,7 @@ class Tests2Config(AppConfig):
     verbose_name = "2 Тестовое задание"
 
     def ready(self):
-        pass
+        from tests2 import signals
+
+        # Индексы, которые нельзя описать в модели, создаются после migrate
+        post_migrate.connect(signals.create_search_indexes, sender=self)
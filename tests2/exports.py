@@ -0,0 +1,564 @@
+import csv
+import multiprocessing
+import os
+import shutil
+import time
+import zipfile
+import zlib
+from datetime import timedelta
+from pathlib import Path
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+
+import django
+from django.db import connections, transaction
+from django.db.models import F, Max, Min, Prefetch, Q
+from django.utils import timezone
+
+from conts.choices import ExportJobStatusChoices
+from tests2.models import ExportJob, Level, Player, PlayerLevel, PlayerPrize, Prize
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXPORT_HEADER = ["player_id", "level_title", "is_completed", "prizes"]
+EXPORT_CHUNK_SIZE = 5000
+# Размер пачки CSV, которую COPY отдаёт в ответ, и сколько таких пачек может ждать отправки
+EXPORT_COPY_CHUNK_BYTES = 64 * 1024
+EXPORT_COPY_QUEUE_CHUNKS = 8
+# Уровни сжатия потоковой выгрузки: быстрые, чтобы сжатие не тормозило отдачу
+EXPORT_GZIP_LEVEL = 6
+EXPORT_ZSTD_LEVEL = 3
+# Выборки больше порога выгружаются фоновой задачей, а не в ответе на запрос
+EXPORT_JOB_THRESHOLD = 50000
+EXPORT_JOB_BATCH_SIZE = 50000
+# Задача в статусе "Выполняется" без прогресса дольше этого времени считается брошенной упавшим обработчиком
+EXPORT_JOB_STALE_AFTER = timedelta(minutes=5)
+# Насколько раньше прошлой отметки начинается инкрементальная выгрузка: изменения транзакций,
+# закоммиченных уже после отметки, попадают в следующую выгрузку, а не теряются
+EXPORT_DELTA_OVERLAP = timedelta(minutes=5)
+# Фильтры списка PlayerLevel в админке, которые можно сохранить в выборке фоновой выгрузки
+EXPORT_SELECTION_FILTERS = ("is_completed__exact",)
+# Количество процессов параллельной выгрузки по умолчанию
+EXPORT_SHARDS = os.cpu_count() or 1
+# Как часто параллельная выгрузка отмечает прогресс задачи, пока части ещё выгружаются, - чаще EXPORT_JOB_STALE_AFTER
+EXPORT_SHARD_HEARTBEAT = timedelta(minutes=1)
+
+
+class Echo:
+    """
+    Фейковые файлы объекта для csv.writter
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_rows_prefetch(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Строки выгрузки через ORM: PlayerLevel пачками с предзагрузкой всех призов игрока.
+    Работает на любой базе, используется для баз, отличных от PostgreSQL, и для сравнения в bench_export.
+    Призы идут в порядке выдачи (id PlayerPrize), как и в export_sql.
+    """
+    qs = (
+        queryset.select_related("player", "level")
+        .prefetch_related(
+            Prefetch(
+                "player__playerprize_set",
+                queryset=PlayerPrize.objects.select_related("prize", "level").order_by("pk"),
+                to_attr="all_prizes",
+            )
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for pl in qs:
+        prizes = [pp.prize.title for pp in getattr(pl.player, "all_prizes", []) if pp.level_id == pl.level_id]
+        yield pl.player.player_id, pl.level.title, pl.is_completed, ", ".join(prizes)
+
+
+def export_sql(queryset, completed_labels=False):
+    """
+    Один запрос выгрузки: PlayerLevel с игроком, уровнем и призами за этот уровень,
+    собранными через STRING_AGG по паре (игрок, уровень). Строки упорядочены по id PlayerLevel.
+    С completed_labels=True запрос готовит строки для COPY ... WITH CSV: колонка is_completed выводится
+    как "Да"/"Нет", а пустые строки - как NULL, который COPY пишет пустым полем без кавычек, как csv.writer.
+    """
+    if completed_labels:
+        is_completed = "CASE WHEN pl.is_completed THEN 'Да' ELSE 'Нет' END"
+        player_id, level_title, prizes = "NULLIF(p.player_id, '')", "NULLIF(l.title, '')", "NULLIF(prizes.titles, '')"
+    else:
+        is_completed = "pl.is_completed"
+        player_id, level_title, prizes = "p.player_id", "l.title", "COALESCE(prizes.titles, '')"
+    if queryset.query.has_filters():
+        subquery, params = queryset.order_by().values("pk").query.sql_with_params()
+        condition = f"WHERE pl.id IN ({subquery})"
+    else:
+        condition, params = "", ()
+    sql = f"""
+        SELECT
+            {player_id} AS player_id,
+            {level_title} AS level_title,
+            {is_completed} AS is_completed,
+            {prizes} AS prizes
+        FROM {PlayerLevel._meta.db_table} AS pl
+        JOIN {Player._meta.db_table} AS p ON p.id = pl.player_id
+        JOIN {Level._meta.db_table} AS l ON l.id = pl.level_id
+        LEFT JOIN LATERAL (
+            SELECT STRING_AGG(pr.title, ', ' ORDER BY pp.id) AS titles
+            FROM {PlayerPrize._meta.db_table} AS pp
+            JOIN {Prize._meta.db_table} AS pr ON pr.id = pp.prize_id
+            WHERE pp.player_id = pl.player_id AND pp.level_id = pl.level_id
+        ) AS prizes ON TRUE
+        {condition}
+        ORDER BY pl.id
+    """
+    return sql, list(params)
+
+
+def iter_rows_sql(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Строки выгрузки одним запросом через серверный курсор: память не зависит от объёма выгрузки.
+    Курсор читается внутри транзакции, иначе PostgreSQL материализует весь результат до первой строки.
+    """
+    sql, params = export_sql(queryset)
+    with transaction.atomic(using=queryset.db), connections[queryset.db].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while rows := cursor.fetchmany(chunk_size):
+            yield from rows
+
+
+def iter_csv(rows):
+    """
+    CSV построчно: заголовок и строки выгрузки с "Да"/"Нет" в колонке is_completed.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for player_id, level_title, is_completed, prizes in rows:
+        yield writer.writerow([player_id, level_title, "Да" if is_completed else "Нет", prizes])
+
+
+def copy_export_sql(cursor, queryset, header=True):
+    """
+    COPY (SELECT ...) TO STDOUT запроса выгрузки с уже подставленными параметрами.
+    """
+    sql, params = export_sql(queryset, completed_labels=True)
+    # COPY не принимает параметры запроса, подставляем их заранее
+    copy_sql = b"COPY (" + cursor.mogrify(sql, params) + b") TO STDOUT WITH CSV"
+    return copy_sql + b" HEADER" if header else copy_sql
+
+
+class CopyCsvFile:
+    """
+    Файлоподобный объект для copy_expert: пишет CSV из COPY в file с концами строк \r\n, как csv.writer.
+    Переводы строк внутри значений в кавычках не меняются: чётность кавычек помнится между вызовами write.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.quoted = False
+
+    def write(self, data):
+        parts = bytes(data).split(b'"')
+        # Части с чётным номером вне кавычек, если запись началась вне кавычек, иначе - с нечётным
+        for index in range(int(self.quoted), len(parts), 2):
+            parts[index] = parts[index].replace(b"\n", b"\r\n")
+        self.quoted ^= len(parts) % 2 == 0
+        self.file.write(b'"'.join(parts))
+
+
+class CopyChunkWriter:
+    """
+    Файлоподобный объект для copy_expert: собирает строки COPY в пачки и кладёт их в очередь.
+    Очередь ограничена, поэтому COPY ждёт, пока клиент не заберёт уже готовые пачки.
+    """
+
+    def __init__(self, chunks, cancelled, chunk_bytes):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.chunk_bytes = chunk_bytes
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put(bytes(self.buffer))
+            self.buffer.clear()
+
+    def put(self, item):
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except Full:
+                continue
+
+
+def iter_csv_copy(queryset, chunk_bytes=EXPORT_COPY_CHUNK_BYTES):
+    """
+    CSV целиком формирует PostgreSQL через COPY (SELECT ...) TO STDOUT WITH CSV HEADER.
+    COPY выполняется в отдельном потоке, а ответ получает готовые пачки байт из очереди.
+    Если клиент отключился, запрос отменяется.
+    """
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        copy_sql = copy_export_sql(cursor, queryset)
+    raw_connection = connection.connection
+
+    chunks = Queue(maxsize=EXPORT_COPY_QUEUE_CHUNKS)
+    cancelled = Event()
+    writer = CopyChunkWriter(chunks, cancelled, chunk_bytes)
+    done = object()
+
+    def copy():
+        try:
+            with raw_connection.cursor() as cursor:
+                cursor.copy_expert(copy_sql, CopyCsvFile(writer))
+            writer.flush()
+            writer.put(done)
+        except Exception as error:  # noqa: BLE001 - ошибка передаётся в поток ответа
+            writer.put(error)
+
+    thread = Thread(target=copy, name="csv-copy", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                chunk = chunks.get(timeout=1)
+            except Empty:
+                continue
+            if chunk is done:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        if thread.is_alive():
+            cancelled.set()
+            raw_connection.cancel()
+        thread.join()
+
+
+def csv_prefetch(queryset):
+    return iter_csv(iter_rows_prefetch(queryset))
+
+
+def csv_sql(queryset):
+    return iter_csv(iter_rows_sql(queryset))
+
+
+EXPORT_ENGINES = {
+    "prefetch": csv_prefetch,
+    "sql": csv_sql,
+    "copy": iter_csv_copy,
+}
+
+
+def stream_csv(queryset):
+    """
+    CSV выгрузки для ответа: на PostgreSQL через COPY, на остальных базах через csv.writer.
+    """
+    if connections[queryset.db].vendor == "postgresql":
+        return iter_csv_copy(queryset)
+    return csv_prefetch(queryset)
+
+
+def iter_bytes_chunks(chunks, chunk_bytes=EXPORT_COPY_CHUNK_BYTES):
+    """
+    Пачки байт не меньше chunk_bytes из строк или байт любого размера.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk.encode() if isinstance(chunk, str) else chunk
+        if len(buffer) >= chunk_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def compress_gzip(chunks):
+    """
+    Потоковое сжатие gzip. После каждой пачки сжатые данные сбрасываются клиенту,
+    в памяти держится только состояние компрессора.
+    """
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in iter_bytes_chunks(chunks):
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_zstd(chunks):
+    """
+    Потоковое сжатие zstd, каждая пачка закрывается отдельным блоком.
+    """
+    compressor = zstandard.ZstdCompressor(level=EXPORT_ZSTD_LEVEL).compressobj()
+    for chunk in iter_bytes_chunks(chunks):
+        yield compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    yield compressor.flush()
+
+
+# Поддерживаемые Content-Encoding в порядке предпочтения, zstd - только если установлен zstandard
+EXPORT_COMPRESSORS = {"gzip": compress_gzip}
+if zstandard is not None:
+    EXPORT_COMPRESSORS = {"zstd": compress_zstd, **EXPORT_COMPRESSORS}
+
+
+def choose_encoding(accept_encoding):
+    """
+    Лучшее из поддерживаемых сжатий, которое клиент принимает по заголовку Accept-Encoding, или None.
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0
+        weights[name.strip().lower()] = weight
+    for encoding in EXPORT_COMPRESSORS:
+        if weights.get(encoding, weights.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def write_csv(queryset, file, header=True):
+    """
+    Дописать CSV выгрузки в бинарный файл: на PostgreSQL через COPY, на остальных базах через csv.writer.
+    Возвращает количество записанных строк без заголовка.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.copy_expert(copy_export_sql(cursor, queryset, header), CopyCsvFile(file))
+            return cursor.rowcount
+    lines = csv_prefetch(queryset)
+    header_line = next(lines)
+    if header:
+        file.write(header_line.encode())
+    rows = 0
+    for line in lines:
+        file.write(line.encode())
+        rows += 1
+    return rows
+
+
+def queue_export_job(selection=None, rows_total=None, **fields):
+    """
+    Поставить выгрузку выборки PlayerLevel (см. selection_queryset) в очередь команды run_export_jobs.
+    fields - остальные поля задачи, например shards > 1 для параллельной выгрузки.
+    """
+    selection = selection or {}
+    if rows_total is None:
+        rows_total = selection_queryset(selection, fields.get("changed_since")).count()
+    return ExportJob.objects.create(selection=selection, rows_total=rows_total, **fields)
+
+
+def changed_since(since):
+    """
+    PlayerLevel, изменённые после since: сам уровень или призы игрока за этот уровень.
+    Оба условия идут по индексам updated_at и received, поэтому запрос зависит от числа изменений, а не от размера таблицы.
+    """
+    updated = PlayerLevel.objects.filter(updated_at__gt=since).values("pk")
+    prized = PlayerLevel.objects.filter(
+        player__playerprize__received__gt=since,
+        player__playerprize__level=F("level"),
+    ).values("pk")
+    return PlayerLevel.objects.filter(pk__in=updated.union(prized))
+
+
+def selection_queryset(selection, since=None):
+    """
+    Queryset PlayerLevel по выборке фоновой выгрузки. Выборка хранится обычными данными, а не сериализованным запросом:
+    {"pks": [...]} - отмеченные записи, {"filters": {...}} - фильтры списка из EXPORT_SELECTION_FILTERS,
+    пустая выборка - все записи. С since - только записи, изменённые после этой даты.
+    """
+    queryset = PlayerLevel.objects.all() if since is None else changed_since(since)
+    if "pks" in selection:
+        queryset = queryset.filter(pk__in=selection["pks"])
+    filters = selection.get("filters", {})
+    unknown = set(filters) - set(EXPORT_SELECTION_FILTERS)
+    if unknown:
+        raise ValueError(f"Фильтры не поддерживаются фоновой выгрузкой: {', '.join(sorted(unknown))}.")
+    return queryset.filter(**filters)
+
+
+def queue_delta_export_job():
+    """
+    Поставить инкрементальную выгрузку: записи, изменённые с отметки последней успешной инкрементальной выгрузки.
+    Первая инкрементальная выгрузка - полная.
+    """
+    watermark = timezone.now()
+    previous = (
+        ExportJob.objects.filter(status=ExportJobStatusChoices.DONE, watermark__isnull=False)
+        .order_by("-watermark")
+        .values_list("watermark", flat=True)
+        .first()
+    )
+    if previous is None:
+        return queue_export_job(watermark=watermark)
+    return queue_export_job(changed_since=previous - EXPORT_DELTA_OVERLAP, watermark=watermark)
+
+
+def claim_export_job(pk=None):
+    """
+    Взять в работу первую задачу из очереди или задачу, брошенную упавшим обработчиком, с pk - только эту задачу.
+    Задачи, которые прямо сейчас забирает другой обработчик, пропускаются.
+    """
+    stale = timezone.now() - EXPORT_JOB_STALE_AFTER
+    jobs = ExportJob.objects.all() if pk is None else ExportJob.objects.filter(pk=pk)
+    with transaction.atomic():
+        job = (
+            jobs.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ExportJobStatusChoices.PENDING)
+                | Q(status=ExportJobStatusChoices.RUNNING, updated_at__lt=stale)
+            )
+            .order_by("pk")
+            .first()
+        )
+        if job is not None:
+            job.status = ExportJobStatusChoices.RUNNING
+            job.save(update_fields=["status", "updated_at"])
+    return job
+
+
+def run_export_job(job, batch_size=EXPORT_JOB_BATCH_SIZE):
+    """
+    Выгрузить задачу в файл пачками по id, начиная после last_pk.
+    После каждой пачки файл сбрасывается на диск и прогресс сохраняется, поэтому после падения
+    недописанный хвост файла отрезается по bytes_written и выгрузка продолжается с той же строки.
+    """
+    queryset = selection_queryset(job.selection, job.changed_since)
+    if not job.file:
+        job.file.name = job.file.field.generate_filename(job, "player_levels.csv")
+    path = Path(job.file.path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if job.shards > 1:
+            # Части параллельной выгрузки не переживают падение, такая задача выгружается заново целиком
+            started = time.monotonic()
+            job.rows_exported = job.last_pk = job.bytes_written = 0
+
+            def progress(rows):
+                # Отметка прогресса, чтобы другой обработчик не счёл задачу брошенной, пока части выгружаются
+                job.rows_exported += rows
+                job.save(update_fields=["rows_exported", "updated_at"])
+
+            job.rows_exported = export_sharded(
+                job.selection, path, job.shards, since=job.changed_since, progress=progress
+            )
+            job.bytes_written = path.stat().st_size
+            job.elapsed = time.monotonic() - started
+            job.status = ExportJobStatusChoices.DONE
+            job.finished_at = timezone.now()
+            job.save()
+            return job
+        if (path.stat().st_size if path.exists() else 0) < job.bytes_written:
+            # Файл потерян или короче сохранённого прогресса: продолжить нельзя, выгрузка начинается заново
+            job.rows_exported = job.last_pk = job.bytes_written = 0
+        with open(path, "r+b" if path.exists() else "wb") as file:
+            # bytes_written сохраняется вместе с last_pk, поэтому строки, дописанные после последнего
+            # сохранения, отрезаются и выгружаются заново, а не дублируются
+            file.truncate(job.bytes_written)
+            file.seek(job.bytes_written)
+            while job.status == ExportJobStatusChoices.RUNNING:
+                started = time.monotonic()
+                batch = queryset.filter(pk__gt=job.last_pk).order_by("pk")
+                # id последней строки пачки, None - остались последние строки
+                upto = next(iter(batch.values_list("pk", flat=True)[batch_size - 1 : batch_size]), None)
+                rows = write_csv(
+                    batch if upto is None else batch.filter(pk__lte=upto),
+                    file,
+                    header=job.bytes_written == 0,
+                )
+                file.flush()
+                os.fsync(file.fileno())
+                job.rows_exported += rows
+                job.bytes_written = file.tell()
+                job.elapsed += time.monotonic() - started
+                if upto is None:
+                    job.status = ExportJobStatusChoices.DONE
+                    job.finished_at = timezone.now()
+                else:
+                    job.last_pk = upto
+                job.save()
+    except Exception as error:  # noqa: BLE001 - ошибка сохраняется в задаче, обработчик продолжает работу
+        job.status = ExportJobStatusChoices.FAILED
+        job.error = str(error)
+        job.finished_at = timezone.now()
+        job.save()
+    return job
+
+
+def _export_shard(task):
+    """
+    Выгрузить один диапазон id в файл части. Выполняется в отдельном процессе со своим подключением к базе.
+    """
+    selection, since, pk_from, pk_to, part_path, header = task
+    queryset = selection_queryset(selection, since).filter(pk__gte=pk_from, pk__lt=pk_to)
+    try:
+        with open(part_path, "wb") as file:
+            return write_csv(queryset, file, header=header)
+    finally:
+        connections.close_all()
+
+
+def export_sharded(selection, path, shards=EXPORT_SHARDS, archive=False, since=None, progress=None):
+    """
+    Параллельная выгрузка выборки (см. selection_queryset): диапазон id делится на shards равных частей,
+    каждая выгружается в своём процессе, затем части склеиваются по порядку id в один файл, с archive=True - в zip.
+    Результат не зависит от количества процессов. Возвращает количество выгруженных строк.
+    progress(rows) вызывается после каждой выгруженной части и с rows=0 раз в EXPORT_SHARD_HEARTBEAT, пока части
+    ещё выгружаются.
+    """
+    path = Path(path)
+    bounds = selection_queryset(selection, since).aggregate(pk_min=Min("pk"), pk_max=Max("pk"))
+    pk_min, pk_max = bounds["pk_min"] or 0, bounds["pk_max"] or 0
+    step = (pk_max - pk_min) // shards + 1
+    tasks = [
+        (selection, since, pk_min + step * shard, pk_min + step * (shard + 1), f"{path}.part{shard:04d}", shard == 0)
+        for shard in range(shards)
+    ]
+    # Процессы не должны наследовать открытые подключения родителя
+    connections.close_all()
+    rows = 0
+    with multiprocessing.Pool(shards, initializer=django.setup) as pool:
+        parts = pool.imap_unordered(_export_shard, tasks)
+        while True:
+            try:
+                part_rows = parts.next(timeout=EXPORT_SHARD_HEARTBEAT.total_seconds())
+            except multiprocessing.TimeoutError:
+                part_rows = 0
+            except StopIteration:
+                break
+            rows += part_rows
+            if progress is not None:
+                progress(part_rows)
+
+    with open(path, "wb") as file:
+        if archive:
+            # Фиксированная дата в архиве, чтобы одинаковые выгрузки давали одинаковый файл
+            info = zipfile.ZipInfo(path.with_suffix(".csv").name, date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with zipfile.ZipFile(file, "w") as zip_file, zip_file.open(info, "w", force_zip64=True) as output:
+                _concat_parts(tasks, output)
+        else:
+            _concat_parts(tasks, file)
+    return rows
+
+
+def _concat_parts(tasks, output):
+    for *_, part_path, _ in tasks:
+        with open(part_path, "rb") as part:
+            shutil.copyfileobj(part, output, EXPORT_COPY_CHUNK_BYTES)
+        os.remove(part_path)
@@ -0,0 +1,207 @@
+import json
+import platform
+import random
+from io import StringIO
+from itertools import cycle
+
+import django
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory
+
+from conts.bench import BENCH_REGRESSION_THRESHOLD, compare_results, run_case
+from conts.choices import BoostTypeChoices
+from tests1 import leaderboard
+from tests1.models import MAX_LEVEL
+from tests1.models import Player as Tests1Player
+from tests2.exports import EXPORT_JOB_THRESHOLD
+from tests2.models import PlayerLevel
+from tests2.services import assign_prizes_for_level
+
+
+def _sample(queryset, count, rng):
+    """
+    count случайных объектов выборки по кругу: если объектов меньше, они повторяются.
+    """
+    pks = list(queryset.values_list("pk", flat=True))
+    if not pks:
+        raise CommandError(f"Нет подходящих записей {queryset.model._meta.label} для замера.")
+    pks = rng.sample(pks, min(count, len(pks)))
+    objects = queryset.in_bulk(pks)
+    return cycle(objects[pk] for pk in pks)
+
+
+def bench_handle_login(count, rng, options):
+    for player in _sample(Tests1Player.objects.all(), count, rng):
+        yield player.handle_login
+
+
+def bench_complete_level(count, rng, options):
+    """
+    Уровень повышается в базе, поэтому игрок повторяется не больше раз, чем ему осталось уровней:
+    в каждом круге участвуют игроки, ещё не дошедшие до максимального уровня.
+    """
+    queryset = Tests1Player.objects.filter(last_login__isnull=False, current_level__lt=MAX_LEVEL)
+    pks = list(queryset.values_list("pk", flat=True))
+    players = queryset.in_bulk(rng.sample(pks, min(count, len(pks)))).values()
+    rounds = [player for level in range(MAX_LEVEL) for player in players if player.current_level <= level]
+    if len(rounds) < count:
+        raise CommandError(f"Недостаточно игроков ниже максимального уровня для {count} повышений.")
+    for player in rounds[:count]:
+        yield player.complete_level
+
+
+def bench_award_boost(count, rng, options):
+    for player in _sample(Tests1Player.objects.all(), count, rng):
+        boost_type = rng.choice(BoostTypeChoices.values)
+        yield lambda player=player, boost_type=boost_type: player.award_boost(boost_type)
+
+
+def bench_leaderboard_rank(count, rng, options):
+    for player in _sample(Tests1Player.objects.all(), count, rng):
+        yield lambda player=player: leaderboard.player_rank(player.pk, neighbours=5)
+
+
+def bench_assign_prizes_for_level(count, rng, options):
+    queryset = PlayerLevel.objects.filter(is_completed=True).select_related("player", "level")
+    for player_level in _sample(queryset, count, rng):
+        yield lambda player_level=player_level: assign_prizes_for_level(player_level.player, player_level.level)
+
+
+def bench_export_as_csv(count, rng, options):
+    """
+    Экспорт первых --export-rows записей прогресса через action админки с чтением всего ответа.
+    """
+    rows = min(options["export_rows"], EXPORT_JOB_THRESHOLD, PlayerLevel.objects.count())
+    if not rows:
+        raise CommandError("Нет записей PlayerLevel для замера выгрузки.")
+    last_pk = PlayerLevel.objects.order_by("pk").values_list("pk", flat=True)[rows - 1]
+    model_admin = admin.site._registry[PlayerLevel]
+    request = RequestFactory().post("/")
+    request.user = User(is_staff=True, is_superuser=True)
+
+    def export():
+        response = model_admin.export_as_csv(request, PlayerLevel.objects.filter(pk__lte=last_pk))
+        for _ in response.streaming_content:
+            pass
+
+    for _ in range(count):
+        yield export
+
+
+BENCH_CASES = {
+    "handle_login": bench_handle_login,
+    "complete_level": bench_complete_level,
+    "award_boost": bench_award_boost,
+    "leaderboard_rank": bench_leaderboard_rank,
+    "assign_prizes_for_level": bench_assign_prizes_for_level,
+    "export_as_csv": bench_export_as_csv,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер горячих путей игровых сервисов и выгрузки на отдельной временной базе. "
+        "Для каждого масштаба база создаётся заново и заполняется create_data и create_data_2, "
+        "результат выводится в JSON: операций в секунду, p50/p95/p99 задержки, запросов на операцию, пиковая память. "
+        "С --compare результат сравнивается с сохранённым, при регрессиях команда завершается с ошибкой."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=int,
+            nargs="+",
+            default=[10000],
+            help="Масштабы: количество игроков, уровней, призов и записей прогресса",
+        )
+        parser.add_argument(
+            "--cases", nargs="+", choices=list(BENCH_CASES), help="Замеряемые операции, по умолчанию все"
+        )
+        parser.add_argument("--warmup", type=int, default=10, help="Прогонов без замера")
+        parser.add_argument("--repeats", type=int, default=100, help="Замеряемых прогонов")
+        parser.add_argument("--seed", type=int, default=42, help="Seed данных и выбора игроков")
+        parser.add_argument("--export-rows", type=int, default=10000, help="Строк в замере выгрузки")
+        parser.add_argument("--output", help="Сохранить результат в JSON-файл")
+        parser.add_argument("--compare", help="JSON-файл базового замера для сравнения")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=BENCH_REGRESSION_THRESHOLD,
+            help="Допустимое ухудшение относительно базового замера, доля",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeats"] < 1:
+            raise CommandError("--repeats должен быть больше 0.")
+        cases = options["cases"] or list(BENCH_CASES)
+        results = {}
+        for scale in options["scale"]:
+            results[str(scale)] = self.run_scale(scale, cases, options)
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.display_name,
+                "database_version": ".".join(map(str, connection.get_database_version())),
+                "warmup": options["warmup"],
+                "repeats": options["repeats"],
+                "seed": options["seed"],
+                "export_rows": options["export_rows"],
+            },
+            "results": results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)["results"]
+            self.report_comparison(compare_results(baseline, results, options["threshold"]))
+
+    def run_scale(self, scale, cases, options):
+        """
+        Создать временную базу, заполнить её данными масштаба scale и замерить операции. База удаляется после замера.
+        """
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_output = StringIO()
+            call_command("create_data", count=scale, seed=options["seed"], stdout=seed_output)
+            call_command(
+                "create_data_2",
+                players=scale,
+                levels=scale,
+                prizes=scale,
+                rows=scale,
+                seed=options["seed"],
+                stdout=seed_output,
+            )
+            results = {}
+            for name in cases:
+                rng = random.Random(f"{options['seed']}:{name}")
+                count = options["warmup"] + options["repeats"] + 1
+                operations = BENCH_CASES[name](count, rng, options)
+                results[name] = run_case(operations, options["warmup"], options["repeats"])
+                self.stderr.write(f"{scale} {name}: {results[name]['ops_per_second']} оп/с")
+            return results
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report_comparison(self, rows):
+        regressions = 0
+        for scale, name, metric, before, after, change, regression in rows:
+            line = f"{scale} {name} {metric}: {before} -> {after} ({change:+.1%})"
+            if regression:
+                regressions += 1
+                self.stderr.write(self.style.ERROR(f"{line} регрессия"))
+            else:
+                self.stderr.write(line)
+        if regressions:
+            raise CommandError(f"Найдено регрессий: {regressions}.")
+        self.stderr.write(self.style.SUCCESS("Регрессий нет."))
@@ -0,0 +1,55 @@
+import resource
+import time
+
+from django.core.management import BaseCommand
+
+from tests2.exports import EXPORT_COMPRESSORS, EXPORT_ENGINES, iter_bytes_chunks
+from tests2.models import PlayerLevel
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер выгрузки PlayerLevel в CSV: строк в секунду и пиковая память процесса. "
+        "Каждый способ выгрузки нужно замерять отдельным запуском, пиковая память считается на весь процесс."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--engine", choices=sorted(EXPORT_ENGINES), default="sql", help="Способ выгрузки")
+        parser.add_argument("--encoding", choices=sorted(EXPORT_COMPRESSORS), help="Сжатие выгрузки")
+        parser.add_argument("--rows", type=int, help="Выгрузить только первые N записей по id, по умолчанию все")
+
+    def handle(self, *args, **options):
+        queryset = PlayerLevel.objects.all()
+        if options["rows"]:
+            queryset = queryset.filter(pk__in=PlayerLevel.objects.order_by("pk").values("pk")[: options["rows"]])
+
+        started = time.monotonic()
+        stats = {"rows": -1, "size": 0}  # Строки без заголовка
+
+        def measured(chunks):
+            for chunk in iter_bytes_chunks(chunks):
+                stats["rows"] += chunk.count(b"\n")
+                stats["size"] += len(chunk)
+                yield chunk
+
+        chunks = measured(EXPORT_ENGINES[options["engine"]](queryset))
+        if options["encoding"]:
+            chunks = EXPORT_COMPRESSORS[options["encoding"]](chunks)
+        sent = 0
+        first_byte = 0
+        for chunk in chunks:
+            sent += len(chunk)
+            if not first_byte and chunk:
+                first_byte = time.monotonic() - started
+        elapsed = time.monotonic() - started
+
+        rows = stats["rows"]
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['engine']} {options['encoding'] or 'без сжатия'}: {rows} строк, "
+                f"{stats['size'] / 1024 / 1024:.1f} МБ CSV, отправлено {sent / 1024 / 1024:.1f} МБ за {elapsed:.2f} с, "
+                f"{rows / elapsed:.0f} строк/с, первый байт через {first_byte:.3f} с, "
+                f"пиковая память {peak_rss:.0f} МБ"
+            )
+        )
@@ -0,0 +1,61 @@
+import statistics
+import time
+
+from django.contrib import admin
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+
+from tests1.models import Player as Tests1Player
+from tests2.models import Player
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер поиска игроков в админках tests1 и tests2: время COUNT и первой страницы результатов "
+        "и использует ли план индекс."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Повторов каждого поиска, выводится медиана")
+
+    def handle(self, *args, **options):
+        searches = []
+        player = Player.objects.order_by("?").first()
+        if player:
+            username, _, uuid = player.player_id.rpartition(" ")
+            searches += [
+                (Player, "подстрока UUID", uuid[9:18]),
+                (Player, "UUID", uuid),
+                (Player, "полный player_id", player.player_id),
+                (Player, "username", username),
+            ]
+        tests1_player = Tests1Player.objects.order_by("?").first()
+        if tests1_player:
+            searches += [
+                (Tests1Player, "подстрока username", tests1_player.username[1:5]),
+                (Tests1Player, "username", tests1_player.username),
+            ]
+        if not searches:
+            self.stdout.write("Нет игроков для поиска.")
+            return
+
+        request = RequestFactory().get("/")
+        for model, title, term in searches:
+            model_admin = admin.site._registry[model]
+            queryset, _ = model_admin.get_search_results(request, model.objects.all(), term)
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.monotonic()
+                count = queryset.count()
+                list(queryset[: model_admin.list_per_page])
+                timings.append(time.monotonic() - started)
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN {sql}", params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+            access = "seq scan" if "Seq Scan" in plan else "индекс"
+            self.stdout.write(
+                f"{model._meta.label} ({model.objects.count()} игроков), {title} {term!r}: "
+                f"найдено {count}, {statistics.median(timings) * 1000:.1f} мс, {access}"
+            )
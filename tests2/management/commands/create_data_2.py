@@ -1,168 +1,243 @@
-import uuid
-
+import multiprocessing
+import os
+import random
+import time
+from contextlib import nullcontext
+from datetime import date, timedelta
+
+import django
 from django.core.management import BaseCommand
-from django.db import transaction
+from django.db import connection, connections
+from django.db.models import Max
+from django.utils import timezone
 from faker import Faker
-from tqdm import tqdm
 
+from conts.loading import copy_rows, deferred_constraints
 from tests2.models import Level, LevelPrize, Player, PlayerLevel, PlayerPrize, Prize
+from tests2.services import assign_prizes
 
+# Строк в одной части генерации. Части не зависят от количества процессов,
+# поэтому при одном seed данные одинаковы при любом --workers
+SEED_CHUNK_ROWS = 100000
+# Размер пулов имён и названий, из которых собираются строки
+SEED_POOL_SIZE = 10000
 
-class Command(BaseCommand):
-    help = "Команда для создания тестовых данных для второй части задания."
+SEED_PLAYER_LEVELS_TABLE = "tests2_seed_playerlevel"
+SEED_LEVEL_PRIZES_TABLE = "tests2_seed_levelprize"
 
-    def handle(self, *args, **kwargs):
-        self.fake = Faker("ru_RU")
-        self.count_size = 100000
-        self.batch_size = 5000
 
-        with transaction.atomic():
-            self.base_bulk_all_models_create()
-            self.create_level_prizes()
-            self.create_player_levels()
+# Маски версии 4 и варианта RFC 4122 для UUID из случайных 128 бит
+_UUID_MASK = ~(0xF000 << 64) & ~(0xC000 << 48)
+_UUID_BITS = (0x4000 << 64) | (0x8000 << 48)
 
-    def base_bulk_all_models_create(self):
-        tasks = [
-            (Player, "игроков", self._create_players),
-            (Level, "уровней", self._create_levels),
-            (Prize, "призов", self._create_prizes),
-        ]
 
-        for model_class, desc, create_func in tasks:
-            instances = [create_func() for _ in tqdm(range(self.count_size), desc=f"Создание {desc}")]
-            created_count = len(instances)
-            model_class.objects.bulk_create(instances, batch_size=self.batch_size)
-            self.stdout.write(self.style.SUCCESS(f"Создано {created_count} новых {desc}"))
+# Генераторы вытягивают случайные значения части сразу списками (choices, randbytes), а не по одному на строку
+def _ids(rng, base, total, count):
+    return rng.choices(range(base + 1, base + total + 1), k=count)
 
-    def _create_players(self):
-        return Player(player_id=f"{self.fake.user_name()} {uuid.uuid4()}")
 
-    def _create_levels(self):
-        return Level(
-            title=f"{self.fake.sentence(nb_words=3, variable_nb_words=True)}",
-            order=self.fake.random_int(min=1, max=99),
-        )
+def _players(rng, start, count, params):
+    usernames = rng.choices(params["usernames"], k=count)
+    for number, username in zip(range(start, start + count), usernames, strict=True):
+        value = f"{rng.getrandbits(128) & _UUID_MASK | _UUID_BITS:032x}"
+        player_uuid = f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}"
+        yield params["player_base"] + number + 1, f"{username} {player_uuid}"
 
-    def _create_prizes(self):
-        return Prize(title=f"{self.fake.sentence(nb_words=3, variable_nb_words=True)}")
 
-    def _create_level_prize(self, levels_ids, prizes_ids):
-        level_id = self.fake.random_element(levels_ids)
-        prize_id = self.fake.random_element(prizes_ids)
-        return LevelPrize(level_id=level_id, prize_id=prize_id)
+def _levels(rng, start, count, params):
+    titles = rng.choices(params["titles"], k=count)
+    orders = rng.choices(range(1, 100), k=count)
+    ids = range(params["level_base"] + start + 1, params["level_base"] + start + count + 1)
+    return zip(ids, titles, orders, strict=True)
 
-    def create_level_prizes(self):
-        levels_ids = list(Level.objects.values_list("id", flat=True))
-        prizes_ids = list(Prize.objects.values_list("id", flat=True))
 
-        instances = [
-            self._create_level_prize(levels_ids, prizes_ids)
-            for _ in tqdm(range(self.count_size), desc="Создание связей уровень-приз")
-        ]
+def _prizes(rng, start, count, params):
+    titles = rng.choices(params["titles"], k=count)
+    return zip(range(params["prize_base"] + start + 1, params["prize_base"] + start + count + 1), titles, strict=True)
+
+
+def _level_prizes(rng, start, count, params):
+    levels = _ids(rng, params["level_base"], params["levels"], count)
+    return zip(levels, _ids(rng, params["prize_base"], params["prizes"], count), strict=True)
+
+
+def _player_levels(rng, start, count, params):
+    year_start = date(params["today"].year, 1, 1)
+    days = (params["today"] - year_start).days + 1
+    dates = [(year_start + timedelta(days=day)).isoformat() for day in range(days)]
+    players = _ids(rng, params["player_base"], params["players"], count)
+    levels = _ids(rng, params["level_base"], params["levels"], count)
+    # Случайный байт меньше 128 - уровень пройден, с вероятностью 1/2
+    completed = zip(rng.randbytes(count), rng.choices(dates, k=count), strict=True)
+    return (
+        (player, level, "t", day) if flag < 128 else (player, level, "f", "")
+        for player, level, (flag, day) in zip(players, levels, completed, strict=True)
+    )
 
-        # Убираем дубли
-        seen = set()
-        unique_instances = []
-        for obj in instances:
-            pair = (obj.level_id, obj.prize_id)
-            if pair not in seen:
-                seen.add(pair)
-                unique_instances.append(obj)
-
-        created_count = len(unique_instances)
-        LevelPrize.objects.bulk_create(unique_instances, batch_size=self.batch_size)
-        self.stdout.write(self.style.SUCCESS(f"Создано {created_count} новых связей уровень-приз"))
-
-    def create_player_levels(self):
-        """Создаёт связи игрок-уровень и массово выдаёт призы за завершённые уровни."""
-        players_ids = list(Player.objects.values_list("id", flat=True))
-        levels_ids = list(Level.objects.values_list("id", flat=True))
-
-        if not players_ids or not levels_ids:
-            self.stdout.write(self.style.WARNING("Нет игроков или уровней для связывания!"))
-            return
 
-        count = self.count_size
+# Таблица, колонки COPY и генератор строк части таблицы
+SEED_TABLES = {
+    "players": (Player._meta.db_table, ("id", "player_id"), _players),
+    "levels": (Level._meta.db_table, ("id", "title", '"order"'), _levels),
+    "prizes": (Prize._meta.db_table, ("id", "title"), _prizes),
+    "level_prizes": (SEED_LEVEL_PRIZES_TABLE, ("level_id", "prize_id"), _level_prizes),
+    "player_levels": (
+        SEED_PLAYER_LEVELS_TABLE,
+        ("player_id", "level_id", "is_completed", "completed"),
+        _player_levels,
+    ),
+}
 
-        # Подготавливаем объекты PlayerLevel
-        instances = []
-        completed_pairs = []
 
-        for _ in tqdm(
-            range(count),
-            desc="Создание прогресса игроков по уровням",
-        ):
-            player_id = self.fake.random_element(players_ids)
-            level_id = self.fake.random_element(levels_ids)
+def _load_chunk(task):
+    """
+    Сгенерировать часть таблицы и загрузить её через COPY FROM STDIN. Выполняется в отдельном процессе.
+    """
+    name, chunk, count, params = task
+    table, columns, generate = SEED_TABLES[name]
+    rng = random.Random(f"{params['seed']}:{name}:{chunk}")
+    try:
+        with connection.cursor() as cursor:
+            copy_rows(cursor, table, columns, generate(rng, chunk * SEED_CHUNK_ROWS, count, params))
+    finally:
+        connections.close_all()
+    return name, count
 
-            is_completed = self.fake.boolean(chance_of_getting_true=50)
-            completed = self.fake.date_time_this_year() if is_completed else None
 
-            instance = PlayerLevel(
-                player_id=player_id,
-                level_id=level_id,
-                is_completed=is_completed,
-                completed=completed,
+class Command(BaseCommand):
+    help = (
+        "Команда для создания тестовых данных для второй части задания. "
+        "Строки генерируются в нескольких процессах и загружаются через COPY; при одном --seed данные одинаковы."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--players", type=int, default=100000, help="Количество игроков")
+        parser.add_argument("--levels", type=int, default=100000, help="Количество уровней и связей уровень-приз")
+        parser.add_argument("--prizes", type=int, default=100000, help="Количество призов")
+        parser.add_argument("--rows", type=int, default=100000, help="Количество записей прогресса игроков")
+        parser.add_argument("--seed", type=int, help="Seed генератора, по умолчанию случайный")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Количество процессов")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stderr.write(
+                self.style.ERROR("create_data_2 загружает данные через COPY и работает только с PostgreSQL.")
             )
-            instances.append(instance)
-
-            if is_completed:
-                completed_pairs.append((player_id, level_id))
-
-        # Убираем дубли по (player_id, level_id)
-        seen = set()
-        unique_instances = []
-        for obj in instances:
-            pair = (obj.player_id, obj.level_id)
-            if pair not in seen:
-                seen.add(pair)
-                unique_instances.append(obj)
-
-        # Создаём PlayerLevel
-        created_objs = PlayerLevel.objects.bulk_create(
-            unique_instances,
-            batch_size=self.batch_size,
-            ignore_conflicts=True,
-        )
-        created_count = len(created_objs)
-        self.stdout.write(self.style.SUCCESS(f"Создано {created_count} записей прогресса игроков"))
-
-        if completed_pairs:
-            self.stdout.write("Массовая выдача призов за завершённые уровни...")
-
-            # Шаг 1: получить все призы, привязанные к этим уровням
-            level_ids_from_pairs = {level_id for _, level_id in completed_pairs}
-            level_prizes = LevelPrize.objects.filter(level_id__in=level_ids_from_pairs).select_related("prize")
-
-            prizes_by_level = {}
-            for level_prize in level_prizes:
-                prizes_by_level.setdefault(level_prize.level_id, []).append(level_prize.prize)
-
-            # Шаг 2: создаём PlayerPrize объекты для всех (player, prize, level)
-            player_prize_instances = []
-            for player_id, level_id in tqdm(
-                completed_pairs,
-                desc="Подготовка призов",
-            ):
-                if level_id not in prizes_by_level:
-                    continue
-                for prize in prizes_by_level[level_id]:
-                    player_prize_instances.append(
-                        PlayerPrize(
-                            player_id=player_id,
-                            prize=prize,
-                            level_id=level_id,
-                            received=self.fake.date_time_this_year(),
-                        )
+            return
+        started = time.monotonic()
+        seed = options["seed"] if options["seed"] is not None else random.randrange(2**32)
+        fake = Faker("ru_RU")
+        fake.seed_instance(seed)
+        params = {
+            "seed": seed,
+            "players": options["players"],
+            "levels": options["levels"],
+            "prizes": options["prizes"],
+            "today": timezone.localdate(),
+            "usernames": [fake.user_name() for _ in range(SEED_POOL_SIZE)],
+            "titles": [fake.sentence(nb_words=3, variable_nb_words=True) for _ in range(SEED_POOL_SIZE)],
+            # id новых записей идут после существующих
+            "player_base": Player.objects.aggregate(value=Max("pk"))["value"] or 0,
+            "level_base": Level.objects.aggregate(value=Max("pk"))["value"] or 0,
+            "prize_base": Prize.objects.aggregate(value=Max("pk"))["value"] or 0,
+        }
+        player_level_base = PlayerLevel.objects.aggregate(value=Max("pk"))["value"] or 0
+        # Индексы и внешние ключи снимаются, только если таблицы пустые: иначе они нужны работающему приложению
+        link_models = (PlayerLevel, PlayerPrize)
+        empty = not any(model.objects.exists() for model in link_models)
+
+        with deferred_constraints(link_models, connection.alias) if empty else nullcontext():
+            # Связи сначала попадают в таблицы без индексов и ограничений, дубли убираются одним INSERT ... SELECT
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE UNLOGGED TABLE {SEED_LEVEL_PRIZES_TABLE} (level_id bigint, prize_id bigint);"
+                    f"CREATE UNLOGGED TABLE {SEED_PLAYER_LEVELS_TABLE} "
+                    "(player_id bigint, level_id bigint, is_completed boolean, completed date)"
+                )
+            try:
+                self.load(
+                    [
+                        ("players", options["players"], "игроков"),
+                        ("levels", options["levels"], "уровней"),
+                        ("prizes", options["prizes"], "призов"),
+                    ],
+                    params,
+                    options["workers"],
+                )
+                # Связи ссылаются на уже загруженные игроков, уровни и призы
+                self.load(
+                    [
+                        ("level_prizes", options["levels"], "связей уровень-приз"),
+                        ("player_levels", options["rows"], "записей прогресса игроков"),
+                    ],
+                    params,
+                    options["workers"],
+                )
+                self.move_links(empty)
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {SEED_LEVEL_PRIZES_TABLE}, {SEED_PLAYER_LEVELS_TABLE}")
+
+            with connection.cursor() as cursor:
+                # id игроков, уровней и призов заданы явно, последовательности сдвигаются за них
+                for model in (Player, Level, Prize):
+                    table = model._meta.db_table
+                    cursor.execute(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), MAX(id)) FROM {table} HAVING MAX(id) > 0"
                     )
+                for model in (Player, Level, Prize, LevelPrize, PlayerLevel):
+                    cursor.execute(f"ANALYZE {model._meta.db_table}")
 
-            # Шаг 3: массовое создание с игнорированием дублей
-            if player_prize_instances:
-                created_prizes = PlayerPrize.objects.bulk_create(
-                    player_prize_instances,
-                    batch_size=self.batch_size,
-                    ignore_conflicts=True,
+            prizes_started = time.monotonic()
+            prizes = assign_prizes(PlayerLevel.objects.filter(pk__gt=player_level_base))
+            self.stdout.write(
+                self.style.SUCCESS(f"Выдано {prizes} призов игрокам за {time.monotonic() - prizes_started:.1f} с")
+            )
+        self.stdout.write(self.style.SUCCESS(f"Готово за {time.monotonic() - started:.1f} с, seed {seed}."))
+
+    def load(self, tables, params, workers):
+        started = time.monotonic()
+        tasks = [
+            (name, chunk, min(SEED_CHUNK_ROWS, count - chunk * SEED_CHUNK_ROWS), params)
+            for name, count, _ in tables
+            for chunk in range((count + SEED_CHUNK_ROWS - 1) // SEED_CHUNK_ROWS)
+        ]
+        # Процессы не должны наследовать открытое подключение родителя
+        connections.close_all()
+        loaded = dict.fromkeys((name for name, *_ in tables), 0)
+        with multiprocessing.Pool(workers, initializer=django.setup) as pool:
+            for name, count in pool.imap_unordered(_load_chunk, tasks):
+                loaded[name] += count
+        for name, _, desc in tables:
+            self.stdout.write(self.style.SUCCESS(f"Создано {loaded[name]} новых {desc}"))
+        self.stdout.write(f"Загрузка заняла {time.monotonic() - started:.1f} с")
+
+    def move_links(self, empty):
+        """
+        Перенести связи из временных таблиц без дублей. Порядок строк задан, чтобы id не зависели от процессов.
+        В пустую таблицу прогресса строки уже без дублей переносятся без уникального ограничения,
+        оно строится одним проходом после переноса.
+        """
+        started = time.monotonic()
+        player_level = PlayerLevel._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {LevelPrize._meta.db_table} (level_id, prize_id)
+                SELECT DISTINCT level_id, prize_id FROM {SEED_LEVEL_PRIZES_TABLE} ORDER BY level_id, prize_id
+                """
+            )
+            self.stdout.write(self.style.SUCCESS(f"Уникальных связей уровень-приз: {cursor.rowcount}"))
+            with deferred_constraints((PlayerLevel,), connection.alias, unique=True) if empty else nullcontext():
+                cursor.execute(
+                    f"""
+                    INSERT INTO {player_level} (player_id, level_id, is_completed, completed, score, updated_at)
+                    SELECT DISTINCT ON (player_id, level_id) player_id, level_id, is_completed, completed, 0, %s
+                    FROM {SEED_PLAYER_LEVELS_TABLE}
+                    ORDER BY player_id, level_id, is_completed DESC, completed
+                    {"" if empty else "ON CONFLICT (player_id, level_id) DO NOTHING"}
+                    """,
+                    [timezone.now()],
                 )
-                self.stdout.write(self.style.SUCCESS(f"Выдано {len(created_prizes)} призов игрокам"))
-            else:
-                self.stdout.write(self.style.WARNING("Нет призов для выдачи"))
+            self.stdout.write(self.style.SUCCESS(f"Уникальных записей прогресса игроков: {cursor.rowcount}"))
+        self.stdout.write(f"Перенос связей занял {time.monotonic() - started:.1f} с")
@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand
+
+from conts.choices import ExportJobStatusChoices
+from tests2.exports import EXPORT_JOB_BATCH_SIZE, claim_export_job, queue_delta_export_job, run_export_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Инкрементальная выгрузка PlayerLevel в CSV: только записи, изменённые с прошлой инкрементальной выгрузки. "
+        "Первый запуск выгружает все записи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=EXPORT_JOB_BATCH_SIZE, help="Строк в одной пачке")
+        parser.add_argument("--queue", action="store_true", help="Только поставить в очередь run_export_jobs")
+
+    def handle(self, *args, **options):
+        job = queue_delta_export_job()
+        since = job.changed_since.isoformat() if job.changed_since else "начала"
+        self.stdout.write(f"{job}: изменения с {since}, записей {job.rows_total}.")
+        if options["queue"]:
+            return
+
+        claimed = claim_export_job(pk=job.pk)
+        if claimed is None:
+            self.stdout.write("Выгрузку уже выполняет обработчик run_export_jobs.")
+            return
+        claimed = run_export_job(claimed, batch_size=options["batch_size"])
+        if claimed.status == ExportJobStatusChoices.DONE:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{claimed}: {claimed.rows_exported} строк за {claimed.elapsed:.2f} с, файл {claimed.file.name}."
+                )
+            )
+        else:
+            self.stdout.write(self.style.ERROR(f"{claimed}: {claimed.error}"))
@@ -0,0 +1,34 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from tests2.exports import EXPORT_SHARDS, export_sharded
+
+
+class Command(BaseCommand):
+    help = "Параллельная выгрузка PlayerLevel в CSV: диапазон id делится между процессами."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", type=int, default=EXPORT_SHARDS, help="Количество процессов")
+        parser.add_argument("--output", help="Путь к файлу, по умолчанию PRIVATE_ROOT/exports/player_levels.csv")
+        parser.add_argument("--zip", action="store_true", help="Упаковать выгрузку в zip")
+
+    def handle(self, *args, **options):
+        output = options["output"] or Path(settings.PRIVATE_ROOT) / "exports" / "player_levels.csv"
+        output = Path(output)
+        if options["zip"] and output.suffix != ".zip":
+            output = output.with_suffix(".zip")
+        output.parent.mkdir(parents=True, exist_ok=True)
+
+        started = time.monotonic()
+        rows = export_sharded({}, output, options["shards"], archive=options["zip"])
+        elapsed = time.monotonic() - started
+        size = output.stat().st_size / 1024 / 1024
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{options['shards']} процессов: {rows} строк, {size:.1f} МБ за {elapsed:.2f} с "
+                f"({rows / elapsed:.0f} строк/с), файл {output}."
+            )
+        )
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management import BaseCommand
+
+from tests2.services import PRIZE_AWARD_BATCH_SIZE, process_prize_awards
+
+
+class Command(BaseCommand):
+    help = "Выдача призов за завершённые уровни из очереди. С --loop работает как постоянный обработчик."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=PRIZE_AWARD_BATCH_SIZE, help="Уровней в одной пачке")
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, ждать новые записи в очереди")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза при пустой очереди в секундах")
+
+    def handle(self, *args, **options):
+        while True:
+            self.drain(options["batch_size"])
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def drain(self, batch_size):
+        started = time.monotonic()
+        levels_total = prizes_total = 0
+        while True:
+            levels, prizes = process_prize_awards(batch_size=batch_size)
+            levels_total += levels
+            prizes_total += prizes
+            if levels < batch_size:
+                break
+        if levels_total:
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Обработано {levels_total} уровней, выдано {prizes_total} призов "
+                    f"за {elapsed:.2f} с ({levels_total / elapsed:.0f} уровней/с)."
+                )
+            )
+        else:
+            self.stdout.write("Очередь выдачи призов пуста.")
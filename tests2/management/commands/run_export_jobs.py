@@ -0,0 +1,38 @@
+import time
+
+from django.core.management import BaseCommand
+
+from conts.choices import ExportJobStatusChoices
+from tests2.exports import EXPORT_JOB_BATCH_SIZE, claim_export_job, run_export_job
+
+
+class Command(BaseCommand):
+    help = "Выполнение фоновых выгрузок CSV из очереди. С --loop работает как постоянный обработчик."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=EXPORT_JOB_BATCH_SIZE, help="Строк в одной пачке")
+        parser.add_argument("--loop", action="store_true", help="Не завершаться, ждать новые выгрузки")
+        parser.add_argument("--interval", type=float, default=5, help="Пауза при пустой очереди в секундах")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_export_job()
+            if job is not None:
+                self.run(job, options["batch_size"])
+            elif options["loop"]:
+                time.sleep(options["interval"])
+            else:
+                self.stdout.write("Очередь выгрузок пуста.")
+                break
+
+    def run(self, job, batch_size):
+        job = run_export_job(job, batch_size=batch_size)
+        if job.status == ExportJobStatusChoices.DONE:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{job}: {job.rows_exported} строк, {job.bytes_written / 1024 / 1024:.1f} МБ "
+                    f"за {job.elapsed:.2f} с ({job.rows_per_second:.0f} строк/с), файл {job.file.name}."
+                )
+            )
+        else:
+            self.stdout.write(self.style.ERROR(f"{job}: {job.error}"))
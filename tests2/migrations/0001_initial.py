@@ -0,0 +1,134 @@
+# Generated by Django 5.2.6 on 2026-10-18 00:03
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+import django.db.models.functions.text
+import tests2.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=20, verbose_name='Статус')),
+                ('selection', models.JSONField(blank=True, default=dict, help_text='Выбранные PlayerLevel: {"pks": [...]} - отмеченные записи, {"filters": {...}} - фильтры списка, пустая - все записи', verbose_name='Выборка')),
+                ('file', models.FileField(blank=True, null=True, storage=tests2.models.export_storage, upload_to=tests2.models.export_file_name, verbose_name='Файл')),
+                ('rows_total', models.PositiveIntegerField(default=0, verbose_name='Всего строк')),
+                ('rows_exported', models.PositiveIntegerField(default=0, verbose_name='Выгружено строк')),
+                ('last_pk', models.BigIntegerField(default=0, verbose_name='Последний выгруженный id')),
+                ('bytes_written', models.PositiveBigIntegerField(default=0, verbose_name='Записано байт')),
+                ('shards', models.PositiveSmallIntegerField(default=1, verbose_name='Процессов выгрузки')),
+                ('elapsed', models.FloatField(default=0, verbose_name='Время работы, с')),
+                ('changed_since', models.DateTimeField(blank=True, help_text='Инкрементальная выгрузка: только записи, изменённые после этой даты', null=True, verbose_name='Изменения с')),
+                ('watermark', models.DateTimeField(blank=True, help_text='Следующая инкрементальная выгрузка начнётся с этой даты', null=True, verbose_name='Отметка инкрементальной выгрузки')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'Выгрузка CSV',
+                'verbose_name_plural': 'Выгрузки CSV',
+            },
+        ),
+        migrations.CreateModel(
+            name='Level',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(help_text='Введите название уровня', max_length=100, verbose_name='Название уровня')),
+                ('order', models.IntegerField(default=0, help_text='Введите порядок уровня', verbose_name='Порядок')),
+            ],
+            options={
+                'verbose_name': 'Уровень',
+                'verbose_name_plural': 'Уровни',
+            },
+        ),
+        migrations.CreateModel(
+            name='Prize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(help_text='Введите название приза', max_length=100, verbose_name='Название приза')),
+            ],
+            options={
+                'verbose_name': 'Приз',
+                'verbose_name_plural': 'Призы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Player',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('player_id', models.CharField(db_index=True, help_text='ID игрока в системе', max_length=100, verbose_name='ID игрока')),
+            ],
+            options={
+                'verbose_name': 'Игрок',
+                'verbose_name_plural': 'Игроки',
+                'indexes': [models.Index(django.db.models.functions.text.Upper(django.db.models.functions.comparison.Cast('player_id', models.TextField())), name='player_player_id_upper_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed', models.DateField(blank=True, help_text='Выберите дату завершения', null=True, verbose_name='Дата завершения')),
+                ('is_completed', models.BooleanField(default=False, help_text='Да/Нет', verbose_name='Завершен')),
+                ('score', models.PositiveIntegerField(default=0, help_text='Введите счет', verbose_name='Счет')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения')),
+                ('level', models.ForeignKey(help_text='Выберите уровень', on_delete=django.db.models.deletion.CASCADE, to='tests2.level', verbose_name='Уровень')),
+                ('player', models.ForeignKey(help_text='Выберите игрока', on_delete=django.db.models.deletion.CASCADE, to='tests2.player', verbose_name='Игрок')),
+            ],
+            options={
+                'verbose_name': 'Уровень игрока',
+                'verbose_name_plural': 'Уровни игроков',
+                'unique_together': {('player', 'level')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PendingPrizeAward',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата постановки в очередь')),
+                ('player_level', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='tests2.playerlevel', verbose_name='Уровень игрока')),
+            ],
+            options={
+                'verbose_name': 'Приз в очереди на выдачу',
+                'verbose_name_plural': 'Призы в очереди на выдачу',
+            },
+        ),
+        migrations.CreateModel(
+            name='LevelPrize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.ForeignKey(help_text='Выберите уровень', on_delete=django.db.models.deletion.CASCADE, to='tests2.level', verbose_name='Уровень')),
+                ('prize', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tests2.prize', verbose_name='Приз')),
+            ],
+            options={
+                'verbose_name': 'Приз уровня',
+                'verbose_name_plural': 'Призы уровней',
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerPrize',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата получения')),
+                ('level', models.ForeignKey(help_text='Выберите уровень', on_delete=django.db.models.deletion.CASCADE, to='tests2.level', verbose_name='Уровень')),
+                ('player', models.ForeignKey(help_text='Выберите игрока', on_delete=django.db.models.deletion.CASCADE, to='tests2.player', verbose_name='Игрок')),
+                ('prize', models.ForeignKey(help_text='Выберите приз', on_delete=django.db.models.deletion.CASCADE, to='tests2.prize', verbose_name='Приз')),
+            ],
+            options={
+                'verbose_name': 'Приз игрока',
+                'verbose_name_plural': 'Призы игроков',
+                'unique_together': {('player', 'prize', 'level')},
+            },
+        ),
+    ]
@@ -1,16 +1,32 @@
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db.models import (
     CASCADE,
+    BigIntegerField,
     BooleanField,
     CharField,
     DateField,
     DateTimeField,
+    FileField,
+    FloatField,
     ForeignKey,
+    Index,
     IntegerField,
+    JSONField,
     Model,
+    OneToOneField,
+    PositiveBigIntegerField,
     PositiveIntegerField,
+    PositiveSmallIntegerField,
+    TextField,
 )
+from django.db.models.functions import Cast, Upper
 from django.utils import timezone
 
+from conts.choices import ExportJobStatusChoices
 from conts.models import NULLABLE
 
 
@@ -19,11 +35,16 @@ class Player(Model):
         verbose_name="ID игрока",
         help_text="ID игрока в системе",
         max_length=100,
+        db_index=True,
     )
 
     class Meta:
         verbose_name = "Игрок"
         verbose_name_plural = "Игроки"
+        indexes = [
+            # Поиск полного player_id без учёта регистра: iexact даёт UPPER(player_id::text) = UPPER(...)
+            Index(Upper(Cast("player_id", TextField())), name="player_player_id_upper_idx"),
+        ]
 
     def __str__(self):
         return self.player_id
@@ -65,6 +86,9 @@ class Prize(Model):
 
 
 class PlayerLevel(Model):
+    # Значение is_completed на момент загрузки из базы, чтобы отличать новое завершение уровня
+    _stored_is_completed = False
+
     player = ForeignKey(
         Player,
         verbose_name="Игрок",
@@ -92,6 +116,11 @@ class PlayerLevel(Model):
         help_text="Введите счет",
         default=0,
     )
+    updated_at = DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = "Уровень игрока"
@@ -104,6 +133,12 @@ class PlayerLevel(Model):
     def __str__(self):
         return f"{self.player} - {self.level}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_is_completed = instance.__dict__.get("is_completed")
+        return instance
+
     def save(self, *args, **kwargs):
         # Если поставили is_completed=True, а дату не ставили - ставим текущую дату
         if self.is_completed and self.completed is None:
@@ -113,7 +148,10 @@ class PlayerLevel(Model):
         if self.completed and not self.is_completed:
             self.is_completed = True
 
+        # Призы выдаются только при переходе уровня в завершённый, а не на каждое сохранение
+        self.became_completed = self.is_completed and not self._stored_is_completed
         super().save(*args, **kwargs)
+        self._stored_is_completed = self.is_completed
 
 
 class LevelPrize(Model):
@@ -159,6 +197,7 @@ class PlayerPrize(Model):
     received = DateTimeField(
         verbose_name="Дата получения",
         auto_now_add=True,
+        db_index=True,
     )
 
     class Meta:
@@ -171,3 +210,128 @@ class PlayerPrize(Model):
             f"{self.player.player_id.upper()} получил '{self.prize}' за прохождение уровня '{self.level}'. "
             f"Дата получения приза {self.received.strftime('%Y-%m-%d %H:%M:%S')}"
         )
+
+
+class PendingPrizeAward(Model):
+    """
+    Очередь выдачи призов за завершённые уровни, обрабатывается командой process_prize_awards.
+    """
+
+    player_level = OneToOneField(
+        PlayerLevel,
+        verbose_name="Уровень игрока",
+        on_delete=CASCADE,
+    )
+    created_at = DateTimeField(
+        verbose_name="Дата постановки в очередь",
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = "Приз в очереди на выдачу"
+        verbose_name_plural = "Призы в очереди на выдачу"
+
+    def __str__(self):
+        return str(self.player_level)
+
+
+def export_storage():
+    """
+    Хранилище файлов выгрузок в PRIVATE_ROOT: nginx их не отдаёт, скачать файл можно только через админку.
+    """
+    return FileSystemStorage(location=Path(settings.PRIVATE_ROOT) / "exports")
+
+
+def export_file_name(instance, filename):
+    """
+    Случайное имя файла выгрузки, чтобы его нельзя было подобрать по номеру задачи.
+    """
+    return f"{uuid.uuid4().hex}{Path(filename).suffix}"
+
+
+class ExportJob(Model):
+    """
+    Фоновая выгрузка PlayerLevel в CSV, выполняется командой run_export_jobs.
+    Прогресс сохраняется после каждой пачки, поэтому после падения выгрузка продолжается с last_pk.
+    """
+
+    status = CharField(
+        max_length=20,
+        verbose_name="Статус",
+        choices=ExportJobStatusChoices.choices,
+        default=ExportJobStatusChoices.PENDING,
+    )
+    selection = JSONField(
+        verbose_name="Выборка",
+        help_text='Выбранные PlayerLevel: {"pks": [...]} - отмеченные записи, {"filters": {...}} - фильтры списка, '
+        "пустая - все записи",
+        default=dict,
+        blank=True,
+    )
+    file = FileField(
+        upload_to=export_file_name,
+        storage=export_storage,
+        verbose_name="Файл",
+        **NULLABLE,
+    )
+    rows_total = PositiveIntegerField(
+        verbose_name="Всего строк",
+        default=0,
+    )
+    rows_exported = PositiveIntegerField(
+        verbose_name="Выгружено строк",
+        default=0,
+    )
+    last_pk = BigIntegerField(
+        verbose_name="Последний выгруженный id",
+        default=0,
+    )
+    bytes_written = PositiveBigIntegerField(
+        verbose_name="Записано байт",
+        default=0,
+    )
+    shards = PositiveSmallIntegerField(
+        verbose_name="Процессов выгрузки",
+        default=1,
+    )
+    elapsed = FloatField(
+        verbose_name="Время работы, с",
+        default=0,
+    )
+    changed_since = DateTimeField(
+        verbose_name="Изменения с",
+        help_text="Инкрементальная выгрузка: только записи, изменённые после этой даты",
+        **NULLABLE,
+    )
+    watermark = DateTimeField(
+        verbose_name="Отметка инкрементальной выгрузки",
+        help_text="Следующая инкрементальная выгрузка начнётся с этой даты",
+        **NULLABLE,
+    )
+    error = TextField(
+        verbose_name="Ошибка",
+        blank=True,
+    )
+    created_at = DateTimeField(
+        verbose_name="Дата создания",
+        auto_now_add=True,
+    )
+    updated_at = DateTimeField(
+        verbose_name="Дата обновления",
+        auto_now=True,
+    )
+    finished_at = DateTimeField(
+        verbose_name="Дата завершения",
+        **NULLABLE,
+    )
+
+    class Meta:
+        verbose_name = "Выгрузка CSV"
+        verbose_name_plural = "Выгрузки CSV"
+
+    def __str__(self):
+        return f"Выгрузка №{self.pk} - {self.get_status_display()}"
+
+    @property
+    def rows_per_second(self):
+        return self.rows_exported / self.elapsed if self.elapsed else 0
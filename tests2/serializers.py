@@ -0,0 +1,46 @@
+from rest_framework.serializers import CharField, ListField, ModelSerializer
+
+from tests2.models import PlayerLevel, PlayerPrize
+
+
+class PlayerLevelSerializer(ModelSerializer):
+    """
+    Уровень игрока.
+    """
+
+    player_id = CharField(source="player.player_id", read_only=True)
+    level_title = CharField(source="level.title", read_only=True)
+
+    class Meta:
+        model = PlayerLevel
+        fields = ("id", "player_id", "level_id", "level_title", "is_completed", "completed", "score", "updated_at")
+        read_only_fields = fields
+
+
+class PlayerPrizeSerializer(ModelSerializer):
+    """
+    Приз, полученный игроком за уровень.
+    """
+
+    player_id = CharField(source="player.player_id", read_only=True)
+    prize_title = CharField(source="prize.title", read_only=True)
+    level_title = CharField(source="level.title", read_only=True)
+
+    class Meta:
+        model = PlayerPrize
+        fields = ("id", "player_id", "prize_id", "prize_title", "level_id", "level_title", "received")
+        read_only_fields = fields
+
+
+class PlayerProgressSerializer(ModelSerializer):
+    """
+    Прогресс игрока по уровню с призами, полученными за этот уровень.
+    """
+
+    level_title = CharField(source="level.title", read_only=True)
+    prizes = ListField(child=CharField(), read_only=True)
+
+    class Meta:
+        model = PlayerLevel
+        fields = ("id", "level_id", "level_title", "is_completed", "completed", "score", "prizes")
+        read_only_fields = fields
@@ -1,31 +1,183 @@
-from django.db import transaction
+from contextlib import contextmanager
+from threading import local
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import QuerySet
 from django.utils import timezone
 
-from tests2.models import LevelPrize, PlayerLevel, PlayerPrize
+from conts.metrics import measure
+from tests2.models import LevelPrize, PendingPrizeAward, PlayerLevel, PlayerPrize
+
+PRIZE_AWARD_BATCH_SIZE = 5000
+
+_deferred = local()
+
+
+def _player_levels_condition(player_levels):
+    """
+    Условие на PlayerLevel (алиас pl) по queryset или списку пар (player_id, level_id).
+    Возвращает базу, SQL условия и его параметры; для пустого списка пар - None.
+    """
+    if isinstance(player_levels, QuerySet):
+        subquery, params = player_levels.order_by().values("pk").query.sql_with_params()
+        return player_levels.db, f"pl.id IN ({subquery})", list(params)
+    pairs = list(player_levels)
+    if not pairs:
+        return None
+    player_ids, level_ids = zip(*pairs, strict=True)
+    return (
+        router.db_for_write(PlayerPrize),
+        "(pl.player_id, pl.level_id) IN (SELECT * FROM UNNEST(%s::bigint[], %s::bigint[]))",
+        [list(player_ids), list(level_ids)],
+    )
+
+
+def _insert_prizes_sql(condition):
+    """
+    INSERT ... SELECT недостающих призов за завершённые уровни игроков, отобранные условием на pl.
+    """
+    return f"""
+        INSERT INTO {PlayerPrize._meta.db_table} (player_id, prize_id, level_id, received)
+        SELECT pl.player_id, lp.prize_id, pl.level_id, %s
+        FROM {PlayerLevel._meta.db_table} AS pl
+        JOIN {LevelPrize._meta.db_table} AS lp ON lp.level_id = pl.level_id
+        WHERE pl.is_completed AND {condition}
+        ON CONFLICT (player_id, prize_id, level_id) DO NOTHING
+    """
+
+
+@measure("service", "tests2.assign_prizes")
+def assign_prizes(player_levels):
+    """
+    Выдать все недостающие призы за завершённые уровни одним INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+    player_levels - queryset PlayerLevel или список пар (player_id, level_id).
+    Незавершённые уровни и уже выданные призы пропускаются.
+    Возвращает количество выданных призов.
+    """
+    selection = _player_levels_condition(player_levels)
+    if selection is None:
+        return 0
+    using, condition, params = selection
+    with connections[using].cursor() as cursor:
+        cursor.execute(_insert_prizes_sql(condition), [timezone.now(), *params])
+        return cursor.rowcount
 
 
+@measure("service", "tests2.assign_prizes_for_level")
 def assign_prizes_for_level(player, level):
     """
     Выдать игроку все призы за указанный уровень, если он завершён.
-    Возвращает список новых PlayerPrize.
+    Возвращает количество новых PlayerPrize.
     """
-
-    player_level = PlayerLevel.objects.get(player=player, level=level)
-    if not player_level.is_completed:
+    if not PlayerLevel.objects.filter(player=player, level=level, is_completed=True).exists():
         raise ValueError("Уровень не завершён — призы недоступны.")
+    return assign_prizes([(player.pk, level.pk)])
+
+
+@measure("service", "tests2.enqueue_prize_awards")
+def enqueue_prize_awards(player_levels):
+    """
+    Поставить завершённые уровни в очередь выдачи призов одним INSERT ... SELECT.
+    Используется при массовом импорте: призы выдаёт команда process_prize_awards.
+    Возвращает количество поставленных в очередь уровней.
+    """
+    selection = _player_levels_condition(player_levels)
+    if selection is None:
+        return 0
+    using, condition, params = selection
+    sql = f"""
+        INSERT INTO {PendingPrizeAward._meta.db_table} (player_level_id, created_at)
+        SELECT pl.id, %s FROM {PlayerLevel._meta.db_table} AS pl
+        WHERE pl.is_completed AND {condition}
+        ON CONFLICT (player_level_id) DO NOTHING
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [timezone.now(), *params])
+        return cursor.rowcount
 
-    prizes = LevelPrize.objects.filter(level=level).select_related("prize")
-
-    created_prizes = []
-    with transaction.atomic():
-        for level_prize in prizes:
-            player_prize, created = PlayerPrize.objects.get_or_create(
-                player=player,
-                prize=level_prize.prize,
-                level=level,
-                defaults={"received": timezone.now()},
-            )
-            if created:
-                created_prizes.append(player_prize)
-
-    return created_prizes
+
+@measure("service", "tests2.process_prize_awards")
+def process_prize_awards(batch_size=PRIZE_AWARD_BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    Обработать одну пачку очереди: забрать уровни из очереди и выдать за них призы одним запросом.
+    Занятые другим обработчиком записи пропускаются.
+    Возвращает количество обработанных уровней и выданных призов.
+    """
+    queue_table = PendingPrizeAward._meta.db_table
+    sql = f"""
+        WITH batch AS (
+            DELETE FROM {queue_table}
+            WHERE id IN (SELECT id FROM {queue_table} ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED)
+            RETURNING player_level_id
+        ), inserted AS (
+            {_insert_prizes_sql("pl.id IN (SELECT player_level_id FROM batch)")}
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM batch), (SELECT COUNT(*) FROM inserted)
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [batch_size, timezone.now()])
+        return cursor.fetchone()
+
+
+class PrizeAwardBuffer:
+    """
+    Уровни, завершённые в текущей транзакции. Призы за них выдаются пачками после коммита,
+    либо, внутри defer_prize_awards(), ставятся в очередь.
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.pairs = set()
+        self.queued_pairs = set()
+        self.done = False
+
+    def add(self, pairs):
+        (self.queued_pairs if getattr(_deferred, "enabled", False) else self.pairs).update(pairs)
+
+    def __call__(self):
+        # Буфер зарегистрирован колбэком на каждое добавление, призы выдаёт только первый вызов
+        if self.done:
+            return
+        self.done = True
+        if _buffers().get(self.using) is self:
+            del _buffers()[self.using]
+        for func, pairs in ((assign_prizes, self.pairs), (enqueue_prize_awards, self.queued_pairs)):
+            pairs = list(pairs)
+            for start in range(0, len(pairs), PRIZE_AWARD_BATCH_SIZE):
+                func(pairs[start : start + PRIZE_AWARD_BATCH_SIZE])
+
+
+def _buffers():
+    if not hasattr(_deferred, "buffers"):
+        _deferred.buffers = {}
+    return _deferred.buffers
+
+
+def award_prizes_on_commit(pairs, using=DEFAULT_DB_ALIAS):
+    """
+    Выдать призы за пары (player_id, level_id) после коммита текущей транзакции.
+    Пары всей транзакции собираются в один буфер, вне транзакции призы выдаются сразу.
+    Колбэк буфера регистрируется при каждом вызове, и Django сам снимает колбэки отменённых точек сохранения
+    и транзакций. Пары из отменённой части транзакции остаются в буфере, но призы и очередь
+    берут только уровни, завершённые в базе, поэтому за отменённые завершения ничего не выдаётся.
+    """
+    buffer = _buffers().get(using)
+    if buffer is None:
+        buffer = _buffers()[using] = PrizeAwardBuffer(using)
+    buffer.add(pairs)
+    transaction.on_commit(buffer, using=using)
+
+
+@contextmanager
+def defer_prize_awards():
+    """
+    Внутри блока призы за завершённые уровни не выдаются, а ставятся в очередь process_prize_awards.
+    Для массовых импортов, сохраняющих PlayerLevel по одному.
+    """
+    previous = getattr(_deferred, "enabled", False)
+    _deferred.enabled = True
+    try:
+        yield
+    finally:
+        _deferred.enabled = previous
@@ -1,11 +1,18 @@
+from django.db import DEFAULT_DB_ALIAS
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
-from tests2.models import PlayerLevel
-from tests2.services import assign_prizes_for_level
+from conts.search import create_trigram_indexes
+from tests2.models import Player, PlayerLevel
+from tests2.services import award_prizes_on_commit
 
 
 @receiver(post_save, sender=PlayerLevel)
-def give_prizes_on_completion(sender, instance, created, **kwargs):
-    if instance.completed:
-        assign_prizes_for_level(instance.player, instance.level)
+def give_prizes_on_completion(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw or not instance.became_completed:
+        return
+    award_prizes_on_commit([(instance.player_id, instance.level_id)], using=using)
+
+
+def create_search_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    create_trigram_indexes([(Player, "player_id")], using)
@@ -1 +1,721 @@
-from django.test import TestCase
\ No newline at end of file
+import gzip
+import io
+import json
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.admin import ModelAdmin
+from django.contrib.admin import site as admin_site
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from conts.choices import BulkDeleteJobStatusChoices, ExportJobStatusChoices
+from conts.deletion import bulk_delete, claim_delete_job, count_cascade, queue_delete_job, run_delete_job
+from conts.metrics import render_metrics
+from conts.profiling import PROFILE_DIR, PROFILE_HEADER
+from tests2.exports import (
+    EXPORT_DELTA_OVERLAP,
+    EXPORT_ENGINES,
+    CopyCsvFile,
+    changed_since,
+    choose_encoding,
+    claim_export_job,
+    copy_export_sql,
+    csv_prefetch,
+    iter_csv_copy,
+    queue_delta_export_job,
+    queue_export_job,
+    run_export_job,
+    stream_csv,
+    write_csv,
+    zstandard,
+)
+from tests2.models import ExportJob, Level, LevelPrize, PendingPrizeAward, Player, PlayerLevel, PlayerPrize, Prize
+from tests2.serializers import PlayerProgressSerializer
+from tests2.services import assign_prizes, assign_prizes_for_level
+
+
+class PrizeDataMixin:
+    """
+    Два игрока, два уровня с двумя и одним призом, у первого игрока первый уровень завершён.
+    """
+
+    def setUp(self):
+        self.player, self.other = Player.objects.create(player_id="p1"), Player.objects.create(player_id="p2")
+        self.level, self.next_level = (
+            Level.objects.create(title="1", order=1),
+            Level.objects.create(title="2", order=2),
+        )
+        self.prizes = [Prize.objects.create(title=f"prize{number}") for number in range(3)]
+        LevelPrize.objects.bulk_create(
+            [
+                LevelPrize(level=self.level, prize=self.prizes[0]),
+                LevelPrize(level=self.level, prize=self.prizes[1]),
+                LevelPrize(level=self.next_level, prize=self.prizes[2]),
+            ]
+        )
+        # bulk_create не отправляет post_save, поэтому призы за завершённый уровень не выдаются сами
+        self.completed, self.started, self.other_started = PlayerLevel.objects.bulk_create(
+            [
+                PlayerLevel(player=self.player, level=self.level, is_completed=True),
+                PlayerLevel(player=self.player, level=self.next_level),
+                PlayerLevel(player=self.other, level=self.level),
+            ]
+        )
+
+
+class AssignPrizesTests(PrizeDataMixin, TestCase):
+    """
+    Выдача призов повторно не создаёт призов и пропускает незавершённые уровни.
+    """
+
+    def prizes_of(self, player):
+        return set(PlayerPrize.objects.filter(player=player).values_list("level_id", "prize_id"))
+
+    def test_assign_prizes_is_idempotent(self):
+        self.assertEqual(assign_prizes(PlayerLevel.objects.all()), 2)
+        self.assertEqual(assign_prizes(PlayerLevel.objects.all()), 0)
+        self.assertEqual(assign_prizes([(self.player.pk, self.level.pk)]), 0)
+        self.assertEqual(
+            self.prizes_of(self.player), {(self.level.pk, self.prizes[0].pk), (self.level.pk, self.prizes[1].pk)}
+        )
+        self.assertEqual(self.prizes_of(self.other), set())
+
+    def test_assign_prizes_adds_only_missing(self):
+        PlayerPrize.objects.create(player=self.player, prize=self.prizes[0], level=self.level)
+        self.assertEqual(assign_prizes([(self.player.pk, self.level.pk)]), 1)
+        self.assertEqual(PlayerPrize.objects.filter(player=self.player).count(), 2)
+
+    def test_assign_prizes_for_level_requires_completion(self):
+        with self.assertRaisesMessage(ValueError, "Уровень не завершён"):
+            assign_prizes_for_level(self.player, self.next_level)
+        self.assertEqual(assign_prizes_for_level(self.player, self.level), 2)
+        self.assertEqual(assign_prizes_for_level(self.player, self.level), 0)
+
+    def test_completion_awards_prizes_once_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.started.is_completed = True
+            self.started.save()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.started.score = 10
+            self.started.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.prizes_of(self.player), {(self.next_level.pk, self.prizes[2].pk)})
+
+    def complete(self, player_level):
+        player_level.is_completed = True
+        player_level.save()
+
+    def test_transaction_awards_prizes_in_one_batch(self):
+        with (
+            mock.patch("tests2.services.assign_prizes", wraps=assign_prizes) as assign,
+            self.captureOnCommitCallbacks(execute=True),
+            transaction.atomic(),
+        ):
+            self.complete(self.started)
+            self.complete(self.other_started)
+        assign.assert_called_once()
+        self.assertEqual(self.prizes_of(self.player), {(self.next_level.pk, self.prizes[2].pk)})
+        self.assertEqual(
+            self.prizes_of(self.other), {(self.level.pk, self.prizes[0].pk), (self.level.pk, self.prizes[1].pk)}
+        )
+
+    def test_rolled_back_completion_awards_nothing(self):
+        with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+            try:
+                with transaction.atomic():
+                    self.complete(self.started)
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+
+        # Пара из отменённой точки сохранения осталась в буфере, но уровень в базе не завершён
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.complete(self.other_started)
+        self.assertEqual(self.prizes_of(self.player), set())
+        self.assertEqual(
+            self.prizes_of(self.other), {(self.level.pk, self.prizes[0].pk), (self.level.pk, self.prizes[1].pk)}
+        )
+
+
+class CsvExportTests(PrizeDataMixin, TestCase):
+    """
+    CSV через COPY совпадает побайтно с исходной выгрузкой через csv.writer.
+    """
+
+    expected = (
+        'player_id,level_title,is_completed,prizes\r\np1,1,Да,"prize1, prize0"\r\np1,2,Нет,\r\np2,1,Нет,\r\n'
+    ).encode()
+
+    def setUp(self):
+        super().setUp()
+        # Призы идут в порядке выдачи, а не по названию
+        PlayerPrize.objects.bulk_create(
+            [
+                PlayerPrize(player=self.player, level=self.level, prize=self.prizes[1]),
+                PlayerPrize(player=self.player, level=self.level, prize=self.prizes[0]),
+            ]
+        )
+
+    def baseline(self, queryset):
+        return "".join(csv_prefetch(queryset)).encode()
+
+    def written(self, queryset):
+        file = io.BytesIO()
+        write_csv(queryset, file)
+        return file.getvalue()
+
+    def test_copy_matches_baseline(self):
+        queryset = PlayerLevel.objects.order_by("pk")
+        self.assertEqual(self.baseline(queryset), self.expected)
+        for name, engine in EXPORT_ENGINES.items():
+            with self.subTest(engine=name):
+                self.assertEqual(
+                    b"".join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in engine(queryset)),
+                    self.expected,
+                )
+        self.assertEqual(self.written(queryset), self.expected)
+
+    def test_copy_keeps_quoted_line_breaks_across_chunks(self):
+        Level.objects.filter(pk=self.level.pk).update(title='first "line"\nsecond')
+        Player.objects.filter(pk=self.other.pk).update(player_id="")
+        queryset = PlayerLevel.objects.order_by("pk")
+        self.assertEqual(b"".join(iter_csv_copy(queryset, chunk_bytes=1)), self.baseline(queryset))
+        self.assertEqual(self.written(queryset), self.baseline(queryset))
+
+        # COPY отдаёт строки целиком, поэтому разрезы внутри значения в кавычках проверяются побайтной записью
+        raw = io.BytesIO()
+        with connection.cursor() as cursor:
+            cursor.copy_expert(copy_export_sql(cursor, queryset), raw)
+        file = io.BytesIO()
+        copy_file = CopyCsvFile(file)
+        for byte in raw.getvalue():
+            copy_file.write(bytes([byte]))
+        self.assertEqual(file.getvalue(), self.baseline(queryset))
+
+    def test_fallback_without_postgresql(self):
+        queryset = PlayerLevel.objects.order_by("pk")
+        with mock.patch.object(connection, "vendor", "sqlite"):
+            self.assertEqual(b"".join(chunk.encode() for chunk in stream_csv(queryset)), self.expected)
+            self.assertEqual(self.written(queryset), self.expected)
+
+
+class CompressedExportTests(PrizeDataMixin, TestCase):
+    """
+    Сжатие выгрузки в админке выбирается по Accept-Encoding, а распакованный ответ совпадает с CSV без сжатия.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin"))
+
+    def export(self, action="export_as_csv", **headers):
+        response = self.client.post(
+            reverse("admin:tests2_playerlevel_changelist"),
+            {"action": action, "_selected_action": list(PlayerLevel.objects.values_list("pk", flat=True))},
+            headers=headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_choose_encoding(self):
+        best = "zstd" if zstandard else "gzip"
+        cases = {
+            "": None,
+            "br": None,
+            "gzip": "gzip",
+            "gzip;q=0": None,
+            "gzip;q=0, *": "zstd" if zstandard else None,
+            "gzip, deflate, br, zstd": best,
+            "zstd;q=0, gzip;q=0.5": "gzip",
+            "*": best,
+        }
+        for accept_encoding, encoding in cases.items():
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(choose_encoding(accept_encoding), encoding)
+
+    def test_response_encoding_follows_accept_encoding(self):
+        plain = self.export()
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertIn("Accept-Encoding", plain["Vary"])
+        csv = b"".join(plain.streaming_content)
+        self.assertEqual(csv, "".join(csv_prefetch(PlayerLevel.objects.order_by("pk"))).encode())
+
+        decompress = {"gzip": gzip.decompress}
+        if zstandard:
+            decompress["zstd"] = lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        cases = {"gzip": "gzip", "gzip;q=0": None, "gzip, zstd": "zstd" if zstandard else "gzip"}
+        if zstandard:
+            cases["zstd"] = "zstd"
+        for accept_encoding, encoding in cases.items():
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.export(accept_encoding=accept_encoding)
+                self.assertEqual(response.get("Content-Encoding"), encoding)
+                body = b"".join(response.streaming_content)
+                self.assertEqual(decompress[encoding](body) if encoding else body, csv)
+
+    def test_csv_gz_action_ignores_accept_encoding(self):
+        response = self.export("export_as_csv_gz", accept_encoding="zstd")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(
+            gzip.decompress(b"".join(response.streaming_content)), b"".join(self.export().streaming_content)
+        )
+
+
+class LargeTableAdminTests(PrizeDataMixin, TestCase):
+    """
+    Список уровней игроков в админке не считает COUNT(*) и выполняется за постоянное число запросов.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin"))
+        self.url = reverse("admin:tests2_playerlevel_changelist")
+
+    def test_changelist_uses_estimate_instead_of_count(self):
+        # Сессия, пользователь, EXPLAIN для оценки количества и строки страницы с игроком и уровнем
+        with mock.patch("conts.admin.ESTIMATED_COUNT_THRESHOLD", 0):
+            for count in (5, 50):
+                players = Player.objects.bulk_create(Player(player_id=f"extra{count}_{n}") for n in range(count))
+                PlayerLevel.objects.bulk_create(PlayerLevel(player=player, level=self.level) for player in players)
+                with self.subTest(rows=PlayerLevel.objects.count()), self.assertNumQueries(4) as captured:
+                    self.assertEqual(self.client.get(self.url).status_code, 200)
+                self.assertFalse([query for query in captured if "COUNT(" in query["sql"].upper()])
+
+    def test_small_selection_is_counted_exactly(self):
+        with self.assertNumQueries(5) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["cl"].result_count, 3)
+        self.assertEqual(len([query for query in captured if "COUNT(" in query["sql"].upper()]), 1)
+
+
+class PlayerAdminSearchTests(TestCase):
+    """
+    Быстрый поиск игрока по полному player_id и UUID находит те же строки, что и обычный поиск админки.
+    """
+
+    uuids = ("1b4e28ba-2fa1-11d2-883f-0016d3cca427", "6f1c7a3e-9b2d-4c5e-8f70-a1b2c3d4e5f6")
+
+    def setUp(self):
+        Player.objects.bulk_create(
+            [
+                Player(player_id=f"Alice {self.uuids[0]}"),
+                Player(player_id=f"alice_2 {self.uuids[1]}"),
+                Player(player_id="bob 00000000-0000-4000-8000-000000000000"),
+            ]
+        )
+        self.admin = admin_site._registry[Player]
+        self.request = RequestFactory().get("/")
+
+    def test_fast_path_matches_icontains_search(self):
+        terms = [
+            f"Alice {self.uuids[0]}",
+            f"  aLiCe {self.uuids[0].upper()}  ",
+            f"alice {self.uuids[1]}",
+            self.uuids[1],
+            self.uuids[0].upper(),
+            "7d3c6a2b-0000-4000-8000-000000000000",
+            "ALICE",
+            "",
+        ]
+        for term in terms:
+            with self.subTest(term=term):
+                queryset, _ = self.admin.get_search_results(self.request, Player.objects.all(), term)
+                expected, _ = ModelAdmin.get_search_results(self.admin, self.request, Player.objects.all(), term)
+                self.assertQuerySetEqual(queryset.order_by("pk"), expected.order_by("pk"))
+        self.assertEqual(
+            self.admin.get_search_results(self.request, Player.objects.all(), self.uuids[0].upper())[0]
+            .get()
+            .player_id,
+            f"Alice {self.uuids[0]}",
+        )
+
+
+class MetricsTests(PrizeDataMixin, TestCase):
+    """
+    Middleware записывает гистограммы запросов, потоковые ответы - при закрытии; эндпоинт метрик закрыт.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS_DIR=directory.name, GAME_SERVER_TOKEN="secret")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def sample(self, metric, kind, name):
+        prefix = f'{metric}{{kind="{kind}",name="{name}"}} '
+        for line in render_metrics().splitlines():
+            if line.startswith(prefix):
+                return float(line[len(prefix) :])
+        return 0
+
+    def test_view_is_recorded(self):
+        name = "tests2:player-level-list"
+        before = self.sample("app_duration_seconds_count", "view", name)
+        self.client.get(reverse(name), headers={"authorization": "Bearer secret"})
+        self.assertEqual(self.sample("app_duration_seconds_count", "view", name), before + 1)
+        self.assertGreaterEqual(self.sample("app_db_queries_sum", "view", name), 1)
+
+    def test_streaming_response_is_recorded_when_closed(self):
+        name = "tests2:player-level-list"
+        before = self.sample("app_duration_seconds_count", "view", name)
+        rows = self.sample("app_rows_streamed_sum", "view", name)
+        response = self.client.get(reverse(name), {"format": "ndjson"}, headers={"authorization": "Bearer secret"})
+        self.assertEqual(self.sample("app_duration_seconds_count", "view", name), before)
+        b"".join(response.streaming_content)
+        self.assertEqual(self.sample("app_duration_seconds_count", "view", name), before + 1)
+        self.assertEqual(self.sample("app_rows_streamed_sum", "view", name), rows + 3)
+
+        # Поток, который не начинали читать, замеряется при закрытии ответа
+        response = self.client.get(reverse(name), {"format": "ndjson"}, headers={"authorization": "Bearer secret"})
+        # Как и тестовый клиент, не закрываем подключение к базе внутри транзакции теста
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+        self.assertEqual(self.sample("app_duration_seconds_count", "view", name), before + 2)
+
+    def test_admin_action_is_recorded(self):
+        self.client.force_login(User.objects.create_superuser("admin"))
+        name = "tests2.playerlevel.export_as_csv"
+        before = self.sample("app_duration_seconds_count", "action", name)
+        rows = self.sample("app_rows_streamed_sum", "action", name)
+        response = self.client.post(
+            reverse("admin:tests2_playerlevel_changelist"),
+            {"action": "export_as_csv", "_selected_action": [self.completed.pk]},
+        )
+        b"".join(response.streaming_content)
+        self.assertEqual(self.sample("app_duration_seconds_count", "action", name), before + 1)
+        # Заголовок и одна строка
+        self.assertEqual(self.sample("app_rows_streamed_sum", "action", name), rows + 2)
+
+    @override_settings(METRICS_TOKEN="metrics-secret", METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_metrics_endpoint_access(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # Через nginx: REMOTE_ADDR - адрес nginx, клиент - в X-Real-IP
+        for meta in (
+            {"REMOTE_ADDR": "172.18.0.5"},
+            {"REMOTE_ADDR": "172.18.0.5", "HTTP_X_REAL_IP": "127.0.0.1"},
+            {"HTTP_X_REAL_IP": "203.0.113.7"},
+            {"REMOTE_ADDR": "172.18.0.5", "HTTP_AUTHORIZATION": "Bearer wrong"},
+        ):
+            with self.subTest(meta=meta):
+                self.assertEqual(self.client.get(url, **meta).status_code, 403)
+        response = self.client.get(url, REMOTE_ADDR="172.18.0.5", HTTP_AUTHORIZATION="Bearer metrics-secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE app_duration_seconds histogram", response.content)
+
+    @override_settings(METRICS_TOKEN="", METRICS_ALLOWED_IPS=["127.0.0.1"])
+    def test_empty_token_is_not_accepted(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="172.18.0.5", HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 403)
+
+
+class ProfilingTests(PrizeDataMixin, TestCase):
+    """
+    Потоковый ответ профилируется до закрытия ответа, профиль сохраняется в PRIVATE_ROOT/profiles.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PRIVATE_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.profiles = Path(directory.name) / PROFILE_DIR
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+
+    def test_streaming_response_is_profiled_until_closed(self):
+        response = self.client.get(
+            reverse("tests2:player-level-list"), {"format": "ndjson"}, headers={PROFILE_HEADER: "1"}
+        )
+        name = response[PROFILE_HEADER]
+        self.assertFalse((self.profiles / f"{name}.sql.txt").exists())
+        b"".join(response.streaming_content)
+        self.assertIn("tests2_playerlevel", (self.profiles / f"{name}.sql.txt").read_text())
+        self.assertTrue((self.profiles / f"{name}.folded").exists())
+
+    def test_non_staff_is_not_profiled(self):
+        self.client.force_login(User.objects.create_user("player"))
+        response = self.client.get(reverse("tests2:player-level-list"), headers={PROFILE_HEADER: "1"})
+        self.assertFalse(response.has_header(PROFILE_HEADER))
+
+
+class ExportStorageMixin:
+    """
+    Файлы выгрузок пишутся во временный каталог.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        field = ExportJob._meta.get_field("file")
+        self.addCleanup(setattr, field, "storage", field.storage)
+        field.storage = FileSystemStorage(location=directory.name)
+
+    def expected_csv(self, queryset=None):
+        file = io.BytesIO()
+        write_csv((PlayerLevel.objects.all() if queryset is None else queryset).order_by("pk"), file)
+        return file.getvalue()
+
+
+class ExportJobResumeTests(ExportStorageMixin, PrizeDataMixin, TestCase):
+    """
+    Фоновая выгрузка после падения продолжается с last_pk и даёт тот же файл, что и выгрузка без падения.
+    """
+
+    def setUp(self):
+        super().setUp()
+        players = Player.objects.bulk_create(Player(player_id=f"extra{number}") for number in range(7))
+        PlayerLevel.objects.bulk_create(PlayerLevel(player=player, level=self.level) for player in players)
+
+    def test_resume_after_failure_continues_from_last_pk(self):
+        job = queue_export_job()
+        self.assertEqual(job.rows_total, 10)
+        job = claim_export_job(job.pk)
+        calls = []
+
+        def failing_write_csv(queryset, file, header=True):
+            calls.append(queryset)
+            if len(calls) == 2:
+                # Падение посреди пачки: часть строк уже в файле, но прогресс не сохранён
+                file.write(b"partial,row\n")
+                raise RuntimeError("crash")
+            return write_csv(queryset, file, header)
+
+        with mock.patch("tests2.exports.write_csv", failing_write_csv):
+            job = run_export_job(job, batch_size=4)
+        self.assertEqual(job.status, ExportJobStatusChoices.FAILED)
+        self.assertEqual((job.rows_exported, job.last_pk), (4, PlayerLevel.objects.order_by("pk")[3].pk))
+
+        job.status = ExportJobStatusChoices.RUNNING
+        job = run_export_job(job, batch_size=4)
+        self.assertEqual(job.status, ExportJobStatusChoices.DONE)
+        self.assertEqual(job.rows_exported, 10)
+        with job.file.open("rb") as file:
+            self.assertEqual(file.read(), self.expected_csv())
+
+    def test_missing_file_restarts_export(self):
+        job = claim_export_job(queue_export_job().pk)
+        job = run_export_job(job, batch_size=4)
+        self.assertEqual(job.status, ExportJobStatusChoices.DONE)
+        job.file.delete(save=False)
+        job.status = ExportJobStatusChoices.RUNNING
+        job.last_pk = PlayerLevel.objects.order_by("pk")[3].pk
+        job = run_export_job(job, batch_size=4)
+        self.assertEqual(job.rows_exported, 10)
+        with job.file.open("rb") as file:
+            self.assertEqual(file.read(), self.expected_csv())
+
+
+class DeltaExportTests(ExportStorageMixin, PrizeDataMixin, TestCase):
+    """
+    Инкрементальная выгрузка берёт уровни, изменённые или получившие призы после отметки прошлой выгрузки,
+    с запасом EXPORT_DELTA_OVERLAP.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.watermark = timezone.now() - timedelta(hours=1)
+        PlayerLevel.objects.update(updated_at=self.watermark - timedelta(days=1))
+
+    def finish_previous_export(self):
+        ExportJob.objects.create(status=ExportJobStatusChoices.DONE, watermark=self.watermark)
+
+    def run_delta(self):
+        job = queue_delta_export_job()
+        job = run_export_job(claim_export_job(job.pk))
+        self.assertEqual(job.status, ExportJobStatusChoices.DONE)
+        with job.file.open("rb") as file:
+            return job, file.read()
+
+    def test_first_delta_exports_everything(self):
+        job, content = self.run_delta()
+        self.assertIsNone(job.changed_since)
+        self.assertEqual(content, self.expected_csv())
+
+    def test_rows_updated_after_watermark_are_exported(self):
+        self.finish_previous_export()
+        PlayerLevel.objects.filter(pk=self.started.pk).update(updated_at=self.watermark + timedelta(minutes=1))
+        self.assertEqual(set(changed_since(self.watermark)), {self.started})
+
+        job, content = self.run_delta()
+        self.assertEqual(job.rows_total, 1)
+        self.assertEqual(content, self.expected_csv(PlayerLevel.objects.filter(pk=self.started.pk)))
+        # Отметка новой выгрузки - начало следующей
+        self.assertEqual(queue_delta_export_job().changed_since, job.watermark - EXPORT_DELTA_OVERLAP)
+
+    def test_overlap_reexports_rows_near_watermark(self):
+        self.finish_previous_export()
+        boundary = self.watermark - EXPORT_DELTA_OVERLAP + timedelta(seconds=1)
+        PlayerLevel.objects.filter(pk=self.started.pk).update(updated_at=boundary)
+        PlayerLevel.objects.filter(pk=self.other_started.pk).update(
+            updated_at=self.watermark - EXPORT_DELTA_OVERLAP - timedelta(seconds=1)
+        )
+
+        job, content = self.run_delta()
+        self.assertEqual(job.changed_since, self.watermark - EXPORT_DELTA_OVERLAP)
+        self.assertEqual(content, self.expected_csv(PlayerLevel.objects.filter(pk=self.started.pk)))
+
+    def test_prize_received_after_watermark_pulls_its_level(self):
+        self.finish_previous_export()
+        PlayerPrize.objects.bulk_create(
+            [
+                PlayerPrize(player=self.player, level=self.level, prize=self.prizes[0]),
+                PlayerPrize(player=self.other, level=self.next_level, prize=self.prizes[2]),
+            ]
+        )
+        PlayerPrize.objects.filter(player=self.other).update(received=self.watermark - timedelta(days=1))
+        self.assertEqual(set(changed_since(self.watermark)), {self.completed})
+
+        _, content = self.run_delta()
+        self.assertEqual(content, self.expected_csv(PlayerLevel.objects.filter(pk=self.completed.pk)))
+
+
+class BulkDeleteTests(PrizeDataMixin, TestCase):
+    """
+    Массовое удаление удаляет те же строки, что и каскад Django, и не трогает остальные.
+    """
+
+    def setUp(self):
+        super().setUp()
+        assign_prizes(PlayerLevel.objects.all())
+        PendingPrizeAward.objects.create(player_level=self.completed)
+
+    def django_cascade(self, queryset):
+        with transaction.atomic():
+            deleted = queryset.delete()[1]
+            transaction.set_rollback(True)
+        return Counter({label: count for label, count in deleted.items() if count})
+
+    def assertDeletesLikeDjango(self, queryset):
+        expected = self.django_cascade(queryset)
+        self.assertEqual(count_cascade(queryset), expected)
+        self.assertEqual(bulk_delete(queryset, batch_size=1), expected)
+        return expected
+
+    def test_player_cascade(self):
+        deleted = self.assertDeletesLikeDjango(Player.objects.filter(pk=self.player.pk))
+        self.assertEqual(
+            deleted,
+            {"tests2.Player": 1, "tests2.PlayerLevel": 2, "tests2.PlayerPrize": 2, "tests2.PendingPrizeAward": 1},
+        )
+        self.assertQuerySetEqual(PlayerLevel.objects.all(), [self.other_started])
+        self.assertEqual(LevelPrize.objects.count(), 3)
+
+    def test_level_cascade(self):
+        self.assertDeletesLikeDjango(Level.objects.filter(pk=self.level.pk))
+        self.assertQuerySetEqual(PlayerLevel.objects.all(), [self.started])
+        self.assertQuerySetEqual(LevelPrize.objects.values_list("prize_id", flat=True), [self.prizes[2].pk])
+        self.assertFalse(PlayerPrize.objects.exists())
+        self.assertFalse(PendingPrizeAward.objects.exists())
+
+    def test_prize_cascade(self):
+        self.assertDeletesLikeDjango(Prize.objects.filter(pk__in=[self.prizes[0].pk, self.prizes[2].pk]))
+        self.assertQuerySetEqual(PlayerPrize.objects.values_list("prize_id", flat=True), [self.prizes[1].pk])
+        self.assertEqual(PlayerLevel.objects.count(), 3)
+
+    def test_delete_job_deletes_whole_selection(self):
+        queryset = Player.objects.filter(pk__in=[self.player.pk, self.other.pk])
+        expected = self.django_cascade(queryset)
+        job = claim_delete_job(queue_delete_job(queryset, rows_total=expected.total()).pk)
+        job = run_delete_job(job, batch_size=1)
+        self.assertEqual(job.status, BulkDeleteJobStatusChoices.DONE)
+        self.assertEqual(job.deleted, expected)
+        self.assertFalse(PlayerLevel.objects.exists())
+
+
+@override_settings(GAME_SERVER_TOKEN="secret")
+class KeysetAPIAccessTests(PrizeDataMixin, TestCase):
+    """
+    Списки с курсорной пагинацией доступны только игровым серверам по токену и сотрудникам.
+    """
+
+    urls = ("tests2:player-level-list", "tests2:player-prize-list")
+
+    def get_all(self, **extra):
+        player_progress = reverse("tests2:player-progress", args=[self.player.pk])
+        return [self.client.get(url, **extra) for url in [*map(reverse, self.urls), player_progress]]
+
+    def test_anonymous_is_rejected(self):
+        for response in self.get_all():
+            self.assertEqual(response.status_code, 401)
+        for response in self.get_all(HTTP_AUTHORIZATION="Bearer wrong"):
+            self.assertEqual(response.status_code, 401)
+
+    def test_non_staff_user_is_forbidden(self):
+        self.client.force_login(User.objects.create_user("user"))
+        for response in self.get_all():
+            self.assertEqual(response.status_code, 403)
+
+    def test_game_server_and_staff_are_allowed(self):
+        for response in self.get_all(HTTP_AUTHORIZATION="Bearer secret"):
+            self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        for response in self.get_all():
+            self.assertEqual(response.status_code, 200)
+
+
+@override_settings(GAME_SERVER_TOKEN="secret")
+class PlayerProgressAPITests(PrizeDataMixin, TestCase):
+    """
+    Прогресс игрока: постоянное число запросов на страницу, курсор без пропусков и повторов, NDJSON.
+    """
+
+    def setUp(self):
+        super().setUp()
+        levels = Level.objects.bulk_create(Level(title=f"extra{number}", order=number) for number in range(7))
+        PlayerLevel.objects.bulk_create(
+            PlayerLevel(player=self.player, level=level, is_completed=True) for level in levels
+        )
+        LevelPrize.objects.bulk_create(LevelPrize(level=level, prize=self.prizes[2]) for level in levels)
+        assign_prizes(PlayerLevel.objects.all())
+        self.url = reverse("tests2:player-progress", args=[self.player.pk])
+        self.auth = {"HTTP_AUTHORIZATION": "Bearer secret"}
+
+    def test_queries_per_page_do_not_depend_on_page_size(self):
+        for page_size in (2, 5):
+            # Проверка игрока, страница уровней и призы страницы
+            with self.assertNumQueries(3):
+                response = self.client.get(self.url, {"page_size": page_size}, **self.auth)
+            self.assertEqual(len(response.json()["results"]), page_size)
+
+    def test_next_cursor_neither_skips_nor_repeats_rows(self):
+        ids = []
+        url, params = self.url, {"page_size": 3}
+        while url:
+            page = self.client.get(url, params, **self.auth).json()
+            ids += [row["id"] for row in page["results"]]
+            url, params = page["next"], None
+        expected = list(PlayerLevel.objects.filter(player=self.player).order_by("pk").values_list("pk", flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_prizes_are_grouped_by_level(self):
+        results = self.client.get(self.url, {"page_size": 100}, **self.auth).json()["results"]
+        prizes = {row["level_id"]: row["prizes"] for row in results}
+        self.assertEqual(prizes[self.level.pk], ["prize0", "prize1"])
+        self.assertEqual(prizes[self.next_level.pk], [])
+
+    def test_ndjson_streams_one_object_per_line(self):
+        response = self.client.get(self.url, {"page_size": 4, "format": "ndjson"}, **self.auth)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertIn('rel="next"', response["Link"])
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(set(rows[0]), set(PlayerProgressSerializer.Meta.fields))
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from tests2.apps import Tests2Config
+from tests2.views import PlayerLevelListAPIView, PlayerPrizeListAPIView, PlayerProgressAPIView
+
+app_name = Tests2Config.name
+
+urlpatterns = [
+    path("player-levels/", PlayerLevelListAPIView.as_view(), name="player-level-list"),
+    path("player-prizes/", PlayerPrizeListAPIView.as_view(), name="player-prize-list"),
+    path("players/<int:pk>/progress/", PlayerProgressAPIView.as_view(), name="player-progress"),
+]
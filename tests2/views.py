@@ -1 +1,99 @@
+from collections import defaultdict
 
+from django.http import StreamingHttpResponse
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from rest_framework.exceptions import NotFound
+from rest_framework.generics import ListAPIView
+from rest_framework.settings import api_settings
+
+from conts.authentication import GameServerAuthentication
+from conts.metrics import count_rows
+from conts.pagination import KeysetPagination
+from conts.permissions import IsGameServerOrAdminUser
+from conts.renderers import NDJSONRenderer
+from tests2.models import Player, PlayerLevel, PlayerPrize
+from tests2.serializers import PlayerLevelSerializer, PlayerPrizeSerializer, PlayerProgressSerializer
+
+
+class KeysetListAPIView(ListAPIView):
+    """
+    Список с курсорной пагинацией по id. С ?format=ndjson страница отдаётся потоком,
+    по объекту на строку, а ссылки на соседние страницы - в заголовке Link.
+    Списки отдают данные всех игроков, поэтому доступны только игровым серверам по токену и сотрудникам.
+    """
+
+    authentication_classes = (GameServerAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES)
+    permission_classes = (IsGameServerOrAdminUser,)
+    pagination_class = KeysetPagination
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer)
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != NDJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        serializer = self.get_serializer()
+        response = StreamingHttpResponse(
+            count_rows(NDJSONRenderer.render_line(serializer.to_representation(obj)) for obj in page),
+            content_type=NDJSONRenderer.media_type,
+        )
+        links = [
+            f'<{url}>; rel="{rel}"'
+            for rel, url in (("next", self.paginator.get_next_link()), ("prev", self.paginator.get_previous_link()))
+            if url
+        ]
+        if links:
+            response["Link"] = ", ".join(links)
+        return response
+
+
+@extend_schema(parameters=[OpenApiParameter("is_completed", bool, description="Только завершённые или незавершённые")])
+class PlayerLevelListAPIView(KeysetListAPIView):
+    """
+    Уровни игроков. Фильтр ?is_completed=true|false.
+    """
+
+    serializer_class = PlayerLevelSerializer
+
+    def get_queryset(self):
+        queryset = PlayerLevel.objects.select_related("player", "level")
+        is_completed = self.request.query_params.get("is_completed")
+        if is_completed is not None:
+            queryset = queryset.filter(is_completed=is_completed.lower() in ("1", "true"))
+        return queryset
+
+
+class PlayerPrizeListAPIView(KeysetListAPIView):
+    """
+    Призы, полученные игроками.
+    """
+
+    serializer_class = PlayerPrizeSerializer
+    queryset = PlayerPrize.objects.select_related("player", "prize", "level")
+
+
+class PlayerProgressAPIView(KeysetListAPIView):
+    """
+    Прогресс игрока: его уровни с призами за каждый уровень.
+    Призы всей страницы загружаются одним запросом.
+    """
+
+    serializer_class = PlayerProgressSerializer
+
+    def get_queryset(self):
+        if not Player.objects.filter(pk=self.kwargs["pk"]).exists():
+            raise NotFound("Игрок не найден.")
+        return PlayerLevel.objects.filter(player_id=self.kwargs["pk"]).select_related("level")
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        prizes = defaultdict(list)
+        player_prizes = (
+            PlayerPrize.objects.filter(player_id=self.kwargs["pk"], level_id__in=[pl.level_id for pl in page])
+            .order_by("pk")
+            .values_list("level_id", "prize__title")
+        )
+        for level_id, title in player_prizes:
+            prizes[level_id].append(title)
+        for pl in page:
+            pl.prizes = prizes[pl.level_id]
+        return page